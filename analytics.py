@@ -0,0 +1,237 @@
+from datetime import datetime
+from decimal import Decimal
+from app import db
+from models import Transaction, MonthlySummary, BalanceSnapshot
+from sqlalchemy import func, extract, or_, and_, insert, select, cast, case, Integer
+from utils import LOCAL_TIMEZONE, now_brasilia, brasilia_to_utc, brasilia_offset_transitions
+
+
+# Drift below this is rounding, not an error
+BALANCE_TOLERANCE = Decimal('0.005')
+
+
+def shift_month(year, month, offset):
+    """Return (year, month) moved by offset calendar months"""
+    index = year * 12 + (month - 1) + offset
+    return index // 12, index % 12 + 1
+
+
+def month_starts(count, reference=None):
+    """First day of each of the last `count` local calendar months, oldest first"""
+    reference = reference or now_brasilia()
+    starts = []
+    for offset in range(-(count - 1), 1):
+        year, month = shift_month(reference.year, reference.month, offset)
+        starts.append(datetime(year, month, 1))
+    return starts
+
+
+def month_range(year, month):
+    """Half-open [start, end) datetime range covering a calendar month"""
+    end_year, end_month = shift_month(year, month, 1)
+    return datetime(year, month, 1), datetime(end_year, end_month, 1)
+
+
+def utc_month_range(year, month):
+    """Half-open [start, end) naive UTC range covering a Brasilia local month"""
+    start, end = month_range(year, month)
+    return brasilia_to_utc(start), brasilia_to_utc(end)
+
+
+def local_timestamp(column):
+    """SQL expression converting a naive UTC timestamp column to Brasilia local time"""
+    if db.engine.dialect.name == 'postgresql':
+        return func.timezone(LOCAL_TIMEZONE, func.timezone('UTC', column))
+    # SQLite has no time zone database: pick the offset in effect at each
+    # timestamp from pytz's transitions (newest first, where most rows fall),
+    # so old daylight saving dates bucket like summary_bucket() does
+    periods = brasilia_offset_transitions()
+    offset = case(
+        *[(column >= start, f'{seconds:+d} seconds') for start, seconds in reversed(periods[1:])],
+        else_=f'{periods[0][1]:+d} seconds'
+    )
+    return func.datetime(column, offset)
+
+
+def from_month(year, month):
+    """MonthlySummary filter for buckets at or after (year, month)"""
+    return or_(
+        MonthlySummary.year > year,
+        and_(MonthlySummary.year == year, MonthlySummary.month >= month)
+    )
+
+
+def monthly_series(user_id, months=6, reference=None):
+    """Income, expenses and profit for the last `months` calendar months.
+
+    Reads the MonthlySummary rollup in a single GROUP BY round trip; months
+    without transactions are filled in with zeros. Entries are ordered oldest
+    first.
+    """
+    starts = month_starts(months, reference)
+    end_year, end_month = shift_month(starts[-1].year, starts[-1].month, 1)
+
+    rows = db.session.query(
+        MonthlySummary.year,
+        MonthlySummary.month,
+        MonthlySummary.transaction_type,
+        func.sum(MonthlySummary.total)
+    ).filter(
+        MonthlySummary.user_id == user_id,
+        from_month(starts[0].year, starts[0].month),
+        ~from_month(end_year, end_month)
+    ).group_by(
+        MonthlySummary.year,
+        MonthlySummary.month,
+        MonthlySummary.transaction_type
+    ).all()
+
+    totals = {}
+    for year, month, transaction_type, total in rows:
+        totals[(year, month, transaction_type)] = float(total or 0)
+
+    series = []
+    for start in starts:
+        income = totals.get((start.year, start.month, 'income'), 0.0)
+        expenses = totals.get((start.year, start.month, 'expense'), 0.0)
+        series.append({
+            'year': start.year,
+            'month': start.month,
+            'income': income,
+            'expenses': expenses,
+            'profit': income - expenses
+        })
+    return series
+
+
+def category_totals(user_id, transaction_type='expense'):
+    """All-time totals per category as (category, total) rows"""
+    rows = db.session.query(
+        MonthlySummary.category,
+        func.sum(MonthlySummary.total)
+    ).filter(
+        MonthlySummary.user_id == user_id,
+        MonthlySummary.transaction_type == transaction_type
+    ).group_by(MonthlySummary.category).all()
+    return [(category or None, total) for category, total in rows if total]
+
+
+def ledger_totals(user_id):
+    """All-time (income, expenses) totals for the user, from their BalanceSnapshot"""
+    snapshot = db.session.get(BalanceSnapshot, user_id)
+    if snapshot is None:
+        return 0.0, 0.0
+    return float(snapshot.total_income), float(snapshot.total_expenses)
+
+
+def transaction_count(user_id):
+    """Total number of transactions recorded for the user"""
+    snapshot = db.session.get(BalanceSnapshot, user_id)
+    return snapshot.transaction_count if snapshot else 0
+
+
+def balance_source_query(user_ids=None):
+    """Per-user (income, expenses, count) recomputed from the Transaction table"""
+    query = select(
+        Transaction.user_id,
+        func.coalesce(func.sum(case((Transaction.transaction_type == 'income', Transaction.amount), else_=0)), 0),
+        func.coalesce(func.sum(case((Transaction.transaction_type != 'income', Transaction.amount), else_=0)), 0),
+        func.count(Transaction.id)
+    ).group_by(Transaction.user_id)
+    if user_ids is not None:
+        query = query.where(Transaction.user_id.in_(user_ids))
+    return query
+
+
+def reconcile_balances(user_ids=None, fix=False):
+    """Compare every BalanceSnapshot with totals recomputed from source.
+
+    Returns a list of drift dicts (user_id, field, stored, actual). With
+    fix=True the drifted snapshots are rewritten from source in one commit;
+    writes landing between the read and that commit would be overwritten, so
+    fix in a quiet period.
+    """
+    actual = {
+        user_id: (Decimal(str(income)), Decimal(str(expenses)), count)
+        for user_id, income, expenses, count in db.session.execute(balance_source_query(user_ids))
+    }
+    query = BalanceSnapshot.query
+    if user_ids is not None:
+        query = query.filter(BalanceSnapshot.user_id.in_(user_ids))
+    stored = {s.user_id: s for s in query.all()}
+
+    drift = []
+    for user_id in sorted(set(actual) | set(stored)):
+        income, expenses, count = actual.get(user_id, (Decimal(0), Decimal(0), 0))
+        snapshot = stored.get(user_id)
+        expected = {
+            'total_income': income,
+            'total_expenses': expenses,
+            'balance': income - expenses,
+            'transaction_count': count
+        }
+        user_drift = []
+        for field, value in expected.items():
+            current = getattr(snapshot, field) if snapshot else 0
+            if abs(Decimal(current or 0) - value) > BALANCE_TOLERANCE:
+                user_drift.append({'user_id': user_id, 'field': field, 'stored': current, 'actual': value})
+        drift.extend(user_drift)
+        if fix and user_drift:
+            if snapshot is None:
+                snapshot = BalanceSnapshot(user_id=user_id)
+                db.session.add(snapshot)
+            for field, value in expected.items():
+                setattr(snapshot, field, value)
+            snapshot.updated_at = datetime.utcnow()
+    if fix and drift:
+        db.session.commit()
+    return drift
+
+
+def rebuild_monthly_summaries(user_id=None, since=None):
+    """Recompute MonthlySummary rows from Transaction with one INSERT ... SELECT.
+
+    Rows are bucketed by Brasilia local month in SQL. `since` limits the
+    rebuild to the months from that date onwards; the source rows are then
+    selected with a sargable UTC date range.
+    """
+    delete = MonthlySummary.__table__.delete()
+    source_filter = []
+    if user_id is not None:
+        delete = delete.where(MonthlySummary.user_id == user_id)
+        source_filter.append(Transaction.user_id == user_id)
+    if since is not None:
+        start, _ = utc_month_range(since.year, since.month)
+        delete = delete.where(from_month(since.year, since.month))
+        source_filter.append(Transaction.date >= start)
+
+    local_col = local_timestamp(Transaction.date)
+    year_col = cast(extract('year', local_col), Integer)
+    month_col = cast(extract('month', local_col), Integer)
+    category_col = func.coalesce(Transaction.category, '')
+    source = select(
+        Transaction.user_id,
+        year_col,
+        month_col,
+        Transaction.transaction_type,
+        category_col,
+        func.sum(Transaction.amount),
+        func.count(Transaction.id)
+    ).where(
+        Transaction.date.is_not(None),
+        *source_filter
+    ).group_by(
+        Transaction.user_id,
+        year_col,
+        month_col,
+        Transaction.transaction_type,
+        category_col
+    )
+
+    db.session.execute(delete)
+    result = db.session.execute(insert(MonthlySummary).from_select(
+        ['user_id', 'year', 'month', 'transaction_type', 'category', 'total', 'transaction_count'],
+        source
+    ))
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,141 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from app import db
+from models import User, MonthlySummary
+from analytics import month_starts, from_month, shift_month
+from sqlalchemy import func
+
+# Trailing months each month is compared against
+WINDOW_MONTHS = 6
+# Most recent months checked for anomalies (the current month included)
+RECENT_MONTHS = 2
+# Months with spending required in the window before a category is judged
+MIN_HISTORY = 3
+Z_THRESHOLD = 2.0
+SPIKE_RATIO = 1.5
+# Ignore deviations smaller than this (R$)
+MIN_DEVIATION = 50.0
+
+ANOMALY_CHUNK_SIZE = 1000
+
+
+def load_category_matrix(user_ids, months, reference=None):
+    """Monthly expense totals as a (user, category) x month matrix.
+
+    One GROUP BY over the MonthlySummary rollup for all users; returns the
+    row keys, the month starts (oldest first) and the matrix.
+    """
+    starts = month_starts(months, reference)
+    end_year, end_month = shift_month(starts[-1].year, starts[-1].month, 1)
+    rows = db.session.query(
+        MonthlySummary.user_id,
+        MonthlySummary.category,
+        MonthlySummary.year,
+        MonthlySummary.month,
+        func.sum(MonthlySummary.total)
+    ).filter(
+        MonthlySummary.user_id.in_(user_ids),
+        MonthlySummary.transaction_type == 'expense',
+        from_month(starts[0].year, starts[0].month),
+        ~from_month(end_year, end_month)
+    ).group_by(
+        MonthlySummary.user_id,
+        MonthlySummary.category,
+        MonthlySummary.year,
+        MonthlySummary.month
+    ).all()
+
+    keys = sorted({(user_id, category) for user_id, category, _, _, _ in rows})
+    key_index = {key: index for index, key in enumerate(keys)}
+    month_index = {(start.year, start.month): index for index, start in enumerate(starts)}
+    matrix = np.zeros((len(keys), months))
+    if rows:
+        row_positions = np.fromiter((key_index[(r[0], r[1])] for r in rows), dtype=np.int64, count=len(rows))
+        month_positions = np.fromiter((month_index[(r[2], r[3])] for r in rows), dtype=np.int64, count=len(rows))
+        matrix[row_positions, month_positions] = np.fromiter((float(r[4] or 0) for r in rows),
+                                                             dtype=float, count=len(rows))
+    return keys, starts, matrix
+
+
+def rolling_stats(matrix, window=WINDOW_MONTHS):
+    """Trailing-window statistics for every month after the first `window`.
+
+    Column k of each result describes month k + window, computed over the
+    `window` months before it (the month itself excluded).
+    """
+    windows = sliding_window_view(matrix[:, :-1], window, axis=1)
+    p50, p90 = np.percentile(windows, [50, 90], axis=-1)
+    return {
+        'amount': matrix[:, window:],
+        'mean': windows.mean(axis=-1),
+        'std': windows.std(axis=-1),
+        'p50': p50,
+        'p90': p90,
+        'history': np.count_nonzero(windows, axis=-1)
+    }
+
+
+def flag_anomalies(stats):
+    """Boolean masks (anomaly, spike) over the rolling stats.
+
+    An anomaly is a month more than Z_THRESHOLD standard deviations above the
+    trailing mean and above the trailing 90th percentile. A spike is a jump
+    of SPIKE_RATIO times the mean in an otherwise flat series.
+    """
+    amount, mean, std = stats['amount'], stats['mean'], stats['std']
+    enough = (stats['history'] >= MIN_HISTORY) & (amount - mean >= MIN_DEVIATION)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where(std > 0, (amount - mean) / std, 0.0)
+    anomaly = enough & (z >= Z_THRESHOLD) & (amount > stats['p90'])
+    spike = enough & ~anomaly & (amount >= SPIKE_RATIO * mean)
+    return z, anomaly, spike
+
+
+def detect_anomalies(user_ids, reference=None):
+    """Flag unusual category spending in the most recent months for many users at once.
+
+    Returns {user_id: [flag, ...]} with the newest month first.
+    """
+    months = WINDOW_MONTHS + RECENT_MONTHS
+    keys, starts, matrix = load_category_matrix(user_ids, months, reference)
+    results = {user_id: [] for user_id in user_ids}
+    if not keys:
+        return results
+
+    stats = rolling_stats(matrix)
+    z, anomaly, spike = flag_anomalies(stats)
+    row_indexes, columns = np.nonzero(anomaly | spike)
+    for row, column in sorted(zip(row_indexes.tolist(), columns.tolist()), key=lambda item: -item[1]):
+        user_id, category = keys[row]
+        start = starts[column + WINDOW_MONTHS]
+        results[user_id].append({
+            'category': category or None,
+            'year': start.year,
+            'month': start.month,
+            'kind': 'anomaly' if anomaly[row, column] else 'spike',
+            'amount': round(float(stats['amount'][row, column]), 2),
+            'mean': round(float(stats['mean'][row, column]), 2),
+            'std': round(float(stats['std'][row, column]), 2),
+            'p50': round(float(stats['p50'][row, column]), 2),
+            'p90': round(float(stats['p90'][row, column]), 2),
+            'zscore': round(float(z[row, column]), 2)
+        })
+    return results
+
+
+def category_anomalies(user_id):
+    """Anomaly flags for one user"""
+    return detect_anomalies([user_id])[user_id]
+
+
+def iter_all_anomalies(chunk_size=ANOMALY_CHUNK_SIZE):
+    """Yield (user, flags) for every user, chunk_size users per query"""
+    last_id = 0
+    while True:
+        users = User.query.filter(User.id > last_id).order_by(User.id).limit(chunk_size).all()
+        if not users:
+            return
+        results = detect_anomalies([user.id for user in users])
+        for user in users:
+            yield user, results[user.id]
+        last_id = users[-1].id
@@ -0,0 +1,398 @@
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from functools import wraps
+from flask import Blueprint, request, jsonify, current_app, g
+from flask_login import login_required, current_user
+from sqlalchemy import select, or_, and_
+from app import db
+from models import Transaction, Account, ApiToken
+from importer import build_transaction_row, insert_transactions, StatementImportError, AMOUNT_LIMIT
+from financial import encode_cursor, decode_cursor
+from quota import reserve_transactions
+from user_cache import load_user_cached
+from utils import utc_to_brasilia, brasilia_to_utc
+
+api_bp = Blueprint('api', __name__)
+
+# Columns a client may ask for with ?fields=; id is always returned
+TRANSACTION_FIELDS = {
+    'id': Transaction.id,
+    'description': Transaction.description,
+    'amount': Transaction.amount,
+    'transaction_type': Transaction.transaction_type,
+    'category': Transaction.category,
+    'date': Transaction.date,
+    'created_at': Transaction.created_at,
+    'is_recurring': Transaction.is_recurring,
+    'recurrence_type': Transaction.recurrence_type,
+    'recurrence_parent_id': Transaction.recurrence_parent_id,
+    'account_id': Transaction.account_id,
+}
+
+ACCOUNT_FIELDS = {
+    'id': Account.id,
+    'name': Account.name,
+    'account_type': Account.account_type,
+    'amount': Account.amount,
+    'due_date': Account.due_date,
+    'status': Account.status,
+    'created_at': Account.created_at,
+}
+
+ACCOUNT_TYPES = ('payable', 'receivable', 'bank')
+ACCOUNT_STATUSES = ('pending', 'paid', 'overdue')
+
+# Don't write last_used_at on every request
+TOKEN_TOUCH_INTERVAL = timedelta(minutes=5)
+
+
+class ApiError(Exception):
+    """Rendered as a JSON error response with the given status"""
+
+    def __init__(self, message, status=400, details=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.details = details
+
+
+@api_bp.errorhandler(ApiError)
+def handle_api_error(error):
+    body = {'error': error.message}
+    if error.details:
+        body['details'] = error.details
+    return jsonify(body), error.status
+
+
+def api_token_required(f):
+    """Authenticate the request with an `Authorization: Bearer <token>` header"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        scheme, _, secret = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not secret:
+            raise ApiError('Token de acesso ausente.', 401)
+        token = ApiToken.query.filter_by(token_hash=ApiToken.hash_token(secret.strip())).first()
+        if token is None or token.revoked_at is not None:
+            raise ApiError('Token de acesso inválido.', 401)
+        user = load_user_cached(token.user_id)
+        if user is None or not user.get_plan_features().get('api'):
+            raise ApiError('Seu plano não inclui acesso à API.', 403)
+        # The plan stays on the user after it lapses, so check it is still paid for
+        if not user.is_subscription_active():
+            raise ApiError('Esta funcionalidade requer uma assinatura ativa.', 403)
+
+        now = datetime.utcnow()
+        if token.last_used_at is None or now - token.last_used_at > TOKEN_TOUCH_INTERVAL:
+            token.last_used_at = now
+            db.session.commit()
+        g.api_user = user
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return utc_to_brasilia(value).isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _selected_fields(available):
+    """Columns named in ?fields=a,b (all columns when absent); id always comes first"""
+    names = [name.strip() for name in request.args.get('fields', '').split(',') if name.strip()]
+    if not names:
+        return dict(available)
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ApiError('Campos desconhecidos.', details={'fields': unknown})
+    return {'id': available['id'], **{name: available[name] for name in names}}
+
+
+def _page_size():
+    try:
+        limit = int(request.args.get('limit', current_app.config['API_PAGE_SIZE']))
+    except ValueError:
+        raise ApiError('Parâmetro limit inválido.')
+    return max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+
+
+def _requested_ids():
+    """Ids from ?ids=1,2,3, or None when the parameter is absent"""
+    raw = request.args.get('ids')
+    if raw is None:
+        return None
+    try:
+        ids = list(dict.fromkeys(int(value) for value in raw.split(',') if value.strip()))
+    except ValueError:
+        raise ApiError('Parâmetro ids inválido.')
+    if len(ids) > current_app.config['API_MAX_PAGE_SIZE']:
+        raise ApiError(f"No máximo {current_app.config['API_MAX_PAGE_SIZE']} ids por requisição.")
+    return ids
+
+
+def _serialize(rows, fields):
+    return [{name: _json_value(value) for name, value in zip(fields, row)} for row in rows]
+
+
+def _fetch_by_ids(model, fields, ids):
+    """Bulk fetch in one IN query, in the requested order; unknown ids are reported"""
+    rows = db.session.execute(
+        select(*fields.values()).where(model.user_id == g.api_user.id, model.id.in_(ids))
+    ).all() if ids else []
+    by_id = {row.id: row for row in rows}
+    return jsonify({
+        'data': _serialize([by_id[item_id] for item_id in ids if item_id in by_id], fields),
+        'missing': [item_id for item_id in ids if item_id not in by_id]
+    })
+
+
+def _bulk_payload(key):
+    """Accept a single object, a list, or {key: [...]}; returns (items, single)"""
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict) and key in payload:
+        payload = payload[key]
+    if isinstance(payload, dict):
+        return [payload], True
+    if not isinstance(payload, list) or not payload:
+        raise ApiError('Corpo da requisição deve ser um objeto JSON ou uma lista de objetos.')
+    limit = current_app.config['API_BULK_LIMIT']
+    if len(payload) > limit:
+        raise ApiError(f'No máximo {limit} itens por requisição.', 413)
+    return payload, False
+
+
+def _parse_local_datetime(value):
+    """ISO date or datetime in Brasilia local time (aware values are honoured)"""
+    if not isinstance(value, str):
+        raise ValueError
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = utc_to_brasilia(parsed).replace(tzinfo=None)
+    return parsed
+
+
+def _parse_decimal(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError
+    try:
+        amount = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError
+    if not amount.is_finite() or abs(amount) >= AMOUNT_LIMIT:
+        raise ValueError
+    return amount
+
+
+def _validate_items(items, parse_item):
+    """Parse every item; collect per-index errors so nothing is written on failure"""
+    rows, errors = [], []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({'index': index, 'error': 'Item deve ser um objeto JSON.'})
+            continue
+        try:
+            rows.append(parse_item(item))
+        except (StatementImportError, ValueError) as e:
+            errors.append({'index': index, 'error': str(e) or 'Valor inválido.'})
+    if errors:
+        raise ApiError('Dados inválidos.', 422, errors)
+    return rows
+
+
+def _transaction_row(item):
+    try:
+        amount = _parse_decimal(item.get('amount'))
+    except ValueError:
+        raise ValueError('Campo amount inválido.')
+    if amount < 0 and item.get('transaction_type'):
+        raise ValueError('Use valores positivos com transaction_type.')
+    try:
+        date = _parse_local_datetime(item['date']) if item.get('date') else None
+    except ValueError:
+        raise ValueError('Campo date inválido.')
+    if date is None:
+        date = utc_to_brasilia(datetime.utcnow()).replace(tzinfo=None)
+    if not item.get('description'):
+        raise ValueError('Campo description é obrigatório.')
+
+    row = build_transaction_row(date, str(item['description']), amount,
+                                item.get('transaction_type'), item.get('category'))
+    recurrence_type = item.get('recurrence_type')
+    if recurrence_type is not None and recurrence_type not in ('weekly', 'monthly', 'yearly'):
+        raise ValueError('Campo recurrence_type inválido.')
+    row['is_recurring'] = bool(item.get('is_recurring') and recurrence_type)
+    row['recurrence_type'] = recurrence_type if row['is_recurring'] else None
+    return row
+
+
+def _account_row(item):
+    if not item.get('name'):
+        raise ValueError('Campo name é obrigatório.')
+    if item.get('account_type') not in ACCOUNT_TYPES:
+        raise ValueError('Campo account_type inválido.')
+    status = item.get('status', 'pending')
+    if status not in ACCOUNT_STATUSES:
+        raise ValueError('Campo status inválido.')
+    try:
+        amount = _parse_decimal(item.get('amount', 0))
+    except ValueError:
+        raise ValueError('Campo amount inválido.')
+    try:
+        due_date = brasilia_to_utc(_parse_local_datetime(item['due_date'])) if item.get('due_date') else None
+    except ValueError:
+        raise ValueError('Campo due_date inválido.')
+    return {
+        'name': str(item['name']).strip()[:100],
+        'account_type': item['account_type'],
+        'amount': abs(amount),
+        'due_date': due_date,
+        'status': status,
+    }
+
+
+@api_bp.route('/transactions', methods=['GET'])
+@api_token_required
+def list_transactions():
+    """Ledger newest first with keyset pagination, or a bulk fetch with ?ids="""
+    fields = _selected_fields(TRANSACTION_FIELDS)
+    ids = _requested_ids()
+    if ids is not None:
+        return _fetch_by_ids(Transaction, fields, ids)
+
+    page_size = _page_size()
+    columns = {**fields, 'date': Transaction.date}
+    query = select(*columns.values()).where(
+        Transaction.user_id == g.api_user.id,
+        Transaction.date.is_not(None)
+    )
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            cursor_date, cursor_id = decode_cursor(cursor)
+        except ValueError:
+            raise ApiError('Cursor inválido.')
+        query = query.where(or_(
+            Transaction.date < cursor_date,
+            and_(Transaction.date == cursor_date, Transaction.id < cursor_id)
+        ))
+    # Fetch one extra row to know whether another page exists
+    rows = db.session.execute(
+        query.order_by(Transaction.date.desc(), Transaction.id.desc()).limit(page_size + 1)
+    ).all()
+    page = rows[:page_size]
+    return jsonify({
+        'data': _serialize(page, fields),
+        'next_cursor': encode_cursor(page[-1]) if len(rows) > page_size else None
+    })
+
+
+@api_bp.route('/transactions/<int:transaction_id>', methods=['GET'])
+@api_token_required
+def get_transaction(transaction_id):
+    fields = _selected_fields(TRANSACTION_FIELDS)
+    row = db.session.execute(
+        select(*fields.values()).where(Transaction.user_id == g.api_user.id, Transaction.id == transaction_id)
+    ).first()
+    if row is None:
+        raise ApiError('Transação não encontrada.', 404)
+    return jsonify({'data': _serialize([row], fields)[0]})
+
+
+@api_bp.route('/transactions', methods=['POST'])
+@api_token_required
+def create_transactions():
+    """Create up to API_BULK_LIMIT transactions in one executemany and one commit.
+
+    The request is all-or-nothing: any invalid item rejects the whole batch
+    with per-index errors.
+    """
+    items, single = _bulk_payload('transactions')
+    rows = _validate_items(items, _transaction_row)
+
+    user = g.api_user
+    limit = user.get_plan_features()['transactions_limit']
+    try:
+        if not reserve_transactions(db.session.connection(), user.id, len(rows), limit):
+            raise ApiError(f'A requisição excede o limite mensal de transações do seu plano ({limit}).', 403)
+        ids = insert_transactions(user, rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    if single:
+        return jsonify({'data': {'id': ids[0]}}), 201
+    return jsonify({'data': [{'id': item_id} for item_id in ids], 'count': len(ids)}), 201
+
+
+@api_bp.route('/accounts', methods=['GET'])
+@api_token_required
+def list_accounts():
+    """Accounts payable/receivable by id with keyset pagination, or a bulk fetch with ?ids="""
+    fields = _selected_fields(ACCOUNT_FIELDS)
+    ids = _requested_ids()
+    if ids is not None:
+        return _fetch_by_ids(Account, fields, ids)
+
+    page_size = _page_size()
+    query = select(*fields.values()).where(Account.user_id == g.api_user.id)
+    status = request.args.get('status')
+    if status:
+        query = query.where(Account.status == status)
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            query = query.where(Account.id > int(cursor))
+        except ValueError:
+            raise ApiError('Cursor inválido.')
+    rows = db.session.execute(query.order_by(Account.id).limit(page_size + 1)).all()
+    page = rows[:page_size]
+    return jsonify({
+        'data': _serialize(page, fields),
+        'next_cursor': str(page[-1].id) if len(rows) > page_size else None
+    })
+
+
+@api_bp.route('/accounts', methods=['POST'])
+@api_token_required
+def create_accounts():
+    """Create up to API_BULK_LIMIT accounts in one flush and one commit"""
+    items, single = _bulk_payload('accounts')
+    rows = _validate_items(items, _account_row)
+    accounts = [Account(user_id=g.api_user.id, **row) for row in rows]
+    db.session.add_all(accounts)
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    if single:
+        return jsonify({'data': {'id': accounts[0].id}}), 201
+    return jsonify({'data': [{'id': account.id} for account in accounts], 'count': len(accounts)}), 201
+
+
+@api_bp.route('/tokens', methods=['POST'])
+@login_required
+def create_token():
+    """Issue a token for the logged-in user; the secret is only returned here"""
+    if not current_user.get_plan_features().get('api'):
+        raise ApiError('Seu plano não inclui acesso à API.', 403)
+    payload = request.get_json(silent=True)
+    if payload is None:
+        raise ApiError('Corpo da requisição deve ser JSON.')
+    name = str(payload.get('name') or 'Token de API').strip()[:100]
+    token, secret = ApiToken.issue(current_user, name)
+    db.session.commit()
+    return jsonify({'data': {'id': token.id, 'name': token.name, 'prefix': token.prefix, 'token': secret}}), 201
+
+
+@api_bp.route('/tokens/<int:token_id>', methods=['DELETE'])
+@login_required
+def revoke_token(token_id):
+    token = ApiToken.query.filter_by(id=token_id, user_id=current_user.id).first()
+    if token is None:
+        raise ApiError('Token não encontrado.', 404)
+    if token.revoked_at is None:
+        token.revoked_at = datetime.utcnow()
+        db.session.commit()
+    return '', 204
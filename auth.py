@@ -1,12 +1,28 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, make_response
 from flask_login import login_user, logout_user, login_required, current_user
 from urllib.parse import urlparse
 from models import User
 from forms import LoginForm, RegistrationForm, ForgotPasswordForm
 from app import db
+from passwords import PasswordHasherBusy
+from ratelimit import throttle
 
 auth_bp = Blueprint('auth', __name__)
 
+def unavailable(template, form, message, status, retry_after):
+    """Re-render an auth form with an error, status and Retry-After header"""
+    flash(message, 'error')
+    response = make_response(render_template(template, form=form), status)
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def too_many_attempts(template, form, retry_after):
+    return unavailable(template, form, 'Muitas tentativas. Aguarde alguns instantes e tente novamente.',
+                       429, retry_after)
+
+def hashing_busy(template, form):
+    return unavailable(template, form, 'O servidor está ocupado. Tente novamente em instantes.', 503, 1)
+
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
@@ -14,8 +30,20 @@ def login():
     
     form = LoginForm()
     if form.validate_on_submit():
+        retry_after = throttle('login', ip=request.remote_addr, email=form.email.data)
+        if retry_after:
+            return too_many_attempts('auth/login.html', form, retry_after)
+        
         user = User.query.filter_by(email=form.email.data).first()
-        if user and user.check_password(form.password.data):
+        try:
+            valid = user is not None and user.check_password(form.password.data)
+            if valid and user.password_needs_rehash():
+                # Hash cost changed since this password was stored
+                user.set_password(form.password.data)
+                db.session.commit()
+        except PasswordHasherBusy:
+            return hashing_busy('auth/login.html', form)
+        if valid:
             login_user(user, remember=form.remember_me.data)
             next_page = request.args.get('next')
             if not next_page or urlparse(next_page).netloc != '':
@@ -32,6 +60,10 @@ def register():
     
     form = RegistrationForm()
     if form.validate_on_submit():
+        retry_after = throttle('login', ip=request.remote_addr)
+        if retry_after:
+            return too_many_attempts('auth/register.html', form, retry_after)
+        
         # Check if user already exists
         if User.query.filter_by(email=form.email.data).first():
             flash('Este email já está cadastrado.', 'error')
@@ -48,7 +80,10 @@ def register():
             full_name=form.full_name.data,
             phone=form.phone.data
         )
-        user.set_password(form.password.data)
+        try:
+            user.set_password(form.password.data)
+        except PasswordHasherBusy:
+            return hashing_busy('auth/register.html', form)
         
         db.session.add(user)
         db.session.commit()
@@ -63,6 +98,10 @@ def register():
 def forgot_password():
     form = ForgotPasswordForm()
     if form.validate_on_submit():
+        retry_after = throttle('login', ip=request.remote_addr, email=form.email.data)
+        if retry_after:
+            return too_many_attempts('auth/forgot_password.html', form, retry_after)
+        
         user = User.query.filter_by(email=form.email.data).first()
         if user:
             # In a real application, you would send an email here
@@ -0,0 +1,157 @@
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request, session, make_response
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+from utils import now_brasilia, brasilia_to_utc
+
+
+class MemoryCache:
+    """In-process LRU cache with per-entry TTL"""
+
+    def __init__(self, max_entries=1024, default_ttl=300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (ttl or self.default_ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisCache:
+    """Cache stored in a Redis-compatible server (Redis, Valkey, KeyDB...)"""
+
+    def __init__(self, url, default_ttl=300, prefix='fi:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('CACHE_BACKEND=redis requires the "redis" package to be installed.')
+        self.client = redis.Redis.from_url(url)
+        self.default_ttl = default_ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=ttl or self.default_ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+def init_cache(app):
+    """Configure the cache backend from CACHE_* settings"""
+    app.config.setdefault('CACHE_BACKEND', os.environ.get('CACHE_BACKEND', 'memory'))
+    app.config.setdefault('CACHE_REDIS_URL', os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'))
+    app.config.setdefault('CACHE_DEFAULT_TTL', int(os.environ.get('CACHE_DEFAULT_TTL', 300)))
+    app.config.setdefault('CACHE_MAX_ENTRIES', int(os.environ.get('CACHE_MAX_ENTRIES', 2048)))
+
+    if app.config['CACHE_BACKEND'] == 'redis':
+        backend = RedisCache(app.config['CACHE_REDIS_URL'], app.config['CACHE_DEFAULT_TTL'])
+    else:
+        backend = MemoryCache(app.config['CACHE_MAX_ENTRIES'], app.config['CACHE_DEFAULT_TTL'])
+    app.extensions['cache'] = backend
+    return backend
+
+
+def get_cache():
+    return current_app.extensions['cache']
+
+
+def user_cache_key(user, name):
+    """Cache key scoped to the user's current data version"""
+    return f'user:{user.id}:v{user.data_version or 0}:{name}'
+
+
+def cached_for_user(user, name, builder, ttl=None):
+    """Return the cached value for (user, data version, name), building it on a miss.
+
+    Any write to the user's financial data bumps User.data_version, so stale
+    entries are never read again and simply age out of the cache.
+    """
+    cache = get_cache()
+    key = user_cache_key(user, name)
+    value = cache.get(key)
+    if value is None:
+        value = builder()
+        cache.set(key, value, ttl)
+    return value
+
+
+def user_data_etag(user, name):
+    """ETag for a response derived only from the user's data, plan and the current local day"""
+    today = now_brasilia()
+    return (f'{user.id}-{user.data_version or 0}-{name}-'
+            f'{user.subscription_plan}-{user.subscription_status}-{today:%Y%m%d}')
+
+
+def user_data_last_modified(user):
+    """Last-Modified for user data responses; never earlier than the start of the local day"""
+    today = brasilia_to_utc(now_brasilia().replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None))
+    updated_at = user.data_updated_at or user.created_at or today
+    return max(updated_at, today).replace(microsecond=0)
+
+
+def conditional_user_response(name):
+    """Serve ETag/Last-Modified and answer 304 before running the view.
+
+    The view only runs (and queries the database) when the client's copy is
+    out of date. Requests with pending flash messages always get a full
+    response so the messages are rendered and consumed.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if '_flashes' in session:
+                return f(*args, **kwargs)
+
+            etag = user_data_etag(current_user, name)
+            last_modified = user_data_last_modified(current_user)
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.last_modified = last_modified
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
@@ -0,0 +1,255 @@
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create the schema on an empty database, or migrate an existing one to the latest revision"""
+    from flask_migrate import upgrade, stamp
+    from sqlalchemy import inspect
+    from app import db
+    import models  # noqa: F401 - registers every table on db.metadata
+
+    if inspect(db.engine).has_table('user'):
+        upgrade()
+        click.echo('Database migrated to the latest revision.')
+    else:
+        db.create_all()
+        stamp()
+        click.echo('Database schema created.')
+
+
+@click.command('rebuild-summaries')
+@click.option('--user-id', type=int, default=None, help='Rebuild only this user (default: all users).')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m']), default=None,
+              help='Rebuild only months from YYYY-MM onwards.')
+@with_appcontext
+def rebuild_summaries_command(user_id, since):
+    """Rebuild the MonthlySummary rollup from the Transaction table"""
+    from analytics import rebuild_monthly_summaries
+    rows = rebuild_monthly_summaries(user_id, since)
+    click.echo(f'{rows} monthly summary rows rebuilt.')
+
+
+@click.command('reconcile-balances')
+@click.option('--user-id', type=int, default=None, help='Check only this user (default: all users).')
+@click.option('--fix', is_flag=True, help='Rewrite drifted snapshots from the Transaction table.')
+@with_appcontext
+def reconcile_balances_command(user_id, fix):
+    """Compare balance snapshots with the ledger and report drift (run periodically)"""
+    from analytics import reconcile_balances
+
+    drift = reconcile_balances([user_id] if user_id is not None else None, fix)
+    for item in drift:
+        click.echo(f"user {item['user_id']}: {item['field']} stored={item['stored']} actual={item['actual']}")
+    users = len({item['user_id'] for item in drift})
+    if not drift:
+        click.echo('All balance snapshots match the ledger.')
+    elif fix:
+        click.echo(f'{users} snapshots rewritten.')
+    else:
+        raise click.ClickException(f'{users} users with drifted balance snapshots.')
+
+
+def ledger_queries(user_id):
+    """The main ledger queries, by name, as explain-queries checks them"""
+    from sqlalchemy import select, func
+    from models import Transaction, Account
+    from analytics import utc_month_range
+    from utils import now_brasilia
+
+    today = now_brasilia()
+    start, end = utc_month_range(today.year, today.month)
+    return {
+        'recent transactions': select(Transaction).where(
+            Transaction.user_id == user_id
+        ).order_by(Transaction.date.desc()).limit(5),
+        'monthly income': select(func.sum(Transaction.amount)).where(
+            Transaction.user_id == user_id,
+            Transaction.transaction_type == 'income',
+            Transaction.date >= start,
+            Transaction.date < end
+        ),
+        'pending payables': select(func.sum(Account.amount)).where(
+            Account.user_id == user_id,
+            Account.account_type == 'payable',
+            Account.status == 'pending'
+        ),
+    }
+
+
+def explain(query):
+    """The database's plan for a query, one line per plan row"""
+    from app import db
+
+    dialect = db.engine.dialect
+    prefix = 'EXPLAIN QUERY PLAN' if dialect.name == 'sqlite' else 'EXPLAIN'
+    sql = str(query.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    return [' '.join(str(value) for value in row) for row in db.session.execute(db.text(f'{prefix} {sql}'))]
+
+
+@click.command('explain-queries')
+@click.option('--user-id', type=int, default=1, help='User id to plug into the queries.')
+@with_appcontext
+def explain_queries_command(user_id):
+    """Print the database query plans for the main ledger queries"""
+    for name, query in ledger_queries(user_id).items():
+        click.echo(f'-- {name}')
+        for line in explain(query):
+            click.echo('   ' + line)
+
+
+@click.command('import-statement')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user-id', type=int, required=True, help='Owner of the imported transactions.')
+@click.option('--batch-size', type=int, default=5000, show_default=True)
+@with_appcontext
+def import_statement_command(path, user_id, batch_size):
+    """Import a CSV or OFX bank statement for a user"""
+    from app import db
+    from models import User
+    from importer import iter_statement_rows, import_transactions, StatementImportError
+
+    user = db.session.get(User, user_id)
+    if user is None:
+        raise click.ClickException(f'User {user_id} not found.')
+    with open(path, 'rb') as stream:
+        try:
+            imported = import_transactions(user, iter_statement_rows(stream, path), batch_size)
+        except StatementImportError as e:
+            raise click.ClickException(str(e))
+    click.echo(f'{imported} transactions imported.')
+
+
+@click.command('materialize-recurring')
+@with_appcontext
+def materialize_recurring_command():
+    """Create the due occurrences of recurring transactions (run from cron)"""
+    from recurrence import materialize_recurring
+    created = materialize_recurring()
+    click.echo(f'{created} recurring transactions created.')
+
+
+@click.command('sweep-overdue')
+@with_appcontext
+def sweep_overdue_command():
+    """Mark pending accounts past their due date as overdue (run from cron)"""
+    from overdue import mark_overdue_accounts
+    changed = mark_overdue_accounts()
+    click.echo(f'{changed} accounts marked overdue.')
+
+
+# Results warmed by the nightly jobs outlive the cache's default TTL until the next run
+WARM_CACHE_TTL = 24 * 60 * 60
+
+
+def shared_cache():
+    """The cache to warm from a CLI job, or None when it would die with this process"""
+    from flask import current_app
+    from cache import get_cache
+
+    if current_app.config['CACHE_BACKEND'] != 'redis':
+        click.echo('Warning: CACHE_BACKEND is not redis; results are not cached, '
+                   'as the memory cache is local to this process.', err=True)
+        return None
+    return get_cache()
+
+
+@click.command('forecast-all')
+@click.option('--days', type=click.Choice(['30', '60', '90']), default='90', show_default=True)
+@with_appcontext
+def forecast_all_command(days):
+    """Project every user's cash flow (run nightly).
+
+    With CACHE_BACKEND=redis the projections also warm the forecast cache
+    the web workers read.
+    """
+    from cache import user_cache_key
+    from forecasting import iter_all_forecasts
+    from utils import now_brasilia
+
+    days = int(days)
+    today = now_brasilia()
+    cache = shared_cache()
+    total = negative = 0
+    for user, payload in iter_all_forecasts(days):
+        if cache is not None:
+            cache.set(user_cache_key(user, f'forecast:{days}:{today:%Y-%m-%d}'), payload, WARM_CACHE_TTL)
+        total += 1
+        if payload['lowest']['balance'] < 0:
+            negative += 1
+    click.echo(f'{total} forecasts computed; {negative} users projected below zero.')
+
+
+@click.command('detect-anomalies')
+@with_appcontext
+def detect_anomalies_command():
+    """Flag unusual category spending for every user (run nightly).
+
+    With CACHE_BACKEND=redis the results also warm the anomalies cache the
+    reports page reads.
+    """
+    from cache import user_cache_key
+    from anomalies import iter_all_anomalies
+    from utils import now_brasilia
+
+    today = now_brasilia()
+    cache = shared_cache()
+    users = flagged = 0
+    for user, anomalies in iter_all_anomalies():
+        if cache is not None:
+            cache.set(user_cache_key(user, f'anomalies:{today:%Y-%m}'), anomalies, WARM_CACHE_TTL)
+        users += 1
+        flagged += bool(anomalies)
+    click.echo(f'{users} users analysed; {flagged} with unusual spending.')
+
+
+@click.command('create-api-token')
+@click.option('--user-id', type=int, required=True, help='Owner of the token.')
+@click.option('--name', default='CLI', show_default=True, help='Label shown in the settings page.')
+@with_appcontext
+def create_api_token_command(user_id, name):
+    """Issue a JSON API token for a user and print it once"""
+    from app import db
+    from models import User, ApiToken
+
+    user = db.session.get(User, user_id)
+    if user is None:
+        raise click.ClickException(f'User {user_id} not found.')
+    token, secret = ApiToken.issue(user, name)
+    db.session.commit()
+    click.echo(f'Token {token.id} ({token.prefix}...): {secret}')
+
+
+@click.command('report-worker')
+@click.option('--once', is_flag=True, help='Render the queued jobs and exit.')
+@click.option('--interval', type=float, default=2.0, show_default=True, help='Seconds between queue polls.')
+@with_appcontext
+def report_worker_command(once, interval):
+    """Render queued PDF reports outside the web workers"""
+    import time
+    from report_jobs import run_pending_jobs
+
+    while True:
+        rendered = run_pending_jobs()
+        if rendered:
+            click.echo(f'{rendered} report jobs processed.')
+        if once:
+            break
+        time.sleep(interval)
+
+
+def register_commands(app):
+    """Register the maintenance CLI commands on the app"""
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(rebuild_summaries_command)
+    app.cli.add_command(reconcile_balances_command)
+    app.cli.add_command(explain_queries_command)
+    app.cli.add_command(import_statement_command)
+    app.cli.add_command(materialize_recurring_command)
+    app.cli.add_command(sweep_overdue_command)
+    app.cli.add_command(forecast_all_command)
+    app.cli.add_command(detect_anomalies_command)
+    app.cli.add_command(create_api_token_command)
+    app.cli.add_command(report_worker_command)
@@ -1,9 +1,11 @@
-from flask import Blueprint, render_template, jsonify
+from flask import Blueprint, render_template, jsonify, request, abort
 from flask_login import login_required, current_user
-from models import Transaction, Account, FinancialGoal
+from models import Transaction, Account, FinancialGoal, OPEN_ACCOUNT_STATUSES
 from app import db
-from sqlalchemy import func, extract
-from datetime import datetime, timedelta
+from sqlalchemy import func
+from utils import now_brasilia
+from analytics import monthly_series, transaction_count as count_transactions
+from cache import cached_for_user, conditional_user_response
 import calendar
 
 dashboard_bp = Blueprint('dashboard', __name__)
@@ -17,102 +19,95 @@ def dashboard():
             return render_template('subscription/plans.html', 
                                  message='Seu período de teste expirou. Escolha um plano para continuar.')
     
-    # Get dashboard data
-    today = datetime.utcnow()
-    current_month = today.month
-    current_year = today.year
+    # Get dashboard data (cached per user until their data changes)
+    today = now_brasilia()
+    data = cached_for_user(current_user, f'dashboard:{today:%Y-%m}',
+                           lambda: build_dashboard_data(current_user.id))
     
-    # Monthly summary
-    monthly_income = db.session.query(func.sum(Transaction.amount)).filter(
-        Transaction.user_id == current_user.id,
-        Transaction.transaction_type == 'income',
-        extract('month', Transaction.date) == current_month,
-        extract('year', Transaction.date) == current_year
-    ).scalar() or 0
-    
-    monthly_expenses = db.session.query(func.sum(Transaction.amount)).filter(
-        Transaction.user_id == current_user.id,
-        Transaction.transaction_type == 'expense',
-        extract('month', Transaction.date) == current_month,
-        extract('year', Transaction.date) == current_year
-    ).scalar() or 0
-    
-    monthly_balance = float(monthly_income) - float(monthly_expenses)
+    return render_template('dashboard/dashboard.html',
+                         current_month=calendar.month_name[today.month],
+                         **data)
+
+def build_dashboard_data(user_id):
+    """Compute the dashboard figures as plain values suitable for caching"""
+    # Monthly summary for the current local month (read from the monthly rollup)
+    current = monthly_series(user_id, months=1)[0]
     
     # Recent transactions
-    recent_transactions = Transaction.query.filter_by(user_id=current_user.id)\
-        .order_by(Transaction.date.desc()).limit(5).all()
+    recent_transactions = [{
+        'description': t.description,
+        'date': t.date,
+        'amount': float(t.amount),
+        'transaction_type': t.transaction_type,
+        'category': t.category
+    } for t in Transaction.query.filter_by(user_id=user_id)
+        .order_by(Transaction.date.desc()).limit(5).all()]
     
     # Accounts summary
     pending_receivables = db.session.query(func.sum(Account.amount)).filter(
-        Account.user_id == current_user.id,
+        Account.user_id == user_id,
         Account.account_type == 'receivable',
-        Account.status == 'pending'
+        Account.status.in_(OPEN_ACCOUNT_STATUSES)
     ).scalar() or 0
     
     pending_payables = db.session.query(func.sum(Account.amount)).filter(
-        Account.user_id == current_user.id,
+        Account.user_id == user_id,
         Account.account_type == 'payable',
-        Account.status == 'pending'
+        Account.status.in_(OPEN_ACCOUNT_STATUSES)
     ).scalar() or 0
     
     # Financial goals
-    goals = FinancialGoal.query.filter_by(user_id=current_user.id, is_completed=False).all()
+    goals = [{
+        'title': g.title,
+        'current_amount': float(g.current_amount or 0),
+        'target_amount': float(g.target_amount),
+        'progress': g.get_progress_percentage()
+    } for g in FinancialGoal.query.filter_by(user_id=user_id, is_completed=False).all()]
     
     # Calculate user level and progress (gamification)
-    transaction_count = Transaction.query.filter_by(user_id=current_user.id).count()
-    user_level = min(10, (transaction_count // 10) + 1)
-    level_progress = (transaction_count % 10) * 10
+    transaction_count = count_transactions(user_id)
     
-    return render_template('dashboard/dashboard.html',
-                         monthly_income=monthly_income,
-                         monthly_expenses=monthly_expenses,
-                         monthly_balance=monthly_balance,
-                         recent_transactions=recent_transactions,
-                         pending_receivables=pending_receivables,
-                         pending_payables=pending_payables,
-                         goals=goals,
-                         user_level=user_level,
-                         level_progress=level_progress,
-                         current_month=calendar.month_name[current_month])
+    return {
+        'monthly_income': current['income'],
+        'monthly_expenses': current['expenses'],
+        'monthly_balance': current['profit'],
+        'recent_transactions': recent_transactions,
+        'pending_receivables': float(pending_receivables),
+        'pending_payables': float(pending_payables),
+        'goals': goals,
+        'user_level': min(10, (transaction_count // 10) + 1),
+        'level_progress': (transaction_count % 10) * 10
+    }
 
 @dashboard_bp.route('/chart-data')
 @login_required
+@conditional_user_response('chart-data')
 def chart_data():
     """Provide data for dashboard charts"""
-    today = datetime.utcnow()
-    
-    # Get last 6 months data
-    months_data = []
-    for i in range(6):
-        month_date = today - timedelta(days=30*i)
-        month = month_date.month
-        year = month_date.year
-        
-        income = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.user_id == current_user.id,
-            Transaction.transaction_type == 'income',
-            extract('month', Transaction.date) == month,
-            extract('year', Transaction.date) == year
-        ).scalar() or 0
-        
-        expenses = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.user_id == current_user.id,
-            Transaction.transaction_type == 'expense',
-            extract('month', Transaction.date) == month,
-            extract('year', Transaction.date) == year
-        ).scalar() or 0
-        
-        months_data.append({
-            'month': calendar.month_name[month][:3],
-            'income': float(income),
-            'expenses': float(expenses)
-        })
-    
-    months_data.reverse()
+    today = now_brasilia()
+    return jsonify(cached_for_user(current_user, f'chart-data:{today:%Y-%m}',
+                                   lambda: build_chart_data(current_user.id)))
+
+def build_chart_data(user_id):
+    """Income and expense series for the last 6 calendar months"""
+    months_data = monthly_series(user_id, months=6)
     
-    return jsonify({
-        'months': [m['month'] for m in months_data],
+    return {
+        'months': [calendar.month_name[m['month']][:3] for m in months_data],
         'income': [m['income'] for m in months_data],
         'expenses': [m['expenses'] for m in months_data]
-    })
+    }
+
+@dashboard_bp.route('/forecast')
+@login_required
+@conditional_user_response('forecast')
+def forecast():
+    """Projected daily balance for the next 30, 60 or 90 days"""
+    # Imported on first use: forecasting pulls in numpy
+    from forecasting import FORECAST_HORIZONS, build_forecast
+    days = request.args.get('days', 90, type=int)
+    if days not in FORECAST_HORIZONS:
+        abort(400)
+    today = now_brasilia()
+    return jsonify(cached_for_user(current_user, f'forecast:{days}:{today:%Y-%m-%d}',
+                                   lambda: build_forecast(current_user.id, days)))
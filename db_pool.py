@@ -0,0 +1,224 @@
+import logging
+import os
+import threading
+import time
+import weakref
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool, QueuePool
+
+# Upper bounds (seconds) of the checkout wait histogram
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class PoolMetrics:
+    """Connection pool counters for this process; every worker keeps its own"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.checkins = 0
+            self.connects = 0
+            self.invalidations = 0
+            self.soft_invalidations = 0
+            self.timeouts = 0
+            self.overflow_checkouts = 0
+            self.overflow_peak = 0
+            self.checked_out_peak = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+            self.wait_buckets = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def record_wait(self, seconds, timed_out=False):
+        index = next((i for i, bound in enumerate(WAIT_BUCKETS) if seconds <= bound), len(WAIT_BUCKETS))
+        with self._lock:
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self.wait_buckets[index] += 1
+            if timed_out:
+                self.timeouts += 1
+
+    def record_checkout(self, pool):
+        with self._lock:
+            self.checkouts += 1
+            if isinstance(pool, QueuePool):
+                # overflow() counts down from -pool_size; above zero the pool is past its size
+                overflow = pool.overflow()
+                if overflow > 0:
+                    self.overflow_checkouts += 1
+                self.overflow_peak = max(self.overflow_peak, overflow)
+                self.checked_out_peak = max(self.checked_out_peak, pool.checkedout())
+
+    def increment(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            waits = sum(self.wait_buckets)
+            return {
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+                'soft_invalidations': self.soft_invalidations,
+                'timeouts': self.timeouts,
+                'overflow_checkouts': self.overflow_checkouts,
+                'overflow_peak': self.overflow_peak,
+                'checked_out_peak': self.checked_out_peak,
+                'wait': {
+                    'count': waits,
+                    'total_seconds': round(self.wait_total, 6),
+                    'avg_seconds': round(self.wait_total / waits, 6) if waits else 0.0,
+                    'max_seconds': round(self.wait_max, 6),
+                    'buckets': dict(zip([str(bound) for bound in WAIT_BUCKETS] + ['+Inf'],
+                                        self.wait_buckets)),
+                },
+            }
+
+
+pool_metrics = PoolMetrics()
+_instrumented = weakref.WeakSet()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that times how long each checkout waits for a connection.
+
+    The wait includes opening a new connection when the pool has none idle.
+    Pool events fire only once a connection is handed out, so the wait (and
+    the timeouts) can only be seen from inside the pool.
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.record_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        pool_metrics.record_wait(time.perf_counter() - started)
+        return connection
+
+
+# Pools log under their class's module; keep this one as quiet as SQLAlchemy's own
+logging.getLogger(f'{__name__}.{InstrumentedQueuePool.__name__}').setLevel(logging.WARNING)
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, default).lower() in ('1', 'true', 'yes', 'on')
+
+
+def default_pool_size():
+    """One connection per request thread, plus one for background report jobs"""
+    return int(os.environ.get('GUNICORN_THREADS', 1)) + 1
+
+
+def init_db_pool(app):
+    """Configure the engine's connection pool from DB_POOL_* settings.
+
+    Must run before db.init_app(). An explicit SQLALCHEMY_ENGINE_OPTIONS in the
+    config is left alone.
+    """
+    # 'queue' keeps a pool in every worker; 'pgbouncer' opens a connection per
+    # checkout (NullPool) and leaves pooling to PgBouncer in transaction mode
+    app.config.setdefault('DB_POOL_MODE', os.environ.get('DB_POOL_MODE', 'queue'))
+    # Each worker holds up to DB_POOL_SIZE + DB_MAX_OVERFLOW connections, so
+    # workers * (size + overflow) per instance must stay under max_connections
+    app.config.setdefault('DB_POOL_SIZE', int(os.environ.get('DB_POOL_SIZE', default_pool_size())))
+    app.config.setdefault('DB_MAX_OVERFLOW', int(os.environ.get('DB_MAX_OVERFLOW', 2)))
+    # Seconds a checkout waits for a free connection before failing
+    app.config.setdefault('DB_POOL_TIMEOUT', int(os.environ.get('DB_POOL_TIMEOUT', 10)))
+    app.config.setdefault('DB_POOL_RECYCLE', int(os.environ.get('DB_POOL_RECYCLE', 300)))
+    # Pre-ping costs a round trip per checkout; dropped connections are
+    # otherwise detected on first use, invalidated and replaced
+    app.config.setdefault('DB_POOL_PRE_PING', _env_flag('DB_POOL_PRE_PING', '0'))
+    app.config.setdefault('DB_APPLICATION_NAME', os.environ.get('DB_APPLICATION_NAME', 'financeiro'))
+
+    if 'SQLALCHEMY_ENGINE_OPTIONS' not in app.config:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+
+
+def engine_options(config):
+    """create_engine() keyword arguments for the configured pool mode"""
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        # Flask-SQLAlchemy shares one in-memory connection (StaticPool)
+        return {}
+
+    options = {}
+    connect_args = {}
+    if url.get_backend_name() == 'postgresql':
+        # Shows up in pg_stat_activity, so connections can be traced to the app
+        connect_args['application_name'] = config['DB_APPLICATION_NAME']
+
+    if config['DB_POOL_MODE'] == 'pgbouncer':
+        options['poolclass'] = NullPool
+        # PgBouncer in transaction mode hands each transaction to any server
+        # connection, so server-side prepared statements cannot be reused.
+        # psycopg2 never prepares; psycopg 3 does after a few executions.
+        if url.get_driver_name() == 'psycopg':
+            connect_args['prepare_threshold'] = None
+        elif url.get_driver_name() == 'asyncpg':
+            connect_args['statement_cache_size'] = 0
+    else:
+        options.update(
+            poolclass=InstrumentedQueuePool,
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+            pool_recycle=config['DB_POOL_RECYCLE'],
+            pool_pre_ping=config['DB_POOL_PRE_PING'],
+        )
+    if connect_args:
+        options['connect_args'] = connect_args
+    return options
+
+
+def instrument_engine(engine):
+    """Count checkouts, new connections and invalidations on an engine's pool"""
+    if engine in _instrumented:
+        return
+    _instrumented.add(engine)
+
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        # engine.pool, not a captured pool: dispose() swaps in a new one
+        pool_metrics.record_checkout(engine.pool)
+
+    event.listen(engine, 'connect', lambda *args: pool_metrics.increment('connects'))
+    event.listen(engine, 'checkin', lambda *args: pool_metrics.increment('checkins'))
+    event.listen(engine, 'invalidate', lambda *args: pool_metrics.increment('invalidations'))
+    event.listen(engine, 'soft_invalidate', lambda *args: pool_metrics.increment('soft_invalidations'))
+
+
+def pool_status(engine, config):
+    """Configured limits, live pool state and the counters, for the metrics endpoint"""
+    pool = engine.pool
+    status = {
+        'pid': os.getpid(),
+        'mode': config['DB_POOL_MODE'],
+        'pool_class': type(pool).__name__,
+    }
+    if isinstance(pool, QueuePool):
+        status.update(
+            pool_size=pool.size(),
+            max_overflow=pool._max_overflow,
+            timeout_seconds=pool.timeout(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=pool.overflow(),
+        )
+    status.update(pool_metrics.snapshot())
+    return status
+
+
+def connections_per_process():
+    """Most connections one worker can hold with the environment's settings, or None without a pool"""
+    if os.environ.get('DB_POOL_MODE', 'queue') == 'pgbouncer':
+        return None
+    return int(os.environ.get('DB_POOL_SIZE', default_pool_size())) + int(os.environ.get('DB_MAX_OVERFLOW', 2))
@@ -0,0 +1,240 @@
+import csv
+import io
+import re
+import zipfile
+from datetime import datetime
+from xml.sax.saxutils import escape
+from sqlalchemy import select
+from app import db
+from models import Transaction, Account
+from utils import utc_to_brasilia
+
+# Rows fetched per round trip; on PostgreSQL yield_per uses a server-side cursor
+FETCH_SIZE = 1000
+
+TRANSACTION_TYPES = {'income': 'Receita', 'expense': 'Despesa'}
+ACCOUNT_TYPES = {'receivable': 'Conta a Receber', 'payable': 'Conta a Pagar', 'bank': 'Conta Bancária'}
+ACCOUNT_STATUSES = {'pending': 'Pendente', 'paid': 'Paga', 'overdue': 'Vencida'}
+
+LEDGER_HEADER = ['Data', 'Descrição', 'Categoria', 'Tipo', 'Valor']
+ACCOUNTS_HEADER = ['Nome', 'Tipo', 'Valor', 'Vencimento', 'Status']
+
+
+def iter_ledger_rows(user_id):
+    """Yield the full ledger as [date, description, category, type, amount] rows"""
+    query = select(
+        Transaction.date,
+        Transaction.description,
+        Transaction.category,
+        Transaction.transaction_type,
+        Transaction.amount
+    ).where(
+        Transaction.user_id == user_id
+    ).order_by(Transaction.date, Transaction.id).execution_options(yield_per=FETCH_SIZE)
+
+    for date, description, category, transaction_type, amount in db.session.execute(query):
+        yield [
+            utc_to_brasilia(date).replace(tzinfo=None) if date else None,
+            description,
+            category or 'Sem categoria',
+            TRANSACTION_TYPES.get(transaction_type, transaction_type),
+            amount if transaction_type == 'income' else -amount
+        ]
+
+
+def iter_account_rows(user_id):
+    """Yield accounts payable/receivable as [name, type, amount, due date, status] rows"""
+    query = select(
+        Account.name,
+        Account.account_type,
+        Account.amount,
+        Account.due_date,
+        Account.status
+    ).where(
+        Account.user_id == user_id
+    ).order_by(Account.due_date, Account.id).execution_options(yield_per=FETCH_SIZE)
+
+    for name, account_type, amount, due_date, status in db.session.execute(query):
+        yield [
+            name,
+            ACCOUNT_TYPES.get(account_type, account_type),
+            amount,
+            utc_to_brasilia(due_date).replace(tzinfo=None) if due_date else None,
+            ACCOUNT_STATUSES.get(status, status)
+        ]
+
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.strftime('%d/%m/%Y')
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        # Decimal comma so spreadsheet apps with a pt-BR locale read numbers
+        return f'{value:.2f}'.replace('.', ',')
+    return value
+
+
+def stream_csv(header, rows, rows_per_chunk=500):
+    """Yield an Excel-friendly (UTF-8 BOM, ';' separated) CSV in chunks"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    for index, row in enumerate(rows, start=1):
+        writer.writerow([_csv_value(value) for value in row])
+        if index % rows_per_chunk == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, unseekable file object that collects bytes for streaming"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+
+XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{sheet_name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+# Cell styles: 0 = default, 1 = date (dd/mm/yyyy), 2 = number (#,##0.00), 3 = bold header
+XLSX_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="1"><numFmt numFmtId="164" formatCode="dd/mm/yyyy"/></numFmts>'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="4">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="4" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+    '</cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+EXCEL_EPOCH = datetime(1899, 12, 30)
+INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _xlsx_cell(value, header=False):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, datetime):
+        serial = (value - EXCEL_EPOCH).total_seconds() / 86400
+        return f'<c s="1"><v>{serial:.6f}</v></c>'
+    if isinstance(value, str):
+        text = escape(INVALID_XML_CHARS.sub('', value))
+        style = ' s="3"' if header else ''
+        return f'<c t="inlineStr"{style}><is><t xml:space="preserve">{text}</t></is></c>'
+    return f'<c s="2"><v>{value}</v></c>'
+
+
+def stream_xlsx(sheet_name, header, rows, rows_per_chunk=500):
+    """Yield a single-sheet XLSX workbook while it is being written.
+
+    The worksheet is written row by row into a streaming ZIP archive with
+    inline strings, so memory use stays constant regardless of row count.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', XLSX_CONTENT_TYPES)
+        archive.writestr('_rels/.rels', XLSX_ROOT_RELS)
+        archive.writestr('xl/workbook.xml', XLSX_WORKBOOK.format(sheet_name=escape(sheet_name)))
+        archive.writestr('xl/_rels/workbook.xml.rels', XLSX_WORKBOOK_RELS)
+        archive.writestr('xl/styles.xml', XLSX_STYLES)
+        yield sink.drain()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b'<sheetData>'
+            )
+            sheet.write(('<row>' + ''.join(_xlsx_cell(h, header=True) for h in header) + '</row>').encode('utf-8'))
+            for index, row in enumerate(rows, start=1):
+                sheet.write(('<row>' + ''.join(_xlsx_cell(value) for value in row) + '</row>').encode('utf-8'))
+                if index % rows_per_chunk == 0:
+                    yield sink.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+
+EXPORTS = {
+    'ledger': ('Lançamentos', LEDGER_HEADER, iter_ledger_rows),
+    'accounts': ('Contas', ACCOUNTS_HEADER, iter_account_rows),
+}
+
+EXPORT_FORMATS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def stream_export(user_id, dataset, export_format):
+    """Return a byte-chunk generator for the requested dataset and format"""
+    sheet_name, header, row_source = EXPORTS[dataset]
+    rows = row_source(user_id)
+    if export_format == 'csv':
+        return stream_csv(header, rows)
+    return stream_xlsx(sheet_name, header, rows)
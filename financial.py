@@ -1,48 +1,108 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app, abort
 from flask_login import login_required, current_user
-from models import Transaction, Account
-from forms import TransactionForm, AccountForm
+from models import Transaction, Account, OPEN_ACCOUNT_STATUSES
+from forms import TransactionForm, AccountForm, ImportForm
 from app import db
 from datetime import datetime
-from utils import now_brasilia, brasilia_to_utc
+from sqlalchemy import or_, and_
+from utils import now_brasilia, brasilia_to_utc, brasilia_date
+from analytics import ledger_totals
+from importer import iter_statement_rows, import_transactions, StatementImportError
+from quota import monthly_usage, reserve_transactions
 
 financial_bp = Blueprint('financial', __name__)
 
+def encode_cursor(transaction):
+    """Build the keyset cursor that points just after a transaction"""
+    return f"{transaction.date.isoformat()}_{transaction.id}"
+
+def decode_cursor(cursor):
+    """Parse a keyset cursor into (date, id); raises ValueError if malformed"""
+    date_part, id_part = cursor.rsplit('_', 1)
+    return datetime.fromisoformat(date_part), int(id_part)
+
+def ledger_page(user_id, cursor=None, page_size=None):
+    """Return one page of the ledger, newest first, and the cursor for the next page"""
+    page_size = page_size or current_app.config['LEDGER_PAGE_SIZE']
+    query = Transaction.query.filter(
+        Transaction.user_id == user_id,
+        Transaction.date.isnot(None)
+    )
+    if cursor:
+        cursor_date, cursor_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Transaction.date < cursor_date,
+            and_(Transaction.date == cursor_date, Transaction.id < cursor_id)
+        ))
+    
+    # Fetch one extra row to know whether another page exists
+    rows = query.order_by(Transaction.date.desc(), Transaction.id.desc())\
+        .limit(page_size + 1).all()
+    transactions = rows[:page_size]
+    next_cursor = encode_cursor(transactions[-1]) if len(rows) > page_size else None
+    return transactions, next_cursor
+
+def render_cash_flow(features, transaction_count, **context):
+    """Render the cash flow page with the first ledger page and SQL totals"""
+    transactions, next_cursor = ledger_page(current_user.id)
+    total_income, total_expenses = ledger_totals(current_user.id)
+    current_balance = total_income - total_expenses
+    
+    return render_template('financial/cash_flow.html',
+                         transactions=transactions,
+                         next_cursor=next_cursor,
+                         total_income=total_income,
+                         total_expenses=total_expenses,
+                         current_balance=current_balance,
+                         transaction_count=transaction_count,
+                         features=features,
+                         **context)
+
 @financial_bp.route('/cash-flow')
 @login_required
 def cash_flow():
     # Check plan limits
     features = current_user.get_plan_features()
-    transaction_count = Transaction.query.filter_by(user_id=current_user.id).count()
+    transaction_count = monthly_usage(current_user.id)
     
     if features['transactions_limit'] != -1 and transaction_count >= features['transactions_limit']:
-        flash('Você atingiu o limite de transações do seu plano. Faça upgrade para continuar.', 'warning')
+        flash('Você atingiu o limite mensal de transações do seu plano. Faça upgrade para continuar.', 'warning')
     
-    # Get all transactions
-    transactions = Transaction.query.filter_by(user_id=current_user.id)\
-        .order_by(Transaction.date.desc()).all()
-    
-    # Calculate totals
-    total_income = sum(float(t.amount) for t in transactions if t.transaction_type == 'income')
-    total_expenses = sum(float(t.amount) for t in transactions if t.transaction_type == 'expense')
-    current_balance = total_income - total_expenses
-    
-    return render_template('financial/cash_flow.html',
-                         transactions=transactions,
-                         total_income=total_income,
-                         total_expenses=total_expenses,
-                         current_balance=current_balance,
-                         features=features)
+    return render_cash_flow(features, transaction_count)
+
+@financial_bp.route('/transactions')
+@login_required
+def transactions_page():
+    """JSON page of the ledger for the cash flow "load more" button"""
+    page_size = request.args.get('limit', type=int)
+    if page_size is not None:
+        page_size = max(1, min(page_size, current_app.config['LEDGER_MAX_PAGE_SIZE']))
+    try:
+        transactions, next_cursor = ledger_page(current_user.id, request.args.get('cursor'), page_size)
+    except ValueError:
+        abort(400)
+    
+    return jsonify({
+        'transactions': [{
+            'id': t.id,
+            'date': brasilia_date(t.date),
+            'description': t.description,
+            'category': t.category,
+            'transaction_type': t.transaction_type,
+            'amount': float(t.amount)
+        } for t in transactions],
+        'next_cursor': next_cursor
+    })
 
 @financial_bp.route('/add-transaction', methods=['GET', 'POST'])
 @login_required
 def add_transaction():
     # Check plan limits
     features = current_user.get_plan_features()
-    transaction_count = Transaction.query.filter_by(user_id=current_user.id).count()
+    transaction_count = monthly_usage(current_user.id)
     
     if features['transactions_limit'] != -1 and transaction_count >= features['transactions_limit']:
-        flash('Você atingiu o limite de transações do seu plano. Faça upgrade para continuar.', 'error')
+        flash('Você atingiu o limite mensal de transações do seu plano. Faça upgrade para continuar.', 'error')
         return redirect(url_for('subscription.plans'))
     
     form = TransactionForm()
@@ -54,13 +114,21 @@ def add_transaction():
         else:
             transaction_date_utc = brasilia_to_utc(now_brasilia())
         
+        # Counted in the same database transaction as the insert
+        if not reserve_transactions(db.session.connection(), current_user.id, 1, features['transactions_limit']):
+            db.session.rollback()
+            flash('Você atingiu o limite mensal de transações do seu plano. Faça upgrade para continuar.', 'error')
+            return redirect(url_for('subscription.plans'))
+        
         transaction = Transaction(
             user_id=current_user.id,
             description=form.description.data,
             amount=form.amount.data,
             transaction_type=form.transaction_type.data,
             category=form.category.data,
-            date=transaction_date_utc
+            date=transaction_date_utc,
+            is_recurring=form.is_recurring.data,
+            recurrence_type=form.recurrence_type.data if form.is_recurring.data else None
         )
         db.session.add(transaction)
         db.session.commit()
@@ -71,23 +139,26 @@ def add_transaction():
     if not form.date.data:
         form.date.data = now_brasilia().date()
     
-    # Get all transactions to calculate totals (same as cash_flow function)
-    transactions = Transaction.query.filter_by(user_id=current_user.id)\
-        .order_by(Transaction.date.desc()).all()
-    
-    # Calculate totals
-    total_income = sum(float(t.amount) for t in transactions if t.transaction_type == 'income')
-    total_expenses = sum(float(t.amount) for t in transactions if t.transaction_type == 'expense')
-    current_balance = total_income - total_expenses
+    return render_cash_flow(features, transaction_count, form=form, show_form=True)
+
+@financial_bp.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_statement():
+    """Bulk import transactions from a CSV or OFX bank statement"""
+    form = ImportForm()
+    if form.validate_on_submit():
+        statement = form.statement.data
+        try:
+            rows = iter_statement_rows(statement.stream, statement.filename)
+            imported = import_transactions(current_user, rows, current_app.config['IMPORT_BATCH_SIZE'])
+        except StatementImportError as e:
+            flash(f'Não foi possível importar o extrato: {e}', 'error')
+            return render_template('financial/import.html', form=form)
+        
+        flash(f'{imported} transações importadas com sucesso!', 'success')
+        return redirect(url_for('financial.cash_flow'))
     
-    return render_template('financial/cash_flow.html',
-                         form=form,
-                         show_form=True,
-                         transactions=transactions,
-                         total_income=total_income,
-                         total_expenses=total_expenses,
-                         current_balance=current_balance,
-                         features=features)
+    return render_template('financial/import.html', form=form)
 
 @financial_bp.route('/accounts')
 @login_required
@@ -96,8 +167,8 @@ def accounts():
     payables = Account.query.filter_by(user_id=current_user.id, account_type='payable').all()
     
     # Calculate totals
-    total_receivables = sum(float(a.amount) for a in receivables if a.status == 'pending')
-    total_payables = sum(float(a.amount) for a in payables if a.status == 'pending')
+    total_receivables = sum(float(a.amount) for a in receivables if a.status in OPEN_ACCOUNT_STATUSES)
+    total_payables = sum(float(a.amount) for a in payables if a.status in OPEN_ACCOUNT_STATUSES)
     
     return render_template('financial/accounts.html',
                          receivables=receivables,
@@ -134,8 +205,8 @@ def add_account():
     payables = Account.query.filter_by(user_id=current_user.id, account_type='payable').all()
     
     # Calculate totals
-    total_receivables = sum(float(a.amount) for a in receivables if a.status == 'pending')
-    total_payables = sum(float(a.amount) for a in payables if a.status == 'pending')
+    total_receivables = sum(float(a.amount) for a in receivables if a.status in OPEN_ACCOUNT_STATUSES)
+    total_payables = sum(float(a.amount) for a in payables if a.status in OPEN_ACCOUNT_STATUSES)
     
     return render_template('financial/accounts.html',
                          form=form,
@@ -149,8 +220,16 @@ def add_account():
 @login_required
 def mark_paid(account_id):
     account = Account.query.filter_by(id=account_id, user_id=current_user.id).first_or_404()
+
+    # The payment is recorded as a transaction, so it counts against the monthly quota
+    features = current_user.get_plan_features()
+    if not reserve_transactions(db.session.connection(), current_user.id, 1, features['transactions_limit']):
+        db.session.rollback()
+        flash('Você atingiu o limite mensal de transações do seu plano. Faça upgrade para continuar.', 'error')
+        return redirect(url_for('subscription.plans'))
+
     account.status = 'paid'
-    
+
     # Create corresponding transaction
     transaction_type = 'income' if account.account_type == 'receivable' else 'expense'
     transaction = Transaction(
@@ -0,0 +1,153 @@
+from datetime import datetime, timedelta
+from itertools import takewhile
+import numpy as np
+from sqlalchemy import select, case
+from app import db
+from models import User, Transaction, Account, BalanceSnapshot, OPEN_ACCOUNT_STATUSES
+from recurrence import iter_occurrences, recurring_series_query
+from utils import now_brasilia, brasilia_to_utc
+
+FORECAST_HORIZONS = (30, 60, 90)
+
+# Users processed together by the nightly batch
+FORECAST_CHUNK_SIZE = 1000
+
+
+def _day_offsets(utc_dates, today):
+    """Vectorized local day index (0 = today) for an array of naive UTC datetimes.
+
+    Future dates use the current UTC offset; Brasilia has had a fixed offset
+    since daylight saving was abolished in 2019.
+    """
+    offset = np.timedelta64(int(now_brasilia().utcoffset().total_seconds()), 's')
+    local_days = (utc_dates.astype('datetime64[s]') + offset).astype('datetime64[D]')
+    return (local_days - np.datetime64(today, 'D')).astype(np.int64)
+
+
+def load_opening_balances(user_ids):
+    """Current ledger balance per user, from their balance snapshots, as a float array"""
+    balances = dict(db.session.execute(
+        select(BalanceSnapshot.user_id, BalanceSnapshot.balance)
+        .where(BalanceSnapshot.user_id.in_(user_ids))
+    ).all())
+    return np.array([float(balances.get(user_id) or 0) for user_id in user_ids])
+
+
+def load_account_flows(user_ids, end):
+    """Open receivables/payables due before `end` as (user_id, due_date, signed amount) arrays"""
+    rows = db.session.execute(
+        select(
+            Account.user_id,
+            Account.due_date,
+            case((Account.account_type == 'receivable', Account.amount), else_=-Account.amount)
+        ).where(
+            Account.user_id.in_(user_ids),
+            Account.status.in_(OPEN_ACCOUNT_STATUSES),
+            Account.account_type.in_(('receivable', 'payable')),
+            Account.due_date.is_not(None),
+            Account.due_date < end
+        )
+    ).all()
+    if not rows:
+        return np.array([], dtype=np.int64), np.array([], dtype='datetime64[s]'), np.array([])
+    user_column, dates, amounts = zip(*rows)
+    return (np.array(user_column, dtype=np.int64),
+            np.array(dates, dtype='datetime64[s]'),
+            np.array(amounts, dtype=float))
+
+
+def load_recurring_flows(user_ids, start, end):
+    """Occurrences of recurring series in [start, end) as (user_id, date, signed amount) arrays"""
+    series = db.session.execute(recurring_series_query().where(Transaction.user_id.in_(user_ids))).all()
+    user_column, dates, amounts = [], [], []
+    for row in series:
+        after = max(start, row.last_occurrence_date or row.date)
+        occurrences = list(takewhile(lambda date: date < end,
+                                     iter_occurrences(row.date, row.recurrence_type, after)))
+        amount = float(row.amount) if row.transaction_type == 'income' else -float(row.amount)
+        user_column.extend([row.user_id] * len(occurrences))
+        dates.extend(occurrences)
+        amounts.extend([amount] * len(occurrences))
+    return (np.array(user_column, dtype=np.int64),
+            np.array(dates, dtype='datetime64[s]'),
+            np.array(amounts, dtype=float))
+
+
+def project_balances(opening, row_index, day_index, amounts, days):
+    """Daily inflow, outflow and closing balance matrices (users x days).
+
+    Flows are scattered into their day buckets with one bincount per sign
+    and accumulated with a cumulative sum along the day axis.
+    """
+    users = len(opening)
+    flat = row_index * days + day_index
+    size = users * days
+    inflows = np.bincount(flat, weights=np.where(amounts > 0, amounts, 0), minlength=size)
+    outflows = np.bincount(flat, weights=np.where(amounts < 0, -amounts, 0), minlength=size)
+    inflows = inflows.reshape(users, days)
+    outflows = outflows.reshape(users, days)
+    balances = opening[:, None] + np.cumsum(inflows - outflows, axis=1)
+    return inflows, outflows, balances
+
+
+def forecast_users(user_ids, days=90, today=None):
+    """Project daily balances for several users at once.
+
+    Returns (dates, inflows, outflows, balances); the matrices have one row
+    per entry of user_ids and one column per day, starting today. Overdue
+    items are expected to settle today.
+    """
+    today = today or now_brasilia().date()
+    user_ids = list(user_ids)
+    start = datetime.utcnow()
+    end = brasilia_to_utc(datetime.combine(today + timedelta(days=days), datetime.min.time()))
+
+    opening = load_opening_balances(user_ids)
+    account_users, account_dates, account_amounts = load_account_flows(user_ids, end)
+    recurring_users, recurring_dates, recurring_amounts = load_recurring_flows(user_ids, start, end)
+
+    flow_users = np.concatenate([account_users, recurring_users])
+    flow_dates = np.concatenate([account_dates, recurring_dates])
+    amounts = np.concatenate([account_amounts, recurring_amounts])
+
+    ids = np.array(user_ids, dtype=np.int64)
+    order = np.argsort(ids)
+    row_index = order[np.searchsorted(ids, flow_users, sorter=order)]
+    day_index = np.clip(_day_offsets(flow_dates, today), 0, days - 1)
+
+    inflows, outflows, balances = project_balances(opening, row_index, day_index, amounts, days)
+    dates = [today + timedelta(days=offset) for offset in range(days)]
+    return dates, inflows, outflows, balances
+
+
+def forecast_payload(dates, inflows, outflows, balance):
+    """JSON-ready forecast from one user's rows of the projection matrices"""
+    lowest = int(np.argmin(balance))
+    return {
+        'dates': [date.isoformat() for date in dates],
+        'labels': [date.strftime('%d/%m') for date in dates],
+        'balance': np.round(balance, 2).tolist(),
+        'inflows': np.round(inflows, 2).tolist(),
+        'outflows': np.round(outflows, 2).tolist(),
+        'horizons': {str(h): round(float(balance[h - 1]), 2) for h in FORECAST_HORIZONS if h <= len(dates)},
+        'lowest': {'date': dates[lowest].isoformat(), 'balance': round(float(balance[lowest]), 2)}
+    }
+
+
+def build_forecast(user_id, days=90):
+    """Cash-flow forecast for one user"""
+    dates, inflows, outflows, balances = forecast_users([user_id], days)
+    return forecast_payload(dates, inflows[0], outflows[0], balances[0])
+
+
+def iter_all_forecasts(days=90, chunk_size=FORECAST_CHUNK_SIZE):
+    """Yield (user, payload) for every user, projecting chunk_size users per pass"""
+    last_id = 0
+    while True:
+        users = User.query.filter(User.id > last_id).order_by(User.id).limit(chunk_size).all()
+        if not users:
+            return
+        dates, inflows, outflows, balances = forecast_users([user.id for user in users], days)
+        for index, user in enumerate(users):
+            yield user, forecast_payload(dates, inflows[index], outflows[index], balances[index])
+        last_id = users[-1].id
@@ -1,4 +1,5 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import StringField, PasswordField, SubmitField, BooleanField, SelectField, TextAreaField, DecimalField, DateTimeField, DateField
 from wtforms.validators import DataRequired, Email, EqualTo, Length, NumberRange
 from wtforms.widgets import NumberInput
@@ -36,6 +37,12 @@ class TransactionForm(FlaskForm):
         ('outros', 'Outros')
     ])
     date = DateField('Data', validators=[DataRequired()])
+    is_recurring = BooleanField('Repetir automaticamente')
+    recurrence_type = SelectField('Frequência', choices=[
+        ('monthly', 'Mensal'),
+        ('weekly', 'Semanal'),
+        ('yearly', 'Anual')
+    ], default='monthly')
     submit = SubmitField('Salvar')
 
 class AccountForm(FlaskForm):
@@ -47,3 +54,10 @@ class AccountForm(FlaskForm):
     amount = DecimalField('Valor', validators=[DataRequired(), NumberRange(min=0.01)], widget=NumberInput(step=0.01))
     due_date = DateField('Data de Vencimento', validators=[DataRequired()])
     submit = SubmitField('Salvar')
+
+class ImportForm(FlaskForm):
+    statement = FileField('Extrato (CSV ou OFX)', validators=[
+        FileRequired(),
+        FileAllowed(['csv', 'txt', 'ofx', 'qfx'], 'Envie um arquivo CSV ou OFX.')
+    ])
+    submit = SubmitField('Importar')
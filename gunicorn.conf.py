@@ -0,0 +1,47 @@
+# Gunicorn settings: `gunicorn -c gunicorn.conf.py`; everything can be set from the environment
+import multiprocessing
+import os
+from importlib import import_module
+
+wsgi_app = 'main:app'
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 0))
+
+# Build the app once in the master and fork it, so workers start instantly
+# and share the imported code pages
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# Modules the app imports on first use; with preload they are loaded in the
+# master too, so no worker pays for them on its first report or forecast
+PRELOAD_MODULES = ('pdf_reports', 'forecasting', 'anomalies')
+
+
+def when_ready(server):
+    if preload_app:
+        for name in PRELOAD_MODULES:
+            import_module(name)
+
+    # Every instance opens up to this many connections; keep the sum across
+    # instances under Postgres max_connections (or use DB_POOL_MODE=pgbouncer)
+    from db_pool import connections_per_process
+    per_worker = connections_per_process()
+    if per_worker is None:
+        server.log.info('Database pool: NullPool, connections are pooled by PgBouncer')
+    else:
+        server.log.info('Database pool: up to %d connections per worker, %d for this instance',
+                        per_worker, per_worker * workers)
+
+
+def post_fork(server, worker):
+    # Connections opened in the master must not be shared with the workers
+    if preload_app:
+        from app import db
+        from main import app
+        from db_pool import pool_metrics
+        with app.app_context():
+            db.engine.dispose(close=False)
+        pool_metrics.reset()
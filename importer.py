@@ -0,0 +1,256 @@
+import csv
+import io
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import insert
+from app import db
+from models import Transaction, summary_bucket, apply_summary_deltas, bump_data_version
+from quota import reserve_transactions
+from utils import brasilia_to_utc
+
+# Accepted CSV header names (lower case, accents removed) for each field
+CSV_COLUMNS = {
+    'date': ('date', 'data', 'data lancamento', 'data movimento'),
+    'description': ('description', 'descricao', 'historico', 'memo', 'lancamento'),
+    'amount': ('amount', 'valor', 'value'),
+    'transaction_type': ('type', 'tipo', 'transaction_type'),
+    'category': ('category', 'categoria'),
+}
+
+CSV_DATE_FORMATS = ('%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y', '%d/%m/%y')
+
+# Transaction.amount is Numeric(15, 2): at most 13 digits before the decimal point
+AMOUNT_LIMIT = Decimal(10) ** 13
+
+INCOME_TYPES = ('income', 'receita', 'credito', 'crédito', 'credit', 'c')
+EXPENSE_TYPES = ('expense', 'despesa', 'debito', 'débito', 'debit', 'd')
+
+
+class StatementImportError(Exception):
+    """Raised when a statement cannot be parsed or exceeds the plan limit"""
+
+
+def _normalize_header(name):
+    name = (name or '').strip().lower()
+    for accented, plain in (('ç', 'c'), ('ã', 'a'), ('á', 'a'), ('é', 'e'), ('í', 'i'), ('ó', 'o'), ('õ', 'o')):
+        name = name.replace(accented, plain)
+    return name
+
+
+def parse_amount(value):
+    """Parse '1.234,56', '1,234.56', '1234.56' or '-R$ 10,00' into a Decimal"""
+    value = (value or '').strip().replace('R$', '').replace(' ', '')
+    # Whichever separator comes last is the decimal one; the other groups thousands
+    if value.rfind(',') > value.rfind('.'):
+        value = value.replace('.', '').replace(',', '.')
+    else:
+        value = value.replace(',', '')
+    try:
+        amount = Decimal(value)
+    except InvalidOperation:
+        raise StatementImportError(f'Valor inválido: {value!r}')
+    if not amount.is_finite():
+        raise StatementImportError(f'Valor inválido: {value!r}')
+    if abs(amount) >= AMOUNT_LIMIT:
+        raise StatementImportError(f'Valor acima do limite: {value!r}')
+    return amount
+
+
+def parse_date(value):
+    value = (value or '').strip()
+    for date_format in CSV_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+    raise StatementImportError(f'Data inválida: {value!r}')
+
+
+def build_transaction_row(date, description, amount, transaction_type=None, category=None):
+    """Map parsed statement fields to Transaction column values"""
+    if transaction_type:
+        transaction_type = transaction_type.strip().lower()
+        if transaction_type in INCOME_TYPES:
+            transaction_type = 'income'
+        elif transaction_type in EXPENSE_TYPES:
+            transaction_type = 'expense'
+        else:
+            raise StatementImportError(f'Tipo inválido: {transaction_type!r}')
+    else:
+        transaction_type = 'income' if amount >= 0 else 'expense'
+
+    return {
+        'description': (description or 'Importado').strip()[:200],
+        'amount': abs(amount),
+        'transaction_type': transaction_type,
+        'category': (category or 'outros').strip()[:100] or None,
+        'date': brasilia_to_utc(date),
+    }
+
+
+def iter_csv_rows(stream):
+    """Stream-parse a CSV statement (seekable binary file object) into row dicts"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=';,\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(text, dialect)
+
+    header = next(reader, None)
+    if not header:
+        return
+    positions = {}
+    normalized = [_normalize_header(name) for name in header]
+    for field, names in CSV_COLUMNS.items():
+        for index, name in enumerate(normalized):
+            if name in names:
+                positions[field] = index
+                break
+    missing = {'date', 'amount'} - set(positions)
+    if missing:
+        raise StatementImportError('Colunas obrigatórias ausentes: ' + ', '.join(sorted(missing)))
+
+    def column(values, field):
+        index = positions.get(field)
+        return values[index] if index is not None and index < len(values) else None
+
+    for line_number, values in enumerate(reader, start=2):
+        if not any(value.strip() for value in values):
+            continue
+        try:
+            yield build_transaction_row(
+                parse_date(column(values, 'date')),
+                column(values, 'description'),
+                parse_amount(column(values, 'amount')),
+                column(values, 'transaction_type'),
+                column(values, 'category')
+            )
+        except StatementImportError as e:
+            raise StatementImportError(f'Linha {line_number}: {e}')
+
+
+OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+
+def _iter_ofx_tags(stream, chunk_size=65536):
+    """Yield (closing, tag, value) tokens from an OFX file without loading it whole"""
+    leftover = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode('latin-1')
+        data = leftover + chunk
+        # Keep the trailing, possibly incomplete tag for the next chunk
+        cut = data.rfind('<')
+        data, leftover = data[:cut], data[cut:]
+        for closing, tag, value in OFX_TAG.findall(data):
+            yield closing == '/', tag.upper(), value.strip()
+    for closing, tag, value in OFX_TAG.findall(leftover):
+        yield closing == '/', tag.upper(), value.strip()
+
+
+def iter_ofx_rows(stream):
+    """Stream-parse an OFX (SGML or XML) statement into row dicts"""
+    current = None
+    number = 0
+    for closing, tag, value in _iter_ofx_tags(stream):
+        if tag == 'STMTTRN':
+            if closing and current is not None:
+                if 'DTPOSTED' not in current or 'TRNAMT' not in current:
+                    raise StatementImportError(f'Transação {number}: sem data ou valor.')
+                try:
+                    yield build_transaction_row(
+                        datetime.strptime(current['DTPOSTED'][:8], '%Y%m%d'),
+                        current.get('MEMO') or current.get('NAME'),
+                        parse_amount(current['TRNAMT'])
+                    )
+                except StatementImportError as e:
+                    raise StatementImportError(f'Transação {number}: {e}')
+                current = None
+            elif not closing:
+                current = {}
+                number += 1
+        elif current is not None and not closing and value:
+            current[tag] = value
+
+
+def iter_statement_rows(stream, filename):
+    """Pick the parser from the file extension"""
+    if filename.lower().endswith(('.ofx', '.qfx')):
+        return iter_ofx_rows(stream)
+    return iter_csv_rows(stream)
+
+
+def import_transactions(user, rows, batch_size=5000):
+    """Insert parsed rows for user in batches; all-or-nothing within one transaction.
+
+    The plan's monthly transactions_limit is enforced for the whole import:
+    each batch is reserved against the quota before it is inserted, and if
+    the rows would exceed it nothing is inserted and StatementImportError is
+    raised.
+    """
+    limit = user.get_plan_features()['transactions_limit']
+
+    def insert(batch):
+        if not reserve_transactions(db.session.connection(), user.id, len(batch), limit):
+            raise StatementImportError(
+                f'O arquivo excede o limite mensal de transações do seu plano ({limit}).'
+            )
+        _insert_batch(batch)
+
+    imported = 0
+    batch = []
+    try:
+        for row in rows:
+            row['user_id'] = user.id
+            batch.append(row)
+            if len(batch) >= batch_size:
+                insert(batch)
+                imported += len(batch)
+                batch = []
+        if batch:
+            insert(batch)
+            imported += len(batch)
+        if imported:
+            bump_data_version(db.session.connection(), [user.id])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return imported
+
+
+def _insert_batch(batch):
+    """executemany insert plus the matching MonthlySummary deltas; returns the new ids in order"""
+    connection = db.session.connection()
+    result = connection.execute(
+        insert(Transaction).returning(Transaction.id, sort_by_parameter_order=True), batch
+    )
+    ids = result.scalars().all()
+
+    deltas = {}
+    for row in batch:
+        bucket = summary_bucket(row['user_id'], row['date'], row['transaction_type'], row['category'])
+        amount, count = deltas.get(bucket, (0, 0))
+        deltas[bucket] = (amount + row['amount'], count + 1)
+    apply_summary_deltas(connection, deltas)
+    return ids
+
+
+def insert_transactions(user, rows):
+    """Insert built rows for user in one executemany and bump the data version.
+
+    The caller owns the transaction (commit or rollback). Returns the new ids
+    in the order of rows.
+    """
+    for row in rows:
+        row['user_id'] = user.id
+    ids = _insert_batch(rows)
+    bump_data_version(db.session.connection(), [user.id])
+    return ids
@@ -0,0 +1,53 @@
+import hmac
+from flask import Blueprint, abort, current_app, jsonify, request, Response
+from app import db
+from db_pool import pool_status
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+def _authorized():
+    """Metrics need METRICS_TOKEN as a bearer token; without one configured they are off"""
+    expected = current_app.config.get('METRICS_TOKEN')
+    if not expected:
+        abort(404)
+    scheme, _, secret = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(secret.strip().encode(), expected.encode()):
+        abort(401)
+
+
+def _prometheus(prefix, values, labels=''):
+    """Flatten nested numeric values into Prometheus text lines"""
+    lines = []
+    for name, value in values.items():
+        if isinstance(value, dict):
+            lines.extend(_prometheus(f'{prefix}_{name}', value, labels))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            lines.append(f'{prefix}_{name}{labels} {value}')
+    return lines
+
+
+@metrics_bp.route('/db-pool')
+def db_pool():
+    """Connection pool state of the worker that answers (each worker has its own pool)"""
+    _authorized()
+    status = pool_status(db.engine, current_app.config)
+    if request.args.get('format') != 'prometheus':
+        return jsonify(status)
+
+    wait = status.pop('wait')
+    labels = f'{{pid="{status.pop("pid")}",mode="{status.pop("mode")}"}}'
+    lines = _prometheus('financeiro_db_pool', status, labels)
+    for bound, count in _cumulative(wait.pop('buckets')):
+        lines.append(f'financeiro_db_pool_wait_seconds_bucket{{le="{bound}",{labels[1:]} {count}')
+    lines.append(f'financeiro_db_pool_wait_seconds_sum{labels} {wait["total_seconds"]}')
+    lines.append(f'financeiro_db_pool_wait_seconds_count{labels} {wait["count"]}')
+    lines.append(f'financeiro_db_pool_wait_seconds_max{labels} {wait["max_seconds"]}')
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+def _cumulative(buckets):
+    total = 0
+    for bound, count in buckets.items():
+        total += count
+        yield bound, total
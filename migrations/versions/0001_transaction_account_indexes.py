@@ -0,0 +1,41 @@
+"""Composite indexes for Transaction and Account
+
+Revision ID: 0001_transaction_account_indexes
+Revises:
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001_transaction_account_indexes'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_transaction_user_date', 'transaction', ['user_id', 'date']),
+    ('ix_transaction_user_type_date', 'transaction', ['user_id', 'transaction_type', 'date']),
+    ('ix_account_user_type_status_due', 'account', ['user_id', 'account_type', 'status', 'due_date']),
+]
+
+
+def _existing_indexes(table):
+    inspector = sa.inspect(op.get_bind())
+    return {index['name'] for index in inspector.get_indexes(table)}
+
+
+def upgrade():
+    # Tables created by db.create_all() may already carry these indexes
+    for name, table, columns in INDEXES:
+        if name not in _existing_indexes(table):
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        if name in _existing_indexes(table):
+            op.drop_index(name, table_name=table)
@@ -0,0 +1,33 @@
+"""Add User.data_version for cache invalidation
+
+Revision ID: 0002_user_data_version
+Revises: 0001_transaction_account_indexes
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_user_data_version'
+down_revision = '0001_transaction_account_indexes'
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table, column):
+    inspector = sa.inspect(op.get_bind())
+    return column in {c['name'] for c in inspector.get_columns(table)}
+
+
+def upgrade():
+    if not _has_column('user', 'data_version'):
+        with op.batch_alter_table('user') as batch_op:
+            batch_op.add_column(sa.Column('data_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    if _has_column('user', 'data_version'):
+        with op.batch_alter_table('user') as batch_op:
+            batch_op.drop_column('data_version')
@@ -0,0 +1,33 @@
+"""Add User.data_updated_at for conditional GET
+
+Revision ID: 0003_user_data_updated_at
+Revises: 0002_user_data_version
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_user_data_updated_at'
+down_revision = '0002_user_data_version'
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table, column):
+    inspector = sa.inspect(op.get_bind())
+    return column in {c['name'] for c in inspector.get_columns(table)}
+
+
+def upgrade():
+    if not _has_column('user', 'data_updated_at'):
+        with op.batch_alter_table('user') as batch_op:
+            batch_op.add_column(sa.Column('data_updated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    if _has_column('user', 'data_updated_at'):
+        with op.batch_alter_table('user') as batch_op:
+            batch_op.drop_column('data_updated_at')
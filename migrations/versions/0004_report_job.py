@@ -0,0 +1,45 @@
+"""Add ReportJob table for background PDF rendering
+
+Revision ID: 0004_report_job
+Revises: 0003_user_data_updated_at
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004_report_job'
+down_revision = '0003_user_data_updated_at'
+branch_labels = None
+depends_on = None
+
+
+def _has_table(table):
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def upgrade():
+    if _has_table('report_job'):
+        return
+    op.create_table(
+        'report_job',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('user.id'), nullable=False),
+        sa.Column('report_type', sa.String(30), nullable=False),
+        sa.Column('params', sa.String(200), nullable=False),
+        sa.Column('data_version', sa.Integer(), nullable=False),
+        sa.Column('cache_key', sa.String(300), nullable=False, unique=True),
+        sa.Column('status', sa.String(20), nullable=False),
+        sa.Column('file_path', sa.String(500)),
+        sa.Column('error', sa.String(500)),
+        sa.Column('created_at', sa.DateTime()),
+        sa.Column('started_at', sa.DateTime()),
+        sa.Column('finished_at', sa.DateTime()),
+    )
+
+
+def downgrade():
+    if _has_table('report_job'):
+        op.drop_table('report_job')
@@ -0,0 +1,63 @@
+"""Track materialized occurrences of recurring transactions
+
+Revision ID: 0005_transaction_recurrence
+Revises: 0004_report_job
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005_transaction_recurrence'
+down_revision = '0004_report_job'
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table, column):
+    inspector = sa.inspect(op.get_bind())
+    return column in {c['name'] for c in inspector.get_columns(table)}
+
+
+def _has_index(table, name):
+    inspector = sa.inspect(op.get_bind())
+    names = {i['name'] for i in inspector.get_indexes(table)}
+    names |= {c['name'] for c in inspector.get_unique_constraints(table)}
+    return name in names
+
+
+def _has_foreign_key(table, name):
+    inspector = sa.inspect(op.get_bind())
+    return name in {fk['name'] for fk in inspector.get_foreign_keys(table)}
+
+
+def upgrade():
+    with op.batch_alter_table('transaction') as batch_op:
+        if not _has_column('transaction', 'last_occurrence_date'):
+            batch_op.add_column(sa.Column('last_occurrence_date', sa.DateTime()))
+        if not _has_column('transaction', 'recurrence_parent_id'):
+            batch_op.add_column(sa.Column('recurrence_parent_id', sa.Integer()))
+            batch_op.create_foreign_key('fk_transaction_recurrence_parent', 'transaction',
+                                        ['recurrence_parent_id'], ['id'])
+        if not _has_index('transaction', 'uq_transaction_recurrence_occurrence'):
+            batch_op.create_unique_constraint('uq_transaction_recurrence_occurrence',
+                                              ['recurrence_parent_id', 'date'])
+    if not _has_index('transaction', 'ix_transaction_recurring_series'):
+        op.create_index('ix_transaction_recurring_series', 'transaction', ['recurrence_type'],
+                        postgresql_where=sa.text('is_recurring'), sqlite_where=sa.text('is_recurring'))
+
+
+def downgrade():
+    if _has_index('transaction', 'ix_transaction_recurring_series'):
+        op.drop_index('ix_transaction_recurring_series', table_name='transaction')
+    with op.batch_alter_table('transaction') as batch_op:
+        if _has_index('transaction', 'uq_transaction_recurrence_occurrence'):
+            batch_op.drop_constraint('uq_transaction_recurrence_occurrence', type_='unique')
+        if _has_foreign_key('transaction', 'fk_transaction_recurrence_parent'):
+            batch_op.drop_constraint('fk_transaction_recurrence_parent', type_='foreignkey')
+        if _has_column('transaction', 'recurrence_parent_id'):
+            batch_op.drop_column('recurrence_parent_id')
+        if _has_column('transaction', 'last_occurrence_date'):
+            batch_op.drop_column('last_occurrence_date')
@@ -0,0 +1,31 @@
+"""Index Account (status, due_date) for the overdue sweep
+
+Revision ID: 0006_account_status_due_index
+Revises: 0005_transaction_recurrence
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006_account_status_due_index'
+down_revision = '0005_transaction_recurrence'
+branch_labels = None
+depends_on = None
+
+
+def _existing_indexes(table):
+    inspector = sa.inspect(op.get_bind())
+    return {index['name'] for index in inspector.get_indexes(table)}
+
+
+def upgrade():
+    if 'ix_account_status_due' not in _existing_indexes('account'):
+        op.create_index('ix_account_status_due', 'account', ['status', 'due_date'])
+
+
+def downgrade():
+    if 'ix_account_status_due' in _existing_indexes('account'):
+        op.drop_index('ix_account_status_due', table_name='account')
@@ -0,0 +1,43 @@
+"""Add ApiToken table for the JSON API
+
+Revision ID: 0007_api_token
+Revises: 0006_account_status_due_index
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007_api_token'
+down_revision = '0006_account_status_due_index'
+branch_labels = None
+depends_on = None
+
+
+def _has_table(table):
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def upgrade():
+    if _has_table('api_token'):
+        return
+    op.create_table(
+        'api_token',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('user.id'), nullable=False),
+        sa.Column('name', sa.String(100), nullable=False),
+        sa.Column('token_hash', sa.String(64), nullable=False, unique=True),
+        sa.Column('prefix', sa.String(12), nullable=False),
+        sa.Column('created_at', sa.DateTime()),
+        sa.Column('last_used_at', sa.DateTime()),
+        sa.Column('revoked_at', sa.DateTime()),
+    )
+    op.create_index('ix_api_token_user_id', 'api_token', ['user_id'])
+
+
+def downgrade():
+    if _has_table('api_token'):
+        op.drop_index('ix_api_token_user_id', table_name='api_token')
+        op.drop_table('api_token')
@@ -0,0 +1,60 @@
+"""Add MonthlyUsage counters for the monthly transaction quota
+
+Revision ID: 0008_monthly_usage
+Revises: 0007_api_token
+Create Date: 2026-10-18 00:00:00
+
+"""
+from datetime import datetime
+from alembic import op
+import pytz
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008_monthly_usage'
+down_revision = '0007_api_token'
+branch_labels = None
+depends_on = None
+
+
+def _has_table(table):
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def _is_empty(table):
+    return op.get_bind().execute(sa.text(f'SELECT 1 FROM {table} LIMIT 1')).first() is None
+
+
+def upgrade():
+    if not _has_table('monthly_usage'):
+        op.create_table(
+            'monthly_usage',
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('user.id'), primary_key=True),
+            sa.Column('year', sa.Integer(), primary_key=True, autoincrement=False),
+            sa.Column('month', sa.Integer(), primary_key=True, autoincrement=False),
+            sa.Column('transactions', sa.Integer(), nullable=False, server_default='0'),
+        )
+
+    # The table may predate this revision (created empty by db.create_all()),
+    # so seed whenever it holds no counters yet
+    if not _is_empty('monthly_usage'):
+        return
+
+    # Start the current Brasilia month with the transactions already created in it
+    local_tz = pytz.timezone('America/Sao_Paulo')
+    now = datetime.now(local_tz)
+    month_start = local_tz.localize(datetime(now.year, now.month, 1)).astimezone(pytz.utc).replace(tzinfo=None)
+    op.get_bind().execute(
+        sa.text(
+            'INSERT INTO monthly_usage (user_id, year, month, transactions) '
+            'SELECT user_id, :year, :month, COUNT(*) FROM "transaction" '
+            'WHERE created_at >= :start GROUP BY user_id'
+        ),
+        {'year': now.year, 'month': now.month, 'start': month_start}
+    )
+
+
+def downgrade():
+    if _has_table('monthly_usage'):
+        op.drop_table('monthly_usage')
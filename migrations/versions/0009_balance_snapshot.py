@@ -0,0 +1,59 @@
+"""Add BalanceSnapshot with each user's all-time totals
+
+Revision ID: 0009_balance_snapshot
+Revises: 0008_monthly_usage
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009_balance_snapshot'
+down_revision = '0008_monthly_usage'
+branch_labels = None
+depends_on = None
+
+
+def _has_table(table):
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def _is_empty(table):
+    return op.get_bind().execute(sa.text(f'SELECT 1 FROM {table} LIMIT 1')).first() is None
+
+
+def upgrade():
+    if not _has_table('balance_snapshot'):
+        op.create_table(
+            'balance_snapshot',
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('user.id'), primary_key=True, autoincrement=False),
+            sa.Column('total_income', sa.Numeric(15, 2), nullable=False, server_default='0'),
+            sa.Column('total_expenses', sa.Numeric(15, 2), nullable=False, server_default='0'),
+            sa.Column('balance', sa.Numeric(15, 2), nullable=False, server_default='0'),
+            sa.Column('transaction_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('updated_at', sa.DateTime()),
+        )
+
+    # The table may predate this revision (created empty by db.create_all()),
+    # so seed whenever it holds no snapshots yet
+    if not _is_empty('balance_snapshot'):
+        return
+
+    # Seed from the ledger; later writes keep it current
+    op.execute(
+        "INSERT INTO balance_snapshot "
+        "(user_id, total_income, total_expenses, balance, transaction_count, updated_at) "
+        "SELECT user_id, "
+        "COALESCE(SUM(CASE WHEN transaction_type = 'income' THEN amount ELSE 0 END), 0), "
+        "COALESCE(SUM(CASE WHEN transaction_type = 'income' THEN 0 ELSE amount END), 0), "
+        "COALESCE(SUM(CASE WHEN transaction_type = 'income' THEN amount ELSE -amount END), 0), "
+        "COUNT(*), CURRENT_TIMESTAMP "
+        'FROM "transaction" GROUP BY user_id'
+    )
+
+
+def downgrade():
+    if _has_table('balance_snapshot'):
+        op.drop_table('balance_snapshot')
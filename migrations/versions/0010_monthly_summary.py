@@ -0,0 +1,88 @@
+"""Create and seed the MonthlySummary rollup on databases that predate it
+
+Databases created by db.create_all() may already have the table; it is
+seeded from the ledger whenever it is empty.
+
+Revision ID: 0010_monthly_summary
+Revises: 0009_balance_snapshot
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import pytz
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010_monthly_summary'
+down_revision = '0009_balance_snapshot'
+branch_labels = None
+depends_on = None
+
+
+def _has_table(table):
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def _is_empty(table):
+    return op.get_bind().execute(sa.text(f'SELECT 1 FROM {table} LIMIT 1')).first() is None
+
+
+def _local_date_sql(dialect):
+    """SQL for the Brasilia local time of "transaction".date, historical offsets included"""
+    if dialect == 'postgresql':
+        return "timezone('America/Sao_Paulo', timezone('UTC', date))"
+    # SQLite: the offset in effect at each timestamp, from pytz's transitions
+    tz = pytz.timezone('America/Sao_Paulo')
+    periods = []
+    for start, (offset, _, _) in zip(tz._utc_transition_times, tz._transition_info):
+        seconds = int(offset.total_seconds())
+        if not periods or periods[-1][1] != seconds:
+            periods.append((start, seconds))
+    whens = ' '.join(
+        f"WHEN date >= '{start:%Y-%m-%d %H:%M:%S}' THEN '{seconds:+d} seconds'"
+        for start, seconds in reversed(periods[1:])
+    )
+    return f"datetime(date, CASE {whens} ELSE '{periods[0][1]:+d} seconds' END)"
+
+
+def upgrade():
+    if not _has_table('monthly_summary'):
+        op.create_table(
+            'monthly_summary',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('user.id'), nullable=False),
+            sa.Column('year', sa.Integer(), nullable=False),
+            sa.Column('month', sa.Integer(), nullable=False),
+            sa.Column('transaction_type', sa.String(20), nullable=False),
+            sa.Column('category', sa.String(100), nullable=False, server_default=''),
+            sa.Column('total', sa.Numeric(15, 2), nullable=False, server_default='0'),
+            sa.Column('transaction_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.UniqueConstraint('user_id', 'year', 'month', 'transaction_type', 'category',
+                                name='uq_monthly_summary_bucket'),
+        )
+
+    if not _is_empty('monthly_summary'):
+        return
+
+    # Seed from the ledger by Brasilia local month, as `flask rebuild-summaries` does
+    dialect = op.get_bind().dialect.name
+    local_date = _local_date_sql(dialect)
+    if dialect == 'sqlite':
+        year = f"CAST(strftime('%Y', {local_date}) AS INTEGER)"
+        month = f"CAST(strftime('%m', {local_date}) AS INTEGER)"
+    else:
+        year = f'CAST(EXTRACT(year FROM {local_date}) AS INTEGER)'
+        month = f'CAST(EXTRACT(month FROM {local_date}) AS INTEGER)'
+    op.execute(
+        "INSERT INTO monthly_summary "
+        "(user_id, year, month, transaction_type, category, total, transaction_count) "
+        f"SELECT user_id, {year}, {month}, transaction_type, COALESCE(category, ''), SUM(amount), COUNT(*) "
+        'FROM "transaction" WHERE date IS NOT NULL '
+        f"GROUP BY user_id, {year}, {month}, transaction_type, COALESCE(category, '')"
+    )
+
+
+def downgrade():
+    # The rollup predates the migration history; leave it in place
+    pass
@@ -1,8 +1,14 @@
+import hashlib
+import secrets
 from datetime import datetime, timedelta
 from app import db
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import func
+from passwords import hash_password, verify_password, needs_rehash
+from sqlalchemy import func, event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from itertools import chain
+from utils import utc_to_brasilia
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -21,15 +27,22 @@ class User(UserMixin, db.Model):
     subscription_status = db.Column(db.String(20), default='trial')  # trial, active, expired, cancelled
     subscription_end_date = db.Column(db.DateTime)
     
+    # Bumped on every write to the user's financial data; used in cache keys
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    data_updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
     # Relationships
     transactions = db.relationship('Transaction', backref='user', lazy=True, cascade='all, delete-orphan')
     accounts = db.relationship('Account', backref='user', lazy=True, cascade='all, delete-orphan')
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return needs_rehash(self.password_hash)
     
     def is_trial_expired(self):
         return datetime.utcnow() > self.trial_end_date
@@ -48,33 +61,46 @@ class User(UserMixin, db.Model):
                 'transactions_limit': 10,
                 'reports': False,
                 'automation': False,
-                'multi_user': False
+                'multi_user': False,
+                'api': False
             },
             'mei': {
                 'name': 'Plano MEI',
                 'transactions_limit': 100,
                 'reports': True,
                 'automation': False,
-                'multi_user': False
+                'multi_user': False,
+                'api': False
             },
             'professional': {
                 'name': 'Plano Profissional',
                 'transactions_limit': 500,
                 'reports': True,
                 'automation': True,
-                'multi_user': False
+                'multi_user': False,
+                'api': False
             },
             'enterprise': {
                 'name': 'Plano Empresarial',
                 'transactions_limit': -1,  # unlimited
                 'reports': True,
                 'automation': True,
-                'multi_user': True
+                'multi_user': True,
+                'api': True
             }
         }
         return features.get(self.subscription_plan, features['trial'])
 
 class Transaction(db.Model):
+    __table_args__ = (
+        db.Index('ix_transaction_user_date', 'user_id', 'date'),
+        db.Index('ix_transaction_user_type_date', 'user_id', 'transaction_type', 'date'),
+        # One materialized row per series occurrence; makes re-runs harmless
+        db.UniqueConstraint('recurrence_parent_id', 'date', name='uq_transaction_recurrence_occurrence'),
+        db.Index('ix_transaction_recurring_series', 'recurrence_type',
+                 postgresql_where=db.text('is_recurring'), sqlite_where=db.text('is_recurring')),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     description = db.Column(db.String(200), nullable=False)
@@ -85,9 +111,22 @@ class Transaction(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_recurring = db.Column(db.Boolean, default=False)
     recurrence_type = db.Column(db.String(20))  # monthly, weekly, yearly
+    # Series rows: date of the last materialized occurrence
+    last_occurrence_date = db.Column(db.DateTime)
+    # Materialized rows: the series they were generated from
+    recurrence_parent_id = db.Column(db.Integer, db.ForeignKey('transaction.id', name='fk_transaction_recurrence_parent'))
     account_id = db.Column(db.Integer, db.ForeignKey('account.id'))
 
+# Account statuses that still await payment
+OPEN_ACCOUNT_STATUSES = ('pending', 'overdue')
+
 class Account(db.Model):
+    __table_args__ = (
+        db.Index('ix_account_user_type_status_due', 'user_id', 'account_type', 'status', 'due_date'),
+        # Serves the overdue sweep: pending rows past their due date
+        db.Index('ix_account_status_due', 'status', 'due_date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
@@ -114,3 +153,244 @@ class FinancialGoal(db.Model):
         if self.target_amount == 0:
             return 0
         return min(100, (float(self.current_amount) / float(self.target_amount)) * 100)
+
+class MonthlySummary(db.Model):
+    """Per-user monthly totals, kept in sync with Transaction on every write"""
+    __tablename__ = 'monthly_summary'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'year', 'month', 'transaction_type', 'category',
+                            name='uq_monthly_summary_bucket'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    transaction_type = db.Column(db.String(20), nullable=False)
+    category = db.Column(db.String(100), nullable=False, default='')  # '' means no category
+    total = db.Column(db.Numeric(15, 2), nullable=False, default=0)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+
+class BalanceSnapshot(db.Model):
+    """All-time totals per user, kept in step with the MonthlySummary rollup"""
+    __tablename__ = 'balance_snapshot'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True, autoincrement=False)
+    total_income = db.Column(db.Numeric(15, 2), nullable=False, default=0)
+    total_expenses = db.Column(db.Numeric(15, 2), nullable=False, default=0)
+    balance = db.Column(db.Numeric(15, 2), nullable=False, default=0)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class MonthlyUsage(db.Model):
+    """Transactions created per user and Brasilia calendar month, metered against the plan limit"""
+    __tablename__ = 'monthly_usage'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    month = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    transactions = db.Column(db.Integer, nullable=False, default=0)
+
+class ReportJob(db.Model):
+    """Background report render; finished files are reused while the data is unchanged"""
+    __tablename__ = 'report_job'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    report_type = db.Column(db.String(30), nullable=False)  # summary
+    params = db.Column(db.String(200), nullable=False, default='')
+    data_version = db.Column(db.Integer, nullable=False)
+    cache_key = db.Column(db.String(300), unique=True, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    file_path = db.Column(db.String(500))
+    error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)  # reset when the job is requeued
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+class ApiToken(db.Model):
+    """Bearer token for the JSON API; only a SHA-256 digest of the secret is stored"""
+    __tablename__ = 'api_token'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    name = db.Column(db.String(100), nullable=False)
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)
+    prefix = db.Column(db.String(12), nullable=False)  # shown to the user to tell tokens apart
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime)
+    revoked_at = db.Column(db.DateTime)
+
+    @staticmethod
+    def hash_token(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def issue(cls, user, name):
+        """Create a token for user; returns (ApiToken, secret). The secret is shown once."""
+        secret = 'fi_' + secrets.token_urlsafe(32)
+        token = cls(user_id=user.id, name=name, token_hash=cls.hash_token(secret), prefix=secret[:10])
+        db.session.add(token)
+        return token, secret
+
+# Rollup maintenance: every ORM write to Transaction updates MonthlySummary in
+# the same database transaction. Bulk Core inserts must call
+# apply_summary_deltas() themselves.
+
+def summary_bucket(user_id, date, transaction_type, category):
+    """Return the MonthlySummary key for a transaction, by Brasilia local month"""
+    local = utc_to_brasilia(date or datetime.utcnow())
+    return (user_id, local.year, local.month, transaction_type, category or '')
+
+def apply_summary_deltas(connection, deltas):
+    """Add {bucket: (amount, count)} deltas to MonthlySummary rows and the users' BalanceSnapshot"""
+    _apply_summary_rows(connection, deltas)
+
+    balances = {}
+    for (user_id, _, _, transaction_type, _), (amount, count) in deltas.items():
+        income, expenses, total = balances.get(user_id, (0, 0, 0))
+        if transaction_type == 'income':
+            income += amount
+        else:
+            expenses += amount
+        balances[user_id] = (income, expenses, total + count)
+    apply_balance_deltas(connection, balances)
+
+def _apply_summary_rows(connection, deltas):
+    table = MonthlySummary.__table__
+    for (user_id, year, month, transaction_type, category), (amount, count) in deltas.items():
+        values = {
+            'user_id': user_id,
+            'year': year,
+            'month': month,
+            'transaction_type': transaction_type,
+            'category': category,
+            'total': amount,
+            'transaction_count': count
+        }
+        dialect = connection.dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            stmt = insert(table).values(**values)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['user_id', 'year', 'month', 'transaction_type', 'category'],
+                set_={
+                    'total': table.c.total + stmt.excluded.total,
+                    'transaction_count': table.c.transaction_count + stmt.excluded.transaction_count
+                }
+            )
+            connection.execute(stmt)
+            continue
+
+        result = connection.execute(
+            table.update().where(
+                table.c.user_id == user_id,
+                table.c.year == year,
+                table.c.month == month,
+                table.c.transaction_type == transaction_type,
+                table.c.category == category
+            ).values(
+                total=table.c.total + amount,
+                transaction_count=table.c.transaction_count + count
+            )
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(**values))
+
+def apply_balance_deltas(connection, deltas):
+    """Add {user_id: (income, expenses, count)} deltas to BalanceSnapshot rows"""
+    table = BalanceSnapshot.__table__
+    now = datetime.utcnow()
+    for user_id, (income, expenses, count) in deltas.items():
+        values = {
+            'user_id': user_id,
+            'total_income': income,
+            'total_expenses': expenses,
+            'balance': income - expenses,
+            'transaction_count': count,
+            'updated_at': now
+        }
+        dialect = connection.dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            stmt = insert(table).values(**values)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['user_id'],
+                set_={
+                    'total_income': table.c.total_income + stmt.excluded.total_income,
+                    'total_expenses': table.c.total_expenses + stmt.excluded.total_expenses,
+                    'balance': table.c.balance + stmt.excluded.balance,
+                    'transaction_count': table.c.transaction_count + stmt.excluded.transaction_count,
+                    'updated_at': stmt.excluded.updated_at
+                }
+            )
+            connection.execute(stmt)
+            continue
+
+        result = connection.execute(
+            table.update().where(table.c.user_id == user_id).values(
+                total_income=table.c.total_income + income,
+                total_expenses=table.c.total_expenses + expenses,
+                balance=table.c.balance + (income - expenses),
+                transaction_count=table.c.transaction_count + count,
+                updated_at=now
+            )
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(**values))
+
+@event.listens_for(Transaction, 'after_insert')
+def _summary_after_insert(mapper, connection, target):
+    bucket = summary_bucket(target.user_id, target.date, target.transaction_type, target.category)
+    apply_summary_deltas(connection, {bucket: (target.amount, 1)})
+
+@event.listens_for(Transaction, 'after_delete')
+def _summary_after_delete(mapper, connection, target):
+    bucket = summary_bucket(target.user_id, target.date, target.transaction_type, target.category)
+    apply_summary_deltas(connection, {bucket: (-target.amount, -1)})
+
+@event.listens_for(Transaction, 'after_update')
+def _summary_after_update(mapper, connection, target):
+    state = inspect(target)
+    fields = ('user_id', 'date', 'transaction_type', 'category', 'amount')
+    if not any(state.attrs[name].history.has_changes() for name in fields):
+        return
+    old = []
+    for name in fields:
+        history = state.attrs[name].history
+        old.append(history.deleted[0] if history.deleted else getattr(target, name))
+    new = [getattr(target, name) for name in fields]
+    old_bucket = summary_bucket(*old[:4])
+    new_bucket = summary_bucket(*new[:4])
+    deltas = {old_bucket: (-old[4], -1)}
+    amount, count = deltas.get(new_bucket, (0, 0))
+    deltas[new_bucket] = (amount + new[4], count + 1)
+    apply_summary_deltas(connection, deltas)
+
+# Data versioning: any flush that touches a user's transactions, accounts or
+# goals bumps User.data_version once for that user.
+
+@event.listens_for(Session, 'after_flush')
+def _bump_data_version(session, flush_context):
+    user_ids = {
+        obj.user_id
+        for obj in chain(session.new, session.dirty, session.deleted)
+        if isinstance(obj, (Transaction, Account, FinancialGoal)) and obj.user_id
+    }
+    if user_ids:
+        bump_data_version(session.connection(), user_ids)
+
+def bump_data_version(connection, user_ids):
+    """Increment data_version and stamp data_updated_at for the given users"""
+    table = User.__table__
+    connection.execute(
+        table.update().where(table.c.id.in_(list(user_ids))).values(
+            data_version=table.c.data_version + 1,
+            data_updated_at=datetime.utcnow()
+        )
+    )
+    mark_users_changed(db.session, user_ids)
+
+def mark_users_changed(session, user_ids):
+    """Have the users' cached rows (see user_cache) invalidated once the session commits"""
+    session.info.setdefault('changed_user_ids', set()).update(user_ids)
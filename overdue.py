@@ -0,0 +1,52 @@
+import logging
+from datetime import datetime
+from blinker import Namespace
+from flask import current_app
+from sqlalchemy import select
+from app import db
+from models import Account, bump_data_version
+
+logger = logging.getLogger(__name__)
+
+signals = Namespace()
+
+# Sent after a sweep with accounts=[(account_id, user_id), ...] that just
+# became overdue; connect receivers here to send due-date alerts.
+accounts_overdue = signals.signal('accounts-overdue')
+
+
+def mark_overdue_accounts(now=None):
+    """Flip pending accounts past their due date to overdue; return the number changed.
+
+    A single UPDATE over the (status, due_date) index does the work. Where
+    the database supports UPDATE ... RETURNING the changed rows come back in
+    the same statement; they are used to bump the owners' data versions and
+    are passed to accounts_overdue receivers.
+    """
+    now = now or datetime.utcnow()
+    table = Account.__table__
+    predicate = (table.c.status == 'pending', table.c.due_date < now)
+    connection = db.session.connection()
+
+    if connection.dialect.update_returning:
+        changed = connection.execute(
+            table.update().where(*predicate).values(status='overdue')
+            .returning(table.c.id, table.c.user_id)
+        ).all()
+    else:
+        changed = connection.execute(select(table.c.id, table.c.user_id).where(*predicate)).all()
+        if changed:
+            connection.execute(
+                table.update().where(table.c.id.in_([account_id for account_id, _ in changed]))
+                .values(status='overdue')
+            )
+
+    if changed:
+        bump_data_version(connection, {user_id for _, user_id in changed})
+    db.session.commit()
+
+    if changed:
+        logger.info('%d accounts marked overdue', len(changed))
+        accounts_overdue.send(current_app._get_current_object(),
+                              accounts=[tuple(row) for row in changed])
+    return len(changed)
@@ -0,0 +1,67 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+_executor = None
+_slots = None
+_executor_lock = threading.Lock()
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when every hashing slot stays taken for PASSWORD_HASH_TIMEOUT seconds"""
+
+
+def init_password_hashing(app):
+    """Configure password hashing from PASSWORD_HASH_* settings"""
+    # Any werkzeug method string, e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'.
+    # Stored hashes made with other parameters are upgraded on the next login.
+    app.config.setdefault('PASSWORD_HASH_METHOD', os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1'))
+    # Hashes computed at once; the rest wait in line, up to PASSWORD_HASH_QUEUE of them
+    app.config.setdefault('PASSWORD_HASH_WORKERS', int(os.environ.get('PASSWORD_HASH_WORKERS', 2)))
+    app.config.setdefault('PASSWORD_HASH_QUEUE', int(os.environ.get('PASSWORD_HASH_QUEUE', 8)))
+    # Seconds a request waits for a free slot before giving up
+    app.config.setdefault('PASSWORD_HASH_TIMEOUT', float(os.environ.get('PASSWORD_HASH_TIMEOUT', 2)))
+
+
+def _run(fn, *args):
+    """Run a hashing call in the bounded pool and wait for its result.
+
+    Only PASSWORD_HASH_WORKERS hashes run at a time, so a login storm cannot
+    take every CPU from the other requests; callers beyond the queue get
+    PasswordHasherBusy instead of piling up behind it.
+    """
+    global _executor, _slots
+    config = current_app.config
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=config['PASSWORD_HASH_WORKERS'],
+                                           thread_name_prefix='password-hash')
+            _slots = threading.BoundedSemaphore(config['PASSWORD_HASH_WORKERS'] + config['PASSWORD_HASH_QUEUE'])
+    if not _slots.acquire(timeout=config['PASSWORD_HASH_TIMEOUT']):
+        raise PasswordHasherBusy()
+    try:
+        return _executor.submit(fn, *args).result()
+    finally:
+        _slots.release()
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, current_app.config['PASSWORD_HASH_METHOD'])
+
+
+def verify_password(password_hash, password):
+    return _run(check_password_hash, password_hash, password)
+
+
+@lru_cache(maxsize=8)
+def _hash_prefix(method):
+    """Full parameter string werkzeug writes for a method ('scrypt' -> 'scrypt:32768:8:1')"""
+    return generate_password_hash('', method).split('$', 1)[0]
+
+
+def needs_rehash(password_hash):
+    """True when a stored hash was made with other parameters than PASSWORD_HASH_METHOD"""
+    return password_hash.split('$', 1)[0] != _hash_prefix(current_app.config['PASSWORD_HASH_METHOD'])
@@ -0,0 +1,373 @@
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
+from sqlalchemy import select, func, case, or_, and_
+from reportlab.lib.pagesizes import A4
+from reportlab.lib import colors
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.enums import TA_CENTER
+from app import db
+from models import Transaction
+from utils import utc_to_brasilia, utc_to_brasilia_many, brasilia_to_utc
+from analytics import monthly_series, category_totals
+
+# Ledger rows fetched per query and rows per table flowable in statements
+STATEMENT_FETCH_SIZE = 1000
+STATEMENT_TABLE_ROWS = 60
+
+def render_summary_pdf(user, fileobj):
+    """Render the financial summary report for user into fileobj"""
+    doc = SimpleDocTemplate(
+        fileobj,
+        pagesize=A4,
+        rightMargin=72,
+        leftMargin=72,
+        topMargin=72,
+        bottomMargin=18
+    )
+    doc.build(build_pdf_content(user))
+
+def build_pdf_content(user):
+    """Build PDF content with financial data"""
+    content = []
+    styles = getSampleStyleSheet()
+    
+    # Custom styles
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        textColor=colors.HexColor('#1E40AF'),
+        alignment=TA_CENTER,
+        spaceAfter=30
+    )
+    
+    subtitle_style = ParagraphStyle(
+        'CustomSubtitle',
+        parent=styles['Heading2'],
+        fontSize=16,
+        textColor=colors.HexColor('#374151'),
+        spaceAfter=20
+    )
+    
+    # Title
+    content.append(Paragraph("Relatório Financeiro", title_style))
+    content.append(Paragraph("Financeiro Inteligente", styles['Normal']))
+    content.append(Spacer(1, 20))
+    
+    # User info and period
+    now = utc_to_brasilia(datetime.utcnow())
+    content.append(Paragraph(f"<b>Usuário:</b> {escape(user.full_name)}", styles['Normal']))
+    content.append(Paragraph(f"<b>Plano:</b> {user.get_plan_features()['name']}", styles['Normal']))
+    content.append(Paragraph(f"<b>Data:</b> {now.strftime('%d/%m/%Y às %H:%M')}", styles['Normal']))
+    content.append(Spacer(1, 20))
+    
+    # Financial summary
+    content.append(Paragraph("Resumo Financeiro", subtitle_style))
+    
+    # Get financial data
+    # Calculate monthly totals
+    current = monthly_series(user.id, months=1)[0]
+    monthly_income = current['income']
+    monthly_expenses = current['expenses']
+    monthly_balance = current['profit']
+    
+    # Summary table
+    summary_data = [
+        ['Item', 'Valor'],
+        ['Receitas do Mês', f'R$ {monthly_income:,.2f}'.replace(',', 'X').replace('.', ',').replace('X', '.')],
+        ['Despesas do Mês', f'R$ {monthly_expenses:,.2f}'.replace(',', 'X').replace('.', ',').replace('X', '.')],
+        ['Saldo do Mês', f'R$ {monthly_balance:,.2f}'.replace(',', 'X').replace('.', ',').replace('X', '.')]
+    ]
+    
+    summary_table = Table(summary_data, colWidths=[3*inch, 2*inch])
+    summary_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3B82F6')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    
+    content.append(summary_table)
+    content.append(Spacer(1, 30))
+    
+    # Recent transactions
+    content.append(Paragraph("Transações Recentes", subtitle_style))
+    
+    # Get recent transactions
+    recent_transactions = Transaction.query.filter_by(user_id=user.id)\
+        .order_by(Transaction.date.desc()).limit(10).all()
+    
+    if recent_transactions:
+        # Transactions table
+        trans_data = [['Data', 'Descrição', 'Categoria', 'Tipo', 'Valor']]
+        
+        for transaction in recent_transactions:
+            date_str = utc_to_brasilia(transaction.date).strftime('%d/%m/%Y') if transaction.date else '-'
+            type_str = 'Receita' if transaction.transaction_type == 'income' else 'Despesa'
+            amount_str = f'R$ {float(transaction.amount):,.2f}'.replace(',', 'X').replace('.', ',').replace('X', '.')
+            if transaction.transaction_type == 'expense':
+                amount_str = f'-{amount_str}'
+            else:
+                amount_str = f'+{amount_str}'
+                
+            trans_data.append([
+                date_str,
+                transaction.description[:25] + '...' if len(transaction.description) > 25 else transaction.description,
+                transaction.category or 'Sem categoria',
+                type_str,
+                amount_str
+            ])
+        
+        trans_table = Table(trans_data, colWidths=[1*inch, 2.5*inch, 1.5*inch, 1*inch, 1.5*inch])
+        trans_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3B82F6')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('FONTSIZE', (0, 1), (-1, -1), 8),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]))
+        
+        content.append(trans_table)
+    else:
+        content.append(Paragraph("Nenhuma transação encontrada.", styles['Normal']))
+    
+    content.append(Spacer(1, 30))
+    
+    # Category analysis
+    content.append(Paragraph("Análise por Categorias", subtitle_style))
+    
+    category_data = category_totals(user.id, 'expense')
+    
+    if category_data:
+        cat_data = [['Categoria', 'Total Gasto']]
+        for category, total in category_data:
+            cat_name = category or 'Sem categoria'
+            total_str = f'R$ {float(total):,.2f}'.replace(',', 'X').replace('.', ',').replace('X', '.')
+            cat_data.append([cat_name, total_str])
+        
+        cat_table = Table(cat_data, colWidths=[3*inch, 2*inch])
+        cat_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3B82F6')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 12),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]))
+        
+        content.append(cat_table)
+    else:
+        content.append(Paragraph("Nenhuma despesa por categoria encontrada.", styles['Normal']))
+    
+    content.append(Spacer(1, 30))
+    
+    # Footer
+    content.append(Paragraph(
+        f"Relatório gerado automaticamente pelo Financeiro Inteligente em {now.strftime('%d/%m/%Y às %H:%M')}",
+        ParagraphStyle(
+            'Footer',
+            parent=styles['Normal'],
+            fontSize=8,
+            textColor=colors.grey,
+            alignment=TA_CENTER
+        )
+    ))
+    
+    return content
+
+def format_brl(value):
+    return f'R$ {float(value):,.2f}'.replace(',', 'X').replace('.', ',').replace('X', '.')
+
+class LazyFlowables:
+    """List-like flowable queue for doc.build that pulls from a generator on demand.
+
+    ReportLab consumes the story from the front (and pushes split remainders
+    back), so only the flowables near the current page are ever held in memory.
+    """
+
+    def __init__(self, flowables, lookahead=2):
+        self._source = iter(flowables)
+        self._buffer = []
+        self._lookahead = lookahead
+
+    def _fill(self, count):
+        while self._source is not None and len(self._buffer) < count:
+            try:
+                self._buffer.append(next(self._source))
+            except StopIteration:
+                self._source = None
+
+    def __len__(self):
+        self._fill(self._lookahead)
+        return len(self._buffer)
+
+    def __getitem__(self, index):
+        if isinstance(index, int) and index >= 0:
+            self._fill(index + 1)
+        return self._buffer[index]
+
+    def __setitem__(self, index, value):
+        self._buffer[index] = value
+
+    def __delitem__(self, index):
+        del self._buffer[index]
+
+    def insert(self, index, value):
+        self._buffer.insert(index, value)
+
+def iter_statement_rows(user_id, start, end, fetch_size=STATEMENT_FETCH_SIZE):
+    """Yield (local date, description, category, type, amount) in [start, end), keyset-paged by (date, id)"""
+    last = None
+    while True:
+        query = select(
+            Transaction.id,
+            Transaction.date,
+            Transaction.description,
+            Transaction.category,
+            Transaction.transaction_type,
+            Transaction.amount
+        ).where(
+            Transaction.user_id == user_id,
+            Transaction.date >= start,
+            Transaction.date < end
+        )
+        if last:
+            query = query.where(or_(
+                Transaction.date > last[0],
+                and_(Transaction.date == last[0], Transaction.id > last[1])
+            ))
+        rows = db.session.execute(
+            query.order_by(Transaction.date, Transaction.id).limit(fetch_size)
+        ).all()
+        local_dates = utc_to_brasilia_many([row.date for row in rows])
+        for row, local_date in zip(rows, local_dates):
+            yield (local_date,) + tuple(row[2:])
+        if len(rows) < fetch_size:
+            return
+        last = (rows[-1].date, rows[-1].id)
+
+def statement_totals(user_id, start, end):
+    """Return (opening balance, income, expenses) for the period, computed in SQL"""
+    signed = case((Transaction.transaction_type == 'income', Transaction.amount), else_=-Transaction.amount)
+    in_period = and_(Transaction.date >= start, Transaction.date < end)
+    opening, income, expenses = db.session.execute(
+        select(
+            func.coalesce(func.sum(case((Transaction.date < start, signed), else_=0)), 0),
+            func.coalesce(func.sum(case((and_(in_period, Transaction.transaction_type == 'income'),
+                                         Transaction.amount), else_=0)), 0),
+            func.coalesce(func.sum(case((and_(in_period, Transaction.transaction_type == 'expense'),
+                                         Transaction.amount), else_=0)), 0)
+        ).where(Transaction.user_id == user_id, Transaction.date < end)
+    ).one()
+    return float(opening), float(income), float(expenses)
+
+STATEMENT_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3B82F6')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 7),
+    ('ALIGN', (3, 0), (-1, -1), 'RIGHT'),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F3F4F6')]),
+    ('LINEBELOW', (0, 0), (-1, -1), 0.25, colors.HexColor('#D1D5DB'))
+])
+
+def render_statement_pdf(user, start, end, fileobj):
+    """Render the full statement for the local dates start..end (inclusive) into fileobj"""
+    doc = SimpleDocTemplate(
+        fileobj,
+        pagesize=A4,
+        rightMargin=36,
+        leftMargin=36,
+        topMargin=54,
+        bottomMargin=36,
+        pageCompression=1,
+        title='Extrato Financeiro'
+    )
+
+    def number_page(canvas, doc):
+        canvas.saveState()
+        canvas.setFont('Helvetica', 7)
+        canvas.setFillColor(colors.grey)
+        canvas.drawRightString(A4[0] - 36, 20, f'Página {doc.page}')
+        canvas.restoreState()
+
+    doc.build(LazyFlowables(build_statement_content(user, start, end)),
+              onFirstPage=number_page, onLaterPages=number_page)
+
+def build_statement_content(user, start, end):
+    """Yield statement flowables, fetching the ledger in chunks as pages are laid out"""
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'StatementTitle',
+        parent=styles['Heading1'],
+        fontSize=20,
+        textColor=colors.HexColor('#1E40AF'),
+        alignment=TA_CENTER,
+        spaceAfter=20
+    )
+
+    # Local calendar days to a half-open UTC range
+    start_utc = brasilia_to_utc(datetime.combine(start, datetime.min.time()))
+    end_utc = brasilia_to_utc(datetime.combine(end + timedelta(days=1), datetime.min.time()))
+    opening, income, expenses = statement_totals(user.id, start_utc, end_utc)
+    now = utc_to_brasilia(datetime.utcnow())
+
+    yield Paragraph("Extrato Financeiro", title_style)
+    yield Paragraph(f"<b>Usuário:</b> {escape(user.full_name)}", styles['Normal'])
+    yield Paragraph(f"<b>Período:</b> {start.strftime('%d/%m/%Y')} a {end.strftime('%d/%m/%Y')}", styles['Normal'])
+    yield Paragraph(f"<b>Data:</b> {now.strftime('%d/%m/%Y às %H:%M')}", styles['Normal'])
+    yield Spacer(1, 15)
+
+    summary_table = Table([
+        ['Saldo Anterior', format_brl(opening)],
+        ['Receitas no Período', format_brl(income)],
+        ['Despesas no Período', format_brl(expenses)],
+        ['Saldo Final', format_brl(opening + income - expenses)]
+    ], colWidths=[3*inch, 2*inch])
+    summary_table.setStyle(TableStyle([
+        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('BACKGROUND', (0, 0), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black)
+    ]))
+    yield summary_table
+    yield Spacer(1, 20)
+
+    # Ledger with running balance, one table per slice; repeatRows keeps the
+    # header on every page when ReportLab splits a table across pages.
+    header = ['Data', 'Descrição', 'Categoria', 'Valor', 'Saldo']
+    col_widths = [0.8*inch, 2.9*inch, 1.4*inch, 1.1*inch, 1.1*inch]
+    balance = opening
+    row_count = 0
+    table_rows = [header]
+    for date, description, category, transaction_type, amount in iter_statement_rows(user.id, start_utc, end_utc):
+        amount = float(amount)
+        row_count += 1
+        balance += amount if transaction_type == 'income' else -amount
+        table_rows.append([
+            date.strftime('%d/%m/%Y'),
+            description[:45] + '...' if len(description) > 45 else description,
+            (category or 'Sem categoria')[:20],
+            ('+' if transaction_type == 'income' else '-') + format_brl(amount),
+            format_brl(balance)
+        ])
+        if len(table_rows) > STATEMENT_TABLE_ROWS:
+            yield Table(table_rows, colWidths=col_widths, repeatRows=1, style=STATEMENT_TABLE_STYLE)
+            table_rows = [header]
+
+    if len(table_rows) > 1:
+        yield Table(table_rows, colWidths=col_widths, repeatRows=1, style=STATEMENT_TABLE_STYLE)
+    if not row_count:
+        yield Paragraph("Nenhuma transação encontrada no período.", styles['Normal'])
@@ -0,0 +1,119 @@
+import logging
+import os
+import re
+import time
+from collections import Counter
+from flask import before_render_template, current_app, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Placeholder lists of any length collapse to one, so `IN (?, ?, ?)` and
+# `IN (?, ?)` count as the same statement shape
+_PLACEHOLDER_LIST = re.compile(r'\(\s*(?:\?|%s|%\(\w+\)s|\$\d+|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|\$\d+|:\w+))+\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+class RequestQueryStats:
+    """Queries and render time of one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, elapsed):
+        self.queries += 1
+        self.db_time += elapsed
+        self.shapes[statement_shape(statement)] += 1
+
+    def most_repeated(self):
+        """(shape, count) of the statement run most often, or (None, 0)"""
+        return self.shapes.most_common(1)[0] if self.shapes else (None, 0)
+
+
+def statement_shape(statement):
+    return _PLACEHOLDER_LIST.sub('(?)', _WHITESPACE.sub(' ', statement).strip())
+
+
+def init_query_stats(app, engine):
+    """Count and time each request's queries when SQL_INSTRUMENTATION is on"""
+    app.config.setdefault('SQL_INSTRUMENTATION', os.environ.get('SQL_INSTRUMENTATION', '1') == '1')
+    # Warn when a request runs more queries than this, or the same statement
+    # shape this many times (the usual sign of an N+1 loop)
+    app.config.setdefault('SQL_QUERY_BUDGET', int(os.environ.get('SQL_QUERY_BUDGET', 30)))
+    app.config.setdefault('SQL_REPEAT_THRESHOLD', int(os.environ.get('SQL_REPEAT_THRESHOLD', 5)))
+    # Server-Timing shows up in the browser's network panel
+    app.config.setdefault('SERVER_TIMING', os.environ.get('SERVER_TIMING', '1') == '1')
+    if not app.config['SQL_INSTRUMENTATION']:
+        return
+
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+
+def _current_stats():
+    # Background report threads and CLI commands have no request to charge
+    return g.get('query_stats') if has_request_context() else None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats() is not None:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats()
+    started = conn.info.get('query_started')
+    if stats is not None and started:
+        stats.record(statement, time.perf_counter() - started.pop())
+
+
+def _before_render(sender, template, context, **extra):
+    stats = _current_stats()
+    if stats is not None:
+        g.render_started = time.perf_counter()
+
+
+def _after_render(sender, template, context, **extra):
+    stats = _current_stats()
+    started = g.pop('render_started', None)
+    if stats is not None and started is not None:
+        stats.render_time += time.perf_counter() - started
+
+
+def _start_request():
+    g.query_stats = RequestQueryStats()
+
+
+def _finish_request(response):
+    stats = g.pop('query_stats', None)
+    if stats is None:
+        return response
+    total = time.perf_counter() - stats.started
+    config = current_app.config
+
+    if config['SERVER_TIMING']:
+        response.headers.add('Server-Timing', ', '.join((
+            f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"',
+            f'render;dur={stats.render_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        )))
+
+    endpoint = request.endpoint or request.path
+    if stats.queries > config['SQL_QUERY_BUDGET']:
+        logger.warning('%s ran %d queries (budget %d) in %.1f ms of %.1f ms',
+                       endpoint, stats.queries, config['SQL_QUERY_BUDGET'],
+                       stats.db_time * 1000, total * 1000)
+    shape, repeats = stats.most_repeated()
+    if repeats >= config['SQL_REPEAT_THRESHOLD']:
+        logger.warning('%s repeated a statement %d times (possible N+1): %.200s',
+                       endpoint, repeats, shape)
+    return response
@@ -0,0 +1,68 @@
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from models import MonthlyUsage
+from utils import now_brasilia
+
+
+def usage_period(now=None):
+    """(year, month) the plan quota is metered in: the Brasilia calendar month"""
+    local = now or now_brasilia()
+    return local.year, local.month
+
+
+def monthly_usage(user_id, now=None):
+    """Transactions the user created this month (one primary key lookup)"""
+    year, month = usage_period(now)
+    usage = db.session.get(MonthlyUsage, (user_id, year, month))
+    return usage.transactions if usage else 0
+
+
+def usage_by_user(user_ids, now=None):
+    """{user_id: transactions created this month} for several users"""
+    year, month = usage_period(now)
+    return dict(db.session.query(MonthlyUsage.user_id, MonthlyUsage.transactions).filter(
+        MonthlyUsage.user_id.in_(user_ids),
+        MonthlyUsage.year == year,
+        MonthlyUsage.month == month
+    ).all())
+
+
+def reserve_transactions(connection, user_id, count, limit, now=None):
+    """Count `count` new transactions against this month's quota, or refuse.
+
+    Runs in the caller's transaction so the reservation commits or rolls
+    back together with the inserted rows. The limit check is part of the
+    UPDATE's WHERE clause, so concurrent requests cannot both squeeze past
+    it; the first write of a month inserts the row instead. limit=-1 only
+    meters. Returns False, changing nothing, if the quota would be exceeded.
+    """
+    if limit != -1 and count > limit:
+        return False
+    table = MonthlyUsage.__table__
+    year, month = usage_period(now)
+
+    conditions = [table.c.user_id == user_id, table.c.year == year, table.c.month == month]
+    if limit != -1:
+        conditions.append(table.c.transactions + count <= limit)
+    update = table.update().where(*conditions).values(transactions=table.c.transactions + count)
+    if connection.execute(update).rowcount:
+        return True
+
+    values = {'user_id': user_id, 'year': year, 'month': month, 'transactions': count}
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert(table).values(**values).on_conflict_do_nothing(
+            index_elements=['user_id', 'year', 'month'])
+        if connection.execute(stmt).rowcount:
+            return True
+        # The row exists (maybe created concurrently); the UPDATE decides
+        return bool(connection.execute(update).rowcount)
+
+    existing = connection.execute(
+        table.select().where(table.c.user_id == user_id, table.c.year == year, table.c.month == month)
+    ).first()
+    if existing is not None:
+        return False
+    connection.execute(table.insert().values(**values))
+    return True
@@ -0,0 +1,120 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+
+
+class MemoryBucketStore:
+    """Token buckets kept in this process; the least recently used are dropped first"""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, cost=1):
+        """Take cost tokens; returns (allowed, seconds until enough tokens refill)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return allowed, 0 if allowed else (cost - tokens) / rate
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisBucketStore:
+    """Token buckets shared by every process through a Redis-compatible server"""
+
+    # Refill and take in one round trip, atomically
+    TAKE_SCRIPT = """
+    local capacity, rate, now, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    local allowed = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url, prefix='fi:rl:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('RATELIMIT_BACKEND=redis requires the "redis" package to be installed.')
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(self.TAKE_SCRIPT)
+
+    def take(self, key, capacity, rate, cost=1):
+        allowed, tokens = self._take(keys=[self.prefix + key], args=[capacity, rate, time.time(), cost])
+        if allowed:
+            return True, 0
+        return False, (cost - float(tokens)) / rate
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+def init_rate_limits(app):
+    """Configure the rate limit store from RATELIMIT_* settings"""
+    app.config.setdefault('RATELIMIT_ENABLED', os.environ.get('RATELIMIT_ENABLED', '1') == '1')
+    app.config.setdefault('RATELIMIT_BACKEND', os.environ.get('RATELIMIT_BACKEND', 'memory'))
+    app.config.setdefault('RATELIMIT_REDIS_URL', os.environ.get(
+        'RATELIMIT_REDIS_URL', app.config.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')))
+    # Login attempts: burst size and sustained attempts per minute
+    app.config.setdefault('LOGIN_LIMIT_PER_IP', (
+        int(os.environ.get('LOGIN_IP_BURST', 20)), float(os.environ.get('LOGIN_IP_PER_MINUTE', 10))))
+    app.config.setdefault('LOGIN_LIMIT_PER_EMAIL', (
+        int(os.environ.get('LOGIN_EMAIL_BURST', 5)), float(os.environ.get('LOGIN_EMAIL_PER_MINUTE', 1))))
+
+    if app.config['RATELIMIT_BACKEND'] == 'redis':
+        store = RedisBucketStore(app.config['RATELIMIT_REDIS_URL'])
+    else:
+        store = MemoryBucketStore()
+    app.extensions['rate_limits'] = store
+    return store
+
+
+def get_rate_limit_store():
+    return current_app.extensions['rate_limits']
+
+
+def throttle(scope, **identities):
+    """Charge one attempt to each identity's bucket (e.g. ip=..., email=...).
+
+    Limits come from the LOGIN_LIMIT_PER_<IDENTITY> settings as
+    (burst, per_minute). Returns None when allowed, otherwise the number of
+    seconds to wait. Every bucket is charged even after one refuses, so an
+    attacker cannot spread attempts to dodge the other limits.
+    """
+    if not current_app.config['RATELIMIT_ENABLED']:
+        return None
+    store = get_rate_limit_store()
+    wait = 0
+    for name, value in identities.items():
+        if not value:
+            continue
+        capacity, per_minute = current_app.config[f'{scope.upper()}_LIMIT_PER_{name.upper()}']
+        allowed, retry_after = store.take(f'{scope}:{name}:{str(value).lower()}', capacity, per_minute / 60)
+        if not allowed:
+            wait = max(wait, retry_after)
+    return math.ceil(wait) if wait else None
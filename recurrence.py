@@ -0,0 +1,205 @@
+import calendar
+import heapq
+import logging
+from datetime import datetime, timedelta
+from itertools import count, takewhile
+from sqlalchemy import select, insert, update, bindparam, func, or_, and_
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import User, Transaction, summary_bucket, apply_summary_deltas, bump_data_version
+from quota import usage_by_user, reserve_transactions
+from utils import utc_to_brasilia, brasilia_to_utc
+
+logger = logging.getLogger(__name__)
+
+RECURRENCE_TYPES = ('weekly', 'monthly', 'yearly')
+
+# Shortest possible gap between occurrences, used to pre-filter due series in SQL
+MIN_INTERVAL = {
+    'weekly': timedelta(days=7),
+    'monthly': timedelta(days=28),
+    'yearly': timedelta(days=365),
+}
+
+
+def add_months(value, months):
+    """Move a datetime by calendar months, clamping the day to the month's end"""
+    index = value.year * 12 + (value.month - 1) + months
+    year, month = index // 12, index % 12 + 1
+    day = min(value.day, calendar.monthrange(year, month)[1])
+    return value.replace(year=year, month=month, day=day)
+
+
+def nth_occurrence(anchor, recurrence_type, n):
+    """Occurrence n of a series (0 is the anchor itself), in local time"""
+    if recurrence_type == 'weekly':
+        return anchor + timedelta(weeks=n)
+    if recurrence_type == 'monthly':
+        return add_months(anchor, n)
+    return add_months(anchor, 12 * n)
+
+
+def _first_index_after(anchor, recurrence_type, after):
+    """Lower bound for the first occurrence index later than `after`"""
+    if recurrence_type == 'weekly':
+        return max(1, (after - anchor).days // 7)
+    months = (after.year - anchor.year) * 12 + after.month - anchor.month
+    if recurrence_type == 'yearly':
+        months //= 12
+    return max(1, months)
+
+
+def iter_occurrences(anchor, recurrence_type, after=None):
+    """Lazily yield the UTC dates of a series' occurrences later than `after`.
+
+    Occurrences are computed from the anchor in Brasilia local time, so a
+    rent due on the 31st falls on the last day of shorter months and returns
+    to the 31st afterwards. The generator is infinite.
+    """
+    local_anchor = utc_to_brasilia(anchor).replace(tzinfo=None)
+    local_after = utc_to_brasilia(after or anchor).replace(tzinfo=None)
+    for n in count(_first_index_after(local_anchor, recurrence_type, local_after)):
+        occurrence = nth_occurrence(local_anchor, recurrence_type, n)
+        if occurrence > local_after:
+            yield brasilia_to_utc(occurrence)
+
+
+def recurring_series_query():
+    """SELECT of the active recurring series (the rows that define a recurrence)"""
+    return select(
+        Transaction.id,
+        Transaction.user_id,
+        Transaction.description,
+        Transaction.amount,
+        Transaction.transaction_type,
+        Transaction.category,
+        Transaction.date,
+        Transaction.recurrence_type,
+        Transaction.last_occurrence_date
+    ).where(
+        Transaction.is_recurring,
+        Transaction.recurrence_type.in_(RECURRENCE_TYPES),
+        Transaction.date.is_not(None)
+    )
+
+
+def upcoming_occurrences(user_id, start=None):
+    """Lazily yield the user's future recurring transactions in date order.
+
+    Each item is a dict shaped like a transaction row. The stream is
+    infinite; callers bound it, e.g. with itertools.takewhile on the date.
+    Only the series themselves are read from the database.
+    """
+    start = start or datetime.utcnow()
+    series = db.session.execute(recurring_series_query().where(Transaction.user_id == user_id)).all()
+
+    def occurrences(row):
+        after = max(start, row.last_occurrence_date or row.date)
+        for date in iter_occurrences(row.date, row.recurrence_type, after):
+            yield date, row.id, {
+                'series_id': row.id,
+                'date': date,
+                'description': row.description,
+                'amount': float(row.amount),
+                'transaction_type': row.transaction_type,
+                'category': row.category
+            }
+
+    for _, _, occurrence in heapq.merge(*(occurrences(row) for row in series), key=lambda item: item[:2]):
+        yield occurrence
+
+
+def _plan_limits(user_ids):
+    """Monthly transactions_limit of each user's plan (-1 = unlimited)"""
+    return {
+        user.id: user.get_plan_features()['transactions_limit']
+        for user in User.query.filter(User.id.in_(user_ids)).all()
+    }
+
+
+def _remaining_allowances(limits):
+    """Transactions each user may still create this month (None = unlimited)"""
+    used = usage_by_user(list(limits))
+    return {
+        user_id: None if limit == -1 else max(0, limit - used.get(user_id, 0))
+        for user_id, limit in limits.items()
+    }
+
+
+def materialize_recurring(now=None):
+    """Insert every due occurrence of every recurring series, for all users.
+
+    Runs as one database transaction: a single executemany INSERT for the new
+    rows, a single executemany UPDATE advancing each series'
+    last_occurrence_date, plus the rollup deltas and data version bumps. The
+    unique (recurrence_parent_id, date) constraint makes a concurrent or
+    repeated run fail instead of duplicating rows. Returns the row count.
+    """
+    now = now or datetime.utcnow()
+    last_date = func.coalesce(Transaction.last_occurrence_date, Transaction.date)
+    due = db.session.execute(recurring_series_query().where(or_(*(
+        and_(Transaction.recurrence_type == recurrence_type, last_date <= now - interval)
+        for recurrence_type, interval in MIN_INTERVAL.items()
+    ))).order_by(Transaction.user_id, Transaction.id)).all()
+    if not due:
+        return 0
+
+    limits = _plan_limits({row.user_id for row in due})
+    remaining = _remaining_allowances(limits)
+    rows = []
+    advanced = []
+    created = {}
+    for series in due:
+        after = series.last_occurrence_date or series.date
+        dates = list(takewhile(lambda date: date <= now,
+                               iter_occurrences(series.date, series.recurrence_type, after)))
+        allowance = remaining.get(series.user_id)
+        if allowance is not None:
+            dates = dates[:allowance]
+            remaining[series.user_id] = allowance - len(dates)
+        if not dates:
+            continue
+        for date in dates:
+            rows.append({
+                'user_id': series.user_id,
+                'description': series.description,
+                'amount': series.amount,
+                'transaction_type': series.transaction_type,
+                'category': series.category,
+                'date': date,
+                'recurrence_parent_id': series.id
+            })
+        advanced.append({'series_id': series.id, 'last_date': dates[-1]})
+        created[series.user_id] = created.get(series.user_id, 0) + len(dates)
+    if not rows:
+        return 0
+
+    connection = db.session.connection()
+    try:
+        for user_id, created_count in created.items():
+            # Allowances were read before this transaction; if the user created
+            # transactions since, the next run catches up
+            if not reserve_transactions(connection, user_id, created_count, limits[user_id]):
+                db.session.rollback()
+                logger.warning('User %s used their quota concurrently; recurring run skipped', user_id)
+                return 0
+        connection.execute(insert(Transaction), rows)
+        connection.execute(
+            update(Transaction.__table__)
+            .where(Transaction.__table__.c.id == bindparam('series_id'))
+            .values(last_occurrence_date=bindparam('last_date')),
+            advanced
+        )
+        deltas = {}
+        for row in rows:
+            bucket = summary_bucket(row['user_id'], row['date'], row['transaction_type'], row['category'])
+            amount, occurrences = deltas.get(bucket, (0, 0))
+            deltas[bucket] = (amount + row['amount'], occurrences + 1)
+        apply_summary_deltas(connection, deltas)
+        bump_data_version(connection, {row['user_id'] for row in rows})
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        logger.warning('Recurring transactions were materialized concurrently; nothing inserted')
+        return 0
+    return len(rows)
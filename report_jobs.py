@@ -0,0 +1,232 @@
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import User, ReportJob
+from utils import now_brasilia
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def init_report_jobs(app):
+    """Configure report rendering from REPORT_* settings"""
+    app.config.setdefault('REPORT_STORAGE_DIR', os.environ.get(
+        'REPORT_STORAGE_DIR', os.path.join(app.instance_path, 'reports')))
+    # 'thread' renders in a small pool inside the web process; 'external'
+    # leaves queued jobs to a separate `flask report-worker` process.
+    app.config.setdefault('REPORT_WORKER', os.environ.get('REPORT_WORKER', 'thread'))
+    app.config.setdefault('REPORT_WORKERS', int(os.environ.get('REPORT_WORKERS', 2)))
+    # Jobs queued or running for longer than this (seconds) are assumed lost
+    # (e.g. the process holding them restarted) and dispatched again
+    app.config.setdefault('REPORT_JOB_TIMEOUT', int(os.environ.get('REPORT_JOB_TIMEOUT', 600)))
+    # Failed jobs are only retried by themselves after this many seconds, so
+    # a render that always fails is not repeated on every request
+    app.config.setdefault('REPORT_RETRY_DELAY', int(os.environ.get('REPORT_RETRY_DELAY', 300)))
+
+
+def report_renderers():
+    """Map report_type to a render(user, params, fileobj) function"""
+    from pdf_reports import render_summary_pdf, render_statement_pdf
+    return {
+        'summary': lambda user, params, fileobj: render_summary_pdf(user, fileobj),
+        'statement': lambda user, params, fileobj: render_statement_pdf(
+            user, *parse_statement_params(params), fileobj),
+    }
+
+
+def statement_params(start, end):
+    """Encode a statement period (local dates, inclusive) as job params"""
+    return f'{start:%Y-%m-%d}:{end:%Y-%m-%d}'
+
+
+def parse_statement_params(params):
+    start, end = params.split(':')
+    return date.fromisoformat(start), date.fromisoformat(end)
+
+
+def report_cache_key(user, report_type, params=''):
+    """Identify a report by user, data version, type, params and day of generation"""
+    today = now_brasilia()
+    return f'{user.id}:{user.data_version or 0}:{report_type}:{params}:{today:%Y%m%d}'
+
+
+def request_report(user, report_type, params='', retry=False):
+    """Return the job for this report, creating and dispatching it if needed.
+
+    Identical requests share one job: the cache key is unique, so concurrent
+    requests for the same user, data version and report coalesce into a
+    single render, and finished files are reused until the data changes.
+    A failed job is returned as is until REPORT_RETRY_DELAY has passed,
+    unless `retry` asks for another attempt now.
+    """
+    cache_key = report_cache_key(user, report_type, params)
+    job = ReportJob.query.filter_by(cache_key=cache_key).first()
+    if job is None:
+        job = ReportJob(
+            user_id=user.id,
+            report_type=report_type,
+            params=params,
+            data_version=user.data_version or 0,
+            cache_key=cache_key,
+            status='queued'
+        )
+        db.session.add(job)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another request created the same job first
+            db.session.rollback()
+            return ReportJob.query.filter_by(cache_key=cache_key).one()
+        dispatch(job.id)
+    elif _needs_requeue(job, retry):
+        job.status = 'queued'
+        job.error = None
+        # Restart the clock, so the job is not taken for lost again right away
+        job.created_at = datetime.utcnow()
+        db.session.commit()
+        dispatch(job.id)
+    return job
+
+
+def _needs_requeue(job, retry=False):
+    if job.status == 'failed':
+        if retry or job.finished_at is None:
+            return True
+        age = (datetime.utcnow() - job.finished_at).total_seconds()
+        return age > current_app.config['REPORT_RETRY_DELAY']
+    if job.status == 'done':
+        return not os.path.exists(job.file_path or '')
+    # A queued job whose dispatch was lost would otherwise wait forever;
+    # dispatching it twice is harmless, claim_job() lets only one run
+    since = {'queued': job.created_at, 'running': job.started_at}.get(job.status)
+    if since is None:
+        return False
+    return (datetime.utcnow() - since).total_seconds() > current_app.config['REPORT_JOB_TIMEOUT']
+
+
+def dispatch(job_id):
+    """Hand a queued job to the in-process pool, unless an external worker is used"""
+    app = current_app._get_current_object()
+    if app.config['REPORT_WORKER'] != 'thread':
+        return
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=app.config['REPORT_WORKERS'],
+                                           thread_name_prefix='report-render')
+    _executor.submit(_run_in_context, app, job_id)
+
+
+def _run_in_context(app, job_id):
+    with app.app_context():
+        try:
+            run_job(job_id)
+        except Exception:
+            logger.exception('Report job %s failed', job_id)
+
+
+def claim_job(job_id):
+    """Atomically move a job from queued to running.
+
+    Returns the claim's start time, which identifies this attempt, or None
+    if someone else has the job.
+    """
+    started_at = datetime.utcnow()
+    result = db.session.execute(
+        ReportJob.__table__.update().where(
+            ReportJob.id == job_id,
+            ReportJob.status == 'queued'
+        ).values(status='running', started_at=started_at)
+    )
+    db.session.commit()
+    return started_at if result.rowcount == 1 else None
+
+
+def finish_job(job_id, claimed_at, **values):
+    """Record an attempt's outcome if it still holds the claim; False otherwise.
+
+    A running job that outlives REPORT_JOB_TIMEOUT is requeued and claimed
+    again, and the later attempt's outcome is the one that counts.
+    """
+    result = db.session.execute(
+        ReportJob.__table__.update().where(
+            ReportJob.id == job_id,
+            ReportJob.status == 'running',
+            ReportJob.started_at == claimed_at
+        ).values(finished_at=datetime.utcnow(), **values)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def run_job(job_id):
+    """Render a queued job to REPORT_STORAGE_DIR"""
+    claimed_at = claim_job(job_id)
+    if claimed_at is None:
+        return
+    job = db.session.get(ReportJob, job_id)
+    user = db.session.get(User, job.user_id)
+    storage_dir = current_app.config['REPORT_STORAGE_DIR']
+    os.makedirs(storage_dir, exist_ok=True)
+    # Each attempt writes its own files: a requeued job's earlier attempt
+    # may still be rendering
+    fd, temp_path = tempfile.mkstemp(dir=storage_dir, prefix=f'report_{job.id}_', suffix='.tmp')
+    file_path = temp_path[:-len('.tmp')] + '.pdf'
+
+    try:
+        with os.fdopen(fd, 'wb') as fileobj:
+            report_renderers()[job.report_type](user, job.params, fileobj)
+        os.replace(temp_path, file_path)
+    except Exception as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        # The renderer may have left the session mid-transaction or broken;
+        # start clean before recording the failure
+        db.session.rollback()
+        finish_job(job_id, claimed_at, status='failed', error=str(e)[:500])
+        raise
+
+    if not finish_job(job_id, claimed_at, status='done', file_path=file_path):
+        logger.info('Report job %s was taken over by a later attempt; discarding this render', job_id)
+        os.remove(file_path)
+        return
+    db.session.expire(job)
+    prune_artifacts(job)
+
+
+def prune_artifacts(job):
+    """Delete older renders of the same report, which the new one supersedes"""
+    stale = ReportJob.query.filter(
+        ReportJob.user_id == job.user_id,
+        ReportJob.report_type == job.report_type,
+        ReportJob.params == job.params,
+        ReportJob.id != job.id,
+        ReportJob.status.in_(('done', 'failed'))
+    ).all()
+    for old in stale:
+        if old.file_path and os.path.exists(old.file_path):
+            os.remove(old.file_path)
+        db.session.delete(old)
+    db.session.commit()
+
+
+def run_pending_jobs(limit=None):
+    """Render queued jobs oldest first; used by the external worker"""
+    query = db.session.query(ReportJob.id).filter_by(status='queued').order_by(ReportJob.id)
+    if limit:
+        query = query.limit(limit)
+    job_ids = [job_id for job_id, in query.all()]
+    for job_id in job_ids:
+        try:
+            run_job(job_id)
+        except Exception:
+            logger.exception('Report job %s failed', job_id)
+    return len(job_ids)
@@ -1,23 +1,20 @@
-from flask import Blueprint, render_template, jsonify, flash, redirect, url_for, make_response
+from flask import Blueprint, render_template, jsonify, flash, redirect, url_for, request, abort, Response, stream_with_context, send_file
 from flask_login import login_required, current_user
-from models import Transaction, Account
-from app import db
-from sqlalchemy import func, extract
-from datetime import datetime, timedelta
+from models import Account, ReportJob
+from datetime import datetime
 import calendar
-import io
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
-from utils import utc_to_brasilia, format_currency
+import os
+from utils import utc_to_brasilia, now_brasilia
+from report_jobs import request_report, statement_params
+from cache import conditional_user_response, cached_for_user
+from exports import EXPORTS, EXPORT_FORMATS, stream_export
+from analytics import monthly_series, category_totals, transaction_count as count_transactions
 
 reports_bp = Blueprint('reports', __name__)
 
 @reports_bp.route('/')
 @login_required
+@conditional_user_response('reports')
 def reports():
     # Check if user has access to reports
     features = current_user.get_plan_features()
@@ -26,64 +23,35 @@ def reports():
                              access_denied=True,
                              message='Relatórios estão disponíveis apenas para planos pagos.')
     
-    # Generate reports data
-    today = datetime.utcnow()
-    current_month = today.month
-    current_year = today.year
-    
-    # Monthly performance
-    monthly_data = []
-    for i in range(12):
-        month_date = today - timedelta(days=30*i)
-        month = month_date.month
-        year = month_date.year
-        
-        income = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.user_id == current_user.id,
-            Transaction.transaction_type == 'income',
-            extract('month', Transaction.date) == month,
-            extract('year', Transaction.date) == year
-        ).scalar() or 0
-        
-        expenses = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.user_id == current_user.id,
-            Transaction.transaction_type == 'expense',
-            extract('month', Transaction.date) == month,
-            extract('year', Transaction.date) == year
-        ).scalar() or 0
-        
-        monthly_data.append({
-            'month': calendar.month_name[month],
-            'income': float(income),
-            'expenses': float(expenses),
-            'profit': float(income) - float(expenses)
-        })
-    
-    monthly_data.reverse()
+    # Monthly performance for the last 12 local calendar months
+    monthly_data = [
+        dict(m, month=calendar.month_name[m['month']])
+        for m in monthly_series(current_user.id, months=12)
+    ]
     
     # Category analysis
-    category_data = db.session.query(
-        Transaction.category,
-        func.sum(Transaction.amount).label('total')
-    ).filter(
-        Transaction.user_id == current_user.id,
-        Transaction.transaction_type == 'expense'
-    ).group_by(Transaction.category).all()
+    category_data = category_totals(current_user.id, 'expense')
+    
+    # Unusual category spending in the last months (warmed nightly by
+    # `flask detect-anomalies` when the cache is shared);
+    # anomalies pulls in numpy, so it is imported on first use
+    from anomalies import category_anomalies
+    anomalies = [
+        dict(a, month_name=calendar.month_name[a['month']])
+        for a in cached_for_user(current_user, f'anomalies:{now_brasilia():%Y-%m}',
+                                 lambda: category_anomalies(current_user.id))
+    ]
     
     # Calculate KPIs
     total_income = sum(m['income'] for m in monthly_data)
     total_expenses = sum(m['expenses'] for m in monthly_data)
     net_profit = total_income - total_expenses
     
-    transaction_count = Transaction.query.filter_by(user_id=current_user.id).count()
+    transaction_count = count_transactions(current_user.id)
     avg_ticket = total_income / max(1, transaction_count)
     
-    # Overdue accounts
-    overdue_accounts = Account.query.filter(
-        Account.user_id == current_user.id,
-        Account.status == 'pending',
-        Account.due_date < today
-    ).count()
+    # Overdue accounts (status maintained by the `flask sweep-overdue` job)
+    overdue_accounts = Account.query.filter_by(user_id=current_user.id, status='overdue').count()
     
     return render_template('reports/reports.html',
                          monthly_data=monthly_data,
@@ -93,10 +61,12 @@ def reports():
                          net_profit=net_profit,
                          avg_ticket=avg_ticket,
                          overdue_accounts=overdue_accounts,
+                         anomalies=anomalies,
                          features=features)
 
 @reports_bp.route('/export-pdf')
 @login_required
+@conditional_user_response('export-pdf')
 def export_pdf():
     # Check if user has access to reports
     features = current_user.get_plan_features()
@@ -104,224 +74,135 @@ def export_pdf():
         flash('Exportação PDF está disponível apenas para planos pagos.', 'warning')
         return redirect(url_for('reports.reports'))
     
-    try:
-        # Generate PDF content
-        pdf_buffer = io.BytesIO()
-        
-        # Create PDF document
-        doc = SimpleDocTemplate(
-            pdf_buffer,
-            pagesize=A4,
-            rightMargin=72,
-            leftMargin=72,
-            topMargin=72,
-            bottomMargin=18
-        )
-        
-        # Build PDF content
-        content = build_pdf_content()
-        doc.build(content)
-        
-        # Prepare response
-        pdf_buffer.seek(0)
-        response = make_response(pdf_buffer.read())
-        response.headers['Content-Type'] = 'application/pdf'
-        
-        # Generate filename with current date
-        now = utc_to_brasilia(datetime.utcnow())
-        filename = f"relatorio_financeiro_{now.strftime('%Y%m%d_%H%M')}.pdf"
-        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
-        flash('Relatório PDF exportado com sucesso!', 'success')
-        return response
-        
-    except Exception as e:
-        flash(f'Erro ao gerar relatório PDF: {str(e)}', 'error')
+    # Rendering happens in the background; serve the file once it is ready
+    job = request_report(current_user, 'summary')
+    if job.status == 'done':
+        return send_report(job)
+    if job.status == 'failed':
+        flash(f'Não foi possível gerar seu relatório PDF: {job.error}', 'error')
         return redirect(url_for('reports.reports'))
-
-def build_pdf_content():
-    """Build PDF content with financial data"""
-    content = []
-    styles = getSampleStyleSheet()
-    
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#1E40AF'),
-        alignment=TA_CENTER,
-        spaceAfter=30
-    )
-    
-    subtitle_style = ParagraphStyle(
-        'CustomSubtitle',
-        parent=styles['Heading2'],
-        fontSize=16,
-        textColor=colors.HexColor('#374151'),
-        spaceAfter=20
-    )
-    
-    # Title
-    content.append(Paragraph("Relatório Financeiro", title_style))
-    content.append(Paragraph("Financeiro Inteligente", styles['Normal']))
-    content.append(Spacer(1, 20))
-    
-    # User info and period
-    now = utc_to_brasilia(datetime.utcnow())
-    content.append(Paragraph(f"<b>Usuário:</b> {current_user.full_name}", styles['Normal']))
-    content.append(Paragraph(f"<b>Plano:</b> {current_user.get_plan_features()['name']}", styles['Normal']))
-    content.append(Paragraph(f"<b>Data:</b> {now.strftime('%d/%m/%Y às %H:%M')}", styles['Normal']))
-    content.append(Spacer(1, 20))
-    
-    # Financial summary
-    content.append(Paragraph("Resumo Financeiro", subtitle_style))
-    
-    # Get financial data
-    today = datetime.utcnow()
-    current_month = today.month
-    current_year = today.year
     
-    # Calculate monthly totals
-    monthly_income = db.session.query(func.sum(Transaction.amount)).filter(
-        Transaction.user_id == current_user.id,
-        Transaction.transaction_type == 'income',
-        extract('month', Transaction.date) == current_month,
-        extract('year', Transaction.date) == current_year
-    ).scalar() or 0
-    
-    monthly_expenses = db.session.query(func.sum(Transaction.amount)).filter(
-        Transaction.user_id == current_user.id,
-        Transaction.transaction_type == 'expense',
-        extract('month', Transaction.date) == current_month,
-        extract('year', Transaction.date) == current_year
-    ).scalar() or 0
-    
-    monthly_balance = monthly_income - monthly_expenses
-    
-    # Summary table
-    summary_data = [
-        ['Item', 'Valor'],
-        ['Receitas do Mês', f'R$ {monthly_income:,.2f}'.replace(',', 'X').replace('.', ',').replace('X', '.')],
-        ['Despesas do Mês', f'R$ {monthly_expenses:,.2f}'.replace(',', 'X').replace('.', ',').replace('X', '.')],
-        ['Saldo do Mês', f'R$ {monthly_balance:,.2f}'.replace(',', 'X').replace('.', ',').replace('X', '.')]
-    ]
-    
-    summary_table = Table(summary_data, colWidths=[3*inch, 2*inch])
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3B82F6')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    content.append(summary_table)
-    content.append(Spacer(1, 30))
-    
-    # Recent transactions
-    content.append(Paragraph("Transações Recentes", subtitle_style))
+    flash('Seu relatório PDF está sendo gerado. Tente novamente em alguns instantes.', 'info')
+    return redirect(url_for('reports.reports'))
+
+@reports_bp.route('/export-pdf/request', methods=['POST'])
+@login_required
+def request_pdf():
+    """Queue (or reuse) a PDF render and return its job status"""
+    features = current_user.get_plan_features()
+    if not features['reports']:
+        return jsonify({'error': 'Exportação PDF está disponível apenas para planos pagos.'}), 403
     
-    # Get recent transactions
-    recent_transactions = Transaction.query.filter_by(user_id=current_user.id)\
-        .order_by(Transaction.date.desc()).limit(10).all()
+    # The button press is an explicit request, so a failed render is retried
+    job = request_report(current_user, 'summary', retry=True)
+    return jsonify(job_status(job)), 200 if job.status == 'done' else 202
+
+def statement_period():
+    """Read the statement period from start/end (YYYY-MM-DD); defaults to year to date"""
+    today = now_brasilia().date()
+    try:
+        start = datetime.strptime(request.values['start'], '%Y-%m-%d').date() \
+            if request.values.get('start') else today.replace(month=1, day=1)
+        end = datetime.strptime(request.values['end'], '%Y-%m-%d').date() \
+            if request.values.get('end') else today
+    except ValueError:
+        return None
+    if end < start:
+        return None
+    return start, end
+
+@reports_bp.route('/statement')
+@login_required
+@conditional_user_response('statement')
+def export_statement():
+    """Full statement for a date range, rendered in the background"""
+    features = current_user.get_plan_features()
+    if not features['reports']:
+        flash('Exportação PDF está disponível apenas para planos pagos.', 'warning')
+        return redirect(url_for('reports.reports'))
     
-    if recent_transactions:
-        # Transactions table
-        trans_data = [['Data', 'Descrição', 'Categoria', 'Tipo', 'Valor']]
-        
-        for transaction in recent_transactions:
-            date_str = utc_to_brasilia(transaction.date).strftime('%d/%m/%Y') if transaction.date else '-'
-            type_str = 'Receita' if transaction.transaction_type == 'income' else 'Despesa'
-            amount_str = f'R$ {float(transaction.amount):,.2f}'.replace(',', 'X').replace('.', ',').replace('X', '.')
-            if transaction.transaction_type == 'expense':
-                amount_str = f'-{amount_str}'
-            else:
-                amount_str = f'+{amount_str}'
-                
-            trans_data.append([
-                date_str,
-                transaction.description[:25] + '...' if len(transaction.description) > 25 else transaction.description,
-                transaction.category or 'Sem categoria',
-                type_str,
-                amount_str
-            ])
-        
-        trans_table = Table(trans_data, colWidths=[1*inch, 2.5*inch, 1.5*inch, 1*inch, 1.5*inch])
-        trans_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3B82F6')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('FONTSIZE', (0, 1), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        
-        content.append(trans_table)
-    else:
-        content.append(Paragraph("Nenhuma transação encontrada.", styles['Normal']))
+    period = statement_period()
+    if period is None:
+        flash('Período inválido para o extrato.', 'error')
+        return redirect(url_for('reports.reports'))
     
-    content.append(Spacer(1, 30))
+    job = request_report(current_user, 'statement', statement_params(*period))
+    if job.status == 'done':
+        return send_report(job)
+    if job.status == 'failed':
+        flash(f'Não foi possível gerar seu extrato: {job.error}', 'error')
+        return redirect(url_for('reports.reports'))
     
-    # Category analysis
-    content.append(Paragraph("Análise por Categorias", subtitle_style))
+    flash('Seu extrato está sendo gerado. Tente novamente em alguns instantes.', 'info')
+    return redirect(url_for('reports.reports'))
+
+@reports_bp.route('/statement/request', methods=['POST'])
+@login_required
+def request_statement():
+    """Queue (or reuse) a statement render and return its job status"""
+    features = current_user.get_plan_features()
+    if not features['reports']:
+        return jsonify({'error': 'Exportação PDF está disponível apenas para planos pagos.'}), 403
     
-    category_data = db.session.query(
-        Transaction.category,
-        func.sum(Transaction.amount).label('total')
-    ).filter(
-        Transaction.user_id == current_user.id,
-        Transaction.transaction_type == 'expense'
-    ).group_by(Transaction.category).all()
+    period = statement_period()
+    if period is None:
+        return jsonify({'error': 'Período inválido para o extrato.'}), 400
     
-    if category_data:
-        cat_data = [['Categoria', 'Total Gasto']]
-        for category, total in category_data:
-            cat_name = category or 'Sem categoria'
-            total_str = f'R$ {float(total):,.2f}'.replace(',', 'X').replace('.', ',').replace('X', '.')
-            cat_data.append([cat_name, total_str])
-        
-        cat_table = Table(cat_data, colWidths=[3*inch, 2*inch])
-        cat_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3B82F6')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        
-        content.append(cat_table)
+    job = request_report(current_user, 'statement', statement_params(*period), retry=True)
+    return jsonify(job_status(job)), 200 if job.status == 'done' else 202
+
+@reports_bp.route('/jobs/<int:job_id>')
+@login_required
+def report_job(job_id):
+    job = ReportJob.query.filter_by(id=job_id, user_id=current_user.id).first_or_404()
+    return jsonify(job_status(job))
+
+@reports_bp.route('/jobs/<int:job_id>/download')
+@login_required
+def download_report(job_id):
+    job = ReportJob.query.filter_by(id=job_id, user_id=current_user.id, status='done').first_or_404()
+    return send_report(job)
+
+def job_status(job):
+    """JSON-friendly status of a report job"""
+    return {
+        'id': job.id,
+        'status': job.status,
+        'error': job.error,
+        'status_url': url_for('reports.report_job', job_id=job.id),
+        'download_url': url_for('reports.download_report', job_id=job.id) if job.status == 'done' else None
+    }
+
+def send_report(job):
+    """Send a finished report file as an attachment"""
+    if not job.file_path or not os.path.exists(job.file_path):
+        abort(404)
+    if job.report_type == 'statement':
+        filename = f"extrato_{job.params.replace('-', '').replace(':', '_')}.pdf"
     else:
-        content.append(Paragraph("Nenhuma despesa por categoria encontrada.", styles['Normal']))
-    
-    content.append(Spacer(1, 30))
-    
-    # Footer
-    content.append(Paragraph(
-        f"Relatório gerado automaticamente pelo Financeiro Inteligente em {now.strftime('%d/%m/%Y às %H:%M')}",
-        ParagraphStyle(
-            'Footer',
-            parent=styles['Normal'],
-            fontSize=8,
-            textColor=colors.grey,
-            alignment=TA_CENTER
-        )
-    ))
-    
-    return content
+        now = utc_to_brasilia(job.finished_at or datetime.utcnow())
+        filename = f"relatorio_financeiro_{now.strftime('%Y%m%d_%H%M')}.pdf"
+    return send_file(job.file_path, mimetype='application/pdf', as_attachment=True, download_name=filename)
 
 @reports_bp.route('/export-excel')
 @login_required
 def export_excel():
-    # Mock Excel export functionality
-    flash('Funcionalidade de exportação Excel será implementada em breve.', 'info')
-    return redirect(url_for('reports.reports'))
+    """Stream the full ledger or the accounts as XLSX or CSV"""
+    features = current_user.get_plan_features()
+    if not features['reports']:
+        flash('Exportação Excel está disponível apenas para planos pagos.', 'warning')
+        return redirect(url_for('reports.reports'))
+    
+    dataset = request.args.get('dataset', 'ledger')
+    export_format = request.args.get('format', 'xlsx')
+    if dataset not in EXPORTS or export_format not in EXPORT_FORMATS:
+        abort(404)
+    
+    now = utc_to_brasilia(datetime.utcnow())
+    filename = f"{'lancamentos' if dataset == 'ledger' else 'contas'}_{now.strftime('%Y%m%d_%H%M')}.{export_format}"
+    response = Response(
+        stream_with_context(stream_export(current_user.id, dataset, export_format)),
+        mimetype=EXPORT_FORMATS[export_format]
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
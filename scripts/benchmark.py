@@ -0,0 +1,236 @@
+"""Benchmark the heaviest views through the Flask test client.
+
+    python scripts/benchmark.py [--database-url URL | --users 200 --transactions 40000]
+                                [--requests 30] [--save-baseline] [--threshold 0.25]
+
+Without --database-url a temporary SQLite database is seeded with
+scripts/seed_data.py (the same --seed gives the same data). Views run as the
+paid user with the most transactions, cold (server-side caches and rendered
+reports cleared before every request) and warm. Latency percentiles and
+queries per request are compared with scripts/benchmark_baseline.json; the
+exit status is 1 when a view's median got slower than --threshold (p95: twice
+that) or it issues more queries. --save-baseline records the run as the new baseline. Baselines only
+compare on the same machine, database and data set.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+
+BASELINE_PATH = os.path.join(ROOT, 'scripts', 'benchmark_baseline.json')
+
+# (endpoint, path); the PDF export also waits for the render, see fetch()
+VIEWS = (
+    ('dashboard.dashboard', '/dashboard/'),
+    ('dashboard.chart_data', '/dashboard/chart-data'),
+    ('financial.cash_flow', '/financial/cash-flow'),
+    ('reports.reports', '/reports/'),
+    ('reports.export_pdf', '/reports/export-pdf'),
+)
+MODES = ('cold', 'warm')
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+def fetch(client, app, path):
+    """GET a view; the PDF export is followed through the background render"""
+    response = client.get(path)
+    if path == '/reports/export-pdf' and response.status_code == 302:
+        from report_jobs import run_pending_jobs
+        with app.app_context():
+            run_pending_jobs()
+        response = client.get(path)
+    if response.status_code != 200:
+        raise RuntimeError(f'GET {path} answered {response.status_code}')
+    response.close()
+
+
+def reset_caches(app, user_id):
+    """Forget cached pages, cached user rows and rendered reports"""
+    from app import db
+    from cache import get_cache
+    from models import ReportJob
+
+    with app.app_context():
+        get_cache().clear()
+        for job in ReportJob.query.filter_by(user_id=user_id).all():
+            if job.file_path and os.path.exists(job.file_path):
+                os.remove(job.file_path)
+            db.session.delete(job)
+        db.session.commit()
+
+
+def heaviest_paid_user():
+    from models import User, BalanceSnapshot
+    return (User.query.join(BalanceSnapshot, BalanceSnapshot.user_id == User.id)
+            .filter(User.subscription_plan.in_(('mei', 'professional', 'enterprise')),
+                    User.subscription_status == 'active')
+            .order_by(BalanceSnapshot.transaction_count.desc(), User.id)
+            .first())
+
+
+def run_benchmark(app, requests, password, log=print):
+    from sqlalchemy import event
+    from app import db
+    from models import BalanceSnapshot
+
+    with app.app_context():
+        user = heaviest_paid_user()
+        if user is None:
+            raise RuntimeError('No paid user with transactions; seed the database with scripts/seed_data.py.')
+        user_id, email = user.id, user.email
+        user_transactions = db.session.get(BalanceSnapshot, user_id).transaction_count
+        counter = QueryCounter()
+        event.listen(db.engine, 'before_cursor_execute', counter)
+
+    client = app.test_client()
+    response = client.post('/auth/login', data={'email': email, 'password': password})
+    if response.status_code != 302 or '/auth/login' in response.headers.get('Location', ''):
+        raise RuntimeError(f'Could not log in as {email}; pass the seeding --password.')
+
+    views = {}
+    for name, path in VIEWS:
+        views[name] = {}
+        for mode in MODES:
+            latencies, queries = [], []
+            fetch(client, app, path)  # warm-up: imports, template compilation
+            for _ in range(requests):
+                if mode == 'cold':
+                    reset_caches(app, user_id)
+                counter.count = 0
+                started = time.perf_counter()
+                fetch(client, app, path)
+                latencies.append((time.perf_counter() - started) * 1000)
+                queries.append(counter.count)
+            views[name][mode] = {
+                **{f'p{pct}_ms': round(percentile(latencies, pct), 2) for pct in PERCENTILES},
+                'mean_ms': round(sum(latencies) / len(latencies), 2),
+                'queries': max(queries),
+            }
+            log(f"{name:22} {mode:4}  p50 {views[name][mode]['p50_ms']:8.1f} ms  "
+                f"p95 {views[name][mode]['p95_ms']:8.1f} ms  queries {views[name][mode]['queries']}")
+    return {'user_transactions': user_transactions, 'views': views}
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """Regression messages for views slower than the baseline or issuing more queries"""
+    regressions = []
+    for name, modes in baseline['views'].items():
+        for mode, expected in modes.items():
+            actual = results['views'].get(name, {}).get(mode)
+            if actual is None:
+                continue
+            # Tail latency is noisier over a few dozen requests, so p95 gets twice the slack
+            for key, allowed in (('p50_ms', threshold), ('p95_ms', threshold * 2)):
+                limit = max(expected[key] * (1 + allowed), expected[key] + min_delta_ms)
+                if actual[key] > limit:
+                    regressions.append(f'{name} {mode} {key}: {actual[key]:.1f} ms, baseline {expected[key]:.1f} ms')
+            if actual['queries'] > expected['queries']:
+                regressions.append(f"{name} {mode} queries: {actual['queries']}, baseline {expected['queries']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='an already seeded database (default: seed a temporary SQLite one)')
+    parser.add_argument('--users', type=int, default=200, help='users to seed into the temporary database')
+    parser.add_argument('--transactions', type=int, default=40000, help='transactions to seed')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--password', default='benchmark', help='password the database was seeded with')
+    parser.add_argument('--requests', type=int, default=30, help='timed requests per view and mode')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown (0.25 = 25%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=5.0,
+                        help='slowdowns smaller than this are noise, whatever the ratio')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    # Flask-Migrate looks for migrations/ in the working directory
+    os.chdir(ROOT)
+    workdir = tempfile.mkdtemp(prefix='financeiro-bench-')
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'benchmark.db')}"
+    from app import create_app
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'WTF_CSRF_ENABLED': False,
+        'RATELIMIT_ENABLED': False,
+        'SQL_INSTRUMENTATION': False,
+        'CACHE_BACKEND': 'memory',
+        'REPORT_WORKER': 'external',
+        'REPORT_STORAGE_DIR': os.path.join(workdir, 'reports'),
+        'LOG_LEVEL': 'WARNING',
+    })
+    log = (lambda message: print(message, file=sys.stderr)) if args.json else print
+
+    try:
+        if not args.database_url:
+            from seed_data import seed
+            log(f'Seeding {args.users} users and {args.transactions} transactions...')
+            seed(app, args.users, args.transactions, seed_value=args.seed, password=args.password,
+                 log=lambda message: None)
+        results = {
+            'meta': {
+                'database': database_url.split(':', 1)[0] if args.database_url else 'sqlite (seeded)',
+                'users': None if args.database_url else args.users,
+                'transactions': None if args.database_url else args.transactions,
+                'seed': None if args.database_url else args.seed,
+                'requests': args.requests,
+                'python': platform.python_version(),
+                'machine': platform.platform(),
+            },
+        }
+        results.update(run_benchmark(app, args.requests, args.password, log))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+            baseline_file.write('\n')
+        log(f'Baseline saved to {os.path.relpath(args.baseline, ROOT)}.')
+        return
+    if not os.path.exists(args.baseline):
+        log('No baseline to compare with; run with --save-baseline first.')
+        return
+
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    dataset = ('database', 'users', 'transactions', 'seed')
+    if any(baseline['meta'].get(key) != results['meta'][key] for key in dataset):
+        log('The baseline was recorded on another data set; not comparing.')
+        return
+    regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+    for regression in regressions:
+        log(f'REGRESSION {regression}')
+    if regressions:
+        sys.exit(1)
+    log(f"No regressions against the baseline (threshold {args.threshold:.0%}).")
+
+
+if __name__ == '__main__':
+    main()
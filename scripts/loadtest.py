@@ -0,0 +1,399 @@
+"""Concurrent load test against the app running under gunicorn.
+
+    python scripts/loadtest.py [--workers 4 --threads 4] [--concurrency 16] [--duration 30]
+                               [--database-url URL | --users 200 --transactions 40000]
+
+Starts gunicorn (gunicorn.conf.py) on a free local port and runs
+--concurrency virtual users against it. Each one logs in as a different
+seeded paid user and then loops over a weighted mix of dashboard views,
+chart-data polls, add-transaction posts, PDF exports and fresh logins (see
+--mix). The report gives throughput, p50/p95/p99 latency and errors per
+endpoint, plus the connection pool counters of the workers.
+
+Without --database-url a temporary SQLite database is seeded with
+scripts/seed_data.py. SQLite serializes writers, so size the fleet against
+Postgres: seed it with seed_data.py and pass its URL. --url targets a server
+that is already running instead of starting one.
+"""
+import argparse
+import http.cookiejar
+import json
+import math
+import os
+import random
+import re
+import secrets
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+
+from measure_startup import child_env  # noqa: E402
+
+DEFAULT_MIX = {'login': 5, 'dashboard': 30, 'chart_data': 35, 'add_transaction': 20, 'export_pdf': 10}
+PERCENTILES = (50, 95, 99)
+CSRF_FIELD = re.compile(rb'name="csrf_token"[^>]*value="([^"]+)"')
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Hand redirects back to the caller; following them would time another page"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Session:
+    """One browser: a cookie jar and the form CSRF token"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.reset()
+
+    def reset(self):
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect)
+        self.csrf_token = None
+
+    def request(self, method, path, data=None):
+        """(status, headers, body); HTTP errors and redirects are returned, not raised"""
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        request = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.headers, error.read()
+
+
+class ActionFailed(Exception):
+    """The endpoint answered, but not the way a working app would"""
+
+
+def expect(condition, reason):
+    if not condition:
+        raise ActionFailed(reason)
+
+
+def login(session, account):
+    session.reset()
+    status, _, body = session.request('GET', '/auth/login')
+    expect(status == 200, f'login form {status}')
+    match = CSRF_FIELD.search(body)
+    expect(match, 'no csrf token')
+    session.csrf_token = match.group(1).decode()
+    status, headers, _ = session.request('POST', '/auth/login', {
+        'csrf_token': session.csrf_token, 'email': account['email'], 'password': account['password']})
+    expect(status != 429, 'throttled')
+    expect(status == 302 and '/auth/login' not in headers.get('Location', ''), f'login {status}')
+
+
+def dashboard(session, account):
+    status, _, _ = session.request('GET', '/dashboard/')
+    expect(status == 200, f'status {status}')
+
+
+def chart_data(session, account):
+    status, _, body = session.request('GET', '/dashboard/chart-data')
+    expect(status == 200, f'status {status}')
+    json.loads(body)
+
+
+def add_transaction(session, account):
+    rng = account['rng']
+    transaction_type = 'income' if rng.random() < 0.4 else 'expense'
+    status, headers, _ = session.request('POST', '/financial/add-transaction', {
+        'csrf_token': session.csrf_token,
+        'description': 'Carga sintética',
+        'amount': f'{rng.lognormvariate(5.5, 1.0):.2f}',
+        'transaction_type': transaction_type,
+        'category': 'vendas' if transaction_type == 'income' else 'despesas_gerais',
+        'date': time.strftime('%Y-%m-%d'),
+    })
+    location = headers.get('Location', '')
+    expect(not location.endswith('/subscription/plans'), 'monthly quota reached')
+    expect(status == 302 and location.endswith('/financial/cash-flow'), f'status {status}')
+
+
+def export_pdf(session, account, timeout=60):
+    """Queue the render, poll it like the page's script does, then download the file"""
+    status, _, body = session.request('POST', '/reports/export-pdf/request')
+    expect(status in (200, 202), f'request {status}')
+    job = json.loads(body)
+    deadline = time.perf_counter() + timeout
+    while job['status'] not in ('done', 'failed'):
+        expect(time.perf_counter() < deadline, 'render timed out')
+        time.sleep(0.2)
+        status, _, body = session.request('GET', job['status_url'])
+        expect(status == 200, f'poll {status}')
+        job = json.loads(body)
+    expect(job['status'] == 'done', f"render failed: {job['error']}")
+    status, headers, _ = session.request('GET', job['download_url'])
+    expect(status == 200 and headers.get('Content-Type', '').startswith('application/pdf'), f'download {status}')
+
+
+ACTIONS = {
+    'login': login,
+    'dashboard': dashboard,
+    'chart_data': chart_data,
+    'add_transaction': add_transaction,
+    'export_pdf': export_pdf,
+}
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+
+    def record(self, name, elapsed, error=None):
+        with self.lock:
+            self.latencies[name].append(elapsed)
+            if error:
+                self.errors[name][error] += 1
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def timed(results, name, action, session, account):
+    started = time.perf_counter()
+    error = None
+    try:
+        action(session, account)
+    except ActionFailed as failure:
+        error = str(failure)
+    except (OSError, ValueError) as failure:
+        error = type(failure).__name__
+    results.record(name, time.perf_counter() - started, error)
+    return error is None
+
+
+def virtual_user(base_url, account, mix, stop_at, think_time, results, timeout):
+    session = Session(base_url, timeout)
+    names, weights = list(mix), list(mix.values())
+    rng = account['rng']
+    logged_in = False
+    while time.perf_counter() < stop_at:
+        name = 'login' if not logged_in else rng.choices(names, weights)[0]
+        ok = timed(results, name, ACTIONS[name], session, account)
+        if name == 'login':
+            logged_in = ok
+            if not ok:
+                time.sleep(1)
+        if think_time:
+            time.sleep(rng.expovariate(1 / think_time))
+
+
+def load_accounts(database_url, count, password, seed):
+    """Seeded paid users, unlimited plans first so posts do not run into the quota"""
+    from sqlalchemy import case
+    from app import create_app
+    from models import User
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_url, 'SQL_INSTRUMENTATION': False})
+    order = case({'enterprise': 0, 'professional': 1, 'mei': 2}, value=User.subscription_plan)
+    with app.app_context():
+        emails = [email for email, in User.query.with_entities(User.email)
+                  .filter(User.subscription_plan.in_(('mei', 'professional', 'enterprise')),
+                          User.subscription_status == 'active', User.email.like('seed%@example.com'))
+                  .order_by(order, User.id).limit(count)]
+    if not emails:
+        raise RuntimeError('No seeded paid users; seed the database with scripts/seed_data.py.')
+    return [{'email': emails[index % len(emails)], 'password': password, 'rng': random.Random(seed + index)}
+            for index in range(count)]
+
+
+def start_gunicorn(database_url, workers, threads, workdir, metrics_token, extra_env, timeout=60):
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    env = child_env(database_url)
+    env.update(
+        GUNICORN_BIND=f'127.0.0.1:{port}',
+        GUNICORN_WORKERS=str(workers),
+        GUNICORN_THREADS=str(threads),
+        REPORT_STORAGE_DIR=os.path.join(workdir, 'reports'),
+        METRICS_TOKEN=metrics_token,
+        LOG_LEVEL='WARNING',
+    )
+    env.update(extra_env)
+    log = open(os.path.join(workdir, 'gunicorn.log'), 'w')
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'], cwd=ROOT, env=env,
+                              stdout=log, stderr=subprocess.STDOUT)
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited during startup; see {log.name}")
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/auth/login', timeout=1):
+                return server, f'http://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.1)
+    stop_gunicorn(server)
+    raise RuntimeError('gunicorn did not answer within the timeout')
+
+
+def stop_gunicorn(server):
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+def pool_metrics(base_url, token, workers):
+    """/metrics/db-pool of as many distinct workers as answer a few tries"""
+    seen = {}
+    for _ in range(workers * 5):
+        request = urllib.request.Request(f'{base_url}/metrics/db-pool', headers={'Authorization': f'Bearer {token}'})
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                status = json.load(response)
+        except (OSError, ValueError):
+            break
+        seen[status['pid']] = status
+        if len(seen) >= workers:
+            break
+    return list(seen.values())
+
+
+def summarize(results, duration):
+    endpoints = {}
+    for name in sorted(results.latencies):
+        latencies = results.latencies[name]
+        errors = sum(results.errors[name].values())
+        endpoints[name] = {
+            'requests': len(latencies),
+            'throughput_per_s': round(len(latencies) / duration, 2),
+            **{f'p{pct}_ms': round(percentile(latencies, pct) * 1000, 1) for pct in PERCENTILES},
+            'errors': errors,
+            'error_rate': round(errors / len(latencies), 4),
+            'error_reasons': dict(results.errors[name]),
+        }
+    total = sum(endpoint['requests'] for endpoint in endpoints.values())
+    errors = sum(endpoint['errors'] for endpoint in endpoints.values())
+    return {
+        'duration_s': round(duration, 1),
+        'requests': total,
+        'throughput_per_s': round(total / duration, 2),
+        'error_rate': round(errors / total, 4) if total else 0,
+        'endpoints': endpoints,
+    }
+
+
+def parse_mix(value):
+    mix = dict(DEFAULT_MIX)
+    for item in filter(None, value.split(',')):
+        name, _, weight = item.partition('=')
+        if name not in ACTIONS:
+            raise argparse.ArgumentTypeError(f'unknown action {name!r}; pick from {", ".join(ACTIONS)}')
+        mix[name] = float(weight)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=4, help='threads per worker')
+    parser.add_argument('--concurrency', type=int, default=16, help='virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of load')
+    parser.add_argument('--think-time', type=float, default=0.0, help='mean pause between actions (s)')
+    parser.add_argument('--mix', type=parse_mix, default=dict(DEFAULT_MIX),
+                        help='action weights, e.g. "export_pdf=30,login=0" (default %(default)s)')
+    parser.add_argument('--database-url', help='an already seeded database (default: seed a temporary SQLite one)')
+    parser.add_argument('--users', type=int, default=200, help='users to seed into the temporary database')
+    parser.add_argument('--transactions', type=int, default=40000, help='transactions to seed')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--password', default='benchmark', help='password the database was seeded with')
+    parser.add_argument('--url', help='load an already running server instead of starting gunicorn')
+    parser.add_argument('--rate-limits', action='store_true',
+                        help='keep login throttling on (all virtual users share one IP)')
+    parser.add_argument('--timeout', type=float, default=30, help='per-request timeout (s)')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+    log = (lambda message: print(message, file=sys.stderr)) if args.json else print
+
+    # Flask-Migrate looks for migrations/ in the working directory
+    os.chdir(ROOT)
+    workdir = tempfile.mkdtemp(prefix='financeiro-load-')
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'loadtest.db')}"
+    server = None
+    try:
+        if not args.database_url:
+            from app import create_app
+            from seed_data import seed
+            log(f'Seeding {args.users} users and {args.transactions} transactions...')
+            seed(create_app({'SQLALCHEMY_DATABASE_URI': database_url, 'SQL_INSTRUMENTATION': False}),
+                 args.users, args.transactions, seed_value=args.seed, password=args.password,
+                 log=lambda message: None)
+        accounts = load_accounts(database_url, args.concurrency, args.password, args.seed)
+
+        metrics_token = secrets.token_urlsafe(16)
+        base_url = args.url
+        if base_url is None:
+            extra_env = {} if args.rate_limits else {'RATELIMIT_ENABLED': '0'}
+            server, base_url = start_gunicorn(database_url, args.workers, args.threads, workdir,
+                                              metrics_token, extra_env)
+            log(f'gunicorn: {args.workers} workers x {args.threads} threads at {base_url}')
+        log(f'{args.concurrency} virtual users for {args.duration:.0f} s, mix {args.mix}')
+
+        results = Results()
+        started = time.perf_counter()
+        stop_at = started + args.duration
+        threads = [threading.Thread(target=virtual_user, daemon=True, args=(
+            base_url, account, args.mix, stop_at, args.think_time, results, args.timeout)) for account in accounts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        summary = summarize(results, time.perf_counter() - started)
+        summary['config'] = {
+            'workers': None if args.url else args.workers,
+            'threads': None if args.url else args.threads,
+            'concurrency': args.concurrency,
+            'think_time': args.think_time,
+            'mix': args.mix,
+            'database': database_url.split(':', 1)[0],
+        }
+        if server is not None:
+            summary['db_pool'] = pool_metrics(base_url, metrics_token, args.workers)
+    finally:
+        if server is not None:
+            stop_gunicorn(server)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+    print(f"\n{'endpoint':16} {'requests':>8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>8}")
+    for name, endpoint in summary['endpoints'].items():
+        print(f"{name:16} {endpoint['requests']:8d} {endpoint['throughput_per_s']:8.1f} {endpoint['p50_ms']:8.1f} "
+              f"{endpoint['p95_ms']:8.1f} {endpoint['p99_ms']:8.1f} {endpoint['error_rate']:8.1%}")
+        for reason, count in endpoint['error_reasons'].items():
+            print(f'    {count} x {reason}')
+    print(f"{'total':16} {summary['requests']:8d} {summary['throughput_per_s']:8.1f} "
+          f"{'':8} {'':8} {'':8} {summary['error_rate']:8.1%}")
+    for worker in summary.get('db_pool', []):
+        print(f"worker {worker['pid']}: {worker['checkouts']} checkouts, wait max {worker['wait']['max_seconds'] * 1000:.1f} ms, "
+              f"overflow peak {worker['overflow_peak']}, timeouts {worker['timeouts']}, "
+              f"invalidations {worker['invalidations']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""Measure application cold start and per-worker memory.
+
+    python scripts/measure_startup.py [--runs 5] [--gunicorn --workers 4 [--no-preload]] [--json]
+
+Each measurement runs in a fresh interpreter. Nothing connects to the
+database, so any DATABASE_URL with an installed driver works (default: an
+in-memory SQLite database).
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Printed as JSON by the child interpreter
+PROBE = r'''
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+with application.test_client() as client:
+    client.get('/')
+served = time.perf_counter()
+rss = 0
+with open('/proc/self/status') as status:
+    for line in status:
+        if line.startswith('VmRSS:'):
+            rss = int(line.split()[1])
+print(json.dumps({
+    'import_app': imported - started,
+    'create_app': created - imported,
+    'first_request': served - created,
+    'modules': len(sys.modules),
+    'reportlab_loaded': 'reportlab' in sys.modules,
+    'numpy_loaded': 'numpy' in sys.modules,
+    'rss_kb': rss,
+}))
+'''
+
+
+def child_env(database_url):
+    env = dict(os.environ, DATABASE_URL=database_url, PYTHONDONTWRITEBYTECODE='1')
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    return env
+
+
+def measure_process(database_url):
+    """Interpreter start to first response, in a fresh process"""
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, env=child_env(database_url),
+                            check=True, capture_output=True, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['total'] = time.perf_counter() - started
+    return result
+
+
+def memory_kb(pid):
+    """(RSS, PSS) of a process in kB; PSS splits pages shared with other workers"""
+    values = {}
+    for path, fields in ((f'/proc/{pid}/status', ('VmRSS:',)), (f'/proc/{pid}/smaps_rollup', ('Pss:',))):
+        try:
+            with open(path) as stats:
+                for line in stats:
+                    if line.startswith(fields):
+                        values[line.split(':')[0]] = int(line.split()[1])
+        except OSError:
+            pass
+    return values.get('VmRSS', 0), values.get('Pss', 0)
+
+
+def worker_pids(master_pid):
+    pids = []
+    for task in os.listdir(f'/proc/{master_pid}/task'):
+        try:
+            with open(f'/proc/{master_pid}/task/{task}/children') as children:
+                pids.extend(int(pid) for pid in children.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def measure_gunicorn(database_url, workers, preload, timeout=60):
+    """Boot gunicorn, wait until every worker answers, then sample memory"""
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    env = child_env(database_url)
+    env.update(GUNICORN_BIND=f'127.0.0.1:{port}', GUNICORN_WORKERS=str(workers),
+               GUNICORN_PRELOAD='1' if preload else '0')
+    started = time.perf_counter()
+    master = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ready = None
+        while time.perf_counter() - started < timeout:
+            if master.poll() is not None:
+                raise RuntimeError('gunicorn exited during startup')
+            try:
+                with socket.create_connection(('127.0.0.1', port), timeout=1) as connection:
+                    connection.sendall(b'GET / HTTP/1.0\r\nHost: localhost\r\n\r\n')
+                    if connection.recv(12).startswith(b'HTTP/1.'):
+                        ready = time.perf_counter() - started
+                        break
+            except OSError:
+                time.sleep(0.05)
+        if ready is None:
+            raise RuntimeError('gunicorn did not answer within the timeout')
+        while len(worker_pids(master.pid)) < workers and time.perf_counter() - started < timeout:
+            time.sleep(0.05)
+        time.sleep(0.5)
+        samples = [memory_kb(pid) for pid in worker_pids(master.pid)]
+        master_rss, master_pss = memory_kb(master.pid)
+        return {
+            'ready': ready,
+            'workers': len(samples),
+            'master_rss_kb': master_rss,
+            'worker_rss_kb': [rss for rss, _ in samples],
+            'worker_pss_kb': [pss for _, pss in samples],
+            'total_pss_kb': master_pss + sum(pss for _, pss in samples),
+        }
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters to measure (median reported)')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL', 'sqlite://'))
+    parser.add_argument('--gunicorn', action='store_true', help='also boot gunicorn and sample worker memory')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--no-preload', action='store_true', help='boot gunicorn without preload_app')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    runs = [measure_process(args.database_url) for _ in range(args.runs)]
+    results = {'process': {
+        key: statistics.median(run[key] for run in runs)
+        for key in ('total', 'import_app', 'create_app', 'first_request', 'rss_kb', 'modules')
+    }}
+    results['process']['reportlab_loaded'] = any(run['reportlab_loaded'] for run in runs)
+    results['process']['numpy_loaded'] = any(run['numpy_loaded'] for run in runs)
+    if args.gunicorn:
+        results['gunicorn'] = measure_gunicorn(args.database_url, args.workers, not args.no_preload)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    process = results['process']
+    print(f"cold start (median of {args.runs}): {process['total'] * 1000:.0f} ms")
+    print(f"  import app     {process['import_app'] * 1000:8.1f} ms")
+    print(f"  create_app()   {process['create_app'] * 1000:8.1f} ms")
+    print(f"  first request  {process['first_request'] * 1000:8.1f} ms")
+    print(f"  modules {process['modules']:.0f}, RSS {process['rss_kb'] / 1024:.1f} MB, "
+          f"reportlab {'loaded' if process['reportlab_loaded'] else 'not loaded'}, "
+          f"numpy {'loaded' if process['numpy_loaded'] else 'not loaded'}")
+    if args.gunicorn:
+        server = results['gunicorn']
+        print(f"gunicorn ({server['workers']} workers, preload {'off' if args.no_preload else 'on'}): "
+              f"ready in {server['ready'] * 1000:.0f} ms")
+        print(f"  master RSS {server['master_rss_kb'] / 1024:.1f} MB")
+        for index, (rss, pss) in enumerate(zip(server['worker_rss_kb'], server['worker_pss_kb'])):
+            print(f"  worker {index}: RSS {rss / 1024:.1f} MB, PSS {pss / 1024:.1f} MB")
+        print(f"  total PSS {server['total_pss_kb'] / 1024:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""Fill a database with synthetic users, transactions, accounts and goals.
+
+    python scripts/seed_data.py --users 1000 --transactions 100000 [--database-url URL] [--seed 1]
+
+The same --seed always produces the same data. The schema is created first
+when the database is empty (as `flask init-db` does), and the monthly
+summaries and balance snapshots are rebuilt from the seeded ledger at the
+end. Every seeded user logs in as seedNNNNN@example.com with --password.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Share of users on each plan
+PLAN_MIX = (('trial', 0.30), ('mei', 0.35), ('professional', 0.25), ('enterprise', 0.10))
+
+INCOME_CATEGORIES = ('vendas', 'servicos', 'outros')
+EXPENSE_CATEGORIES = ('marketing', 'fornecedores', 'impostos', 'despesas_gerais', 'outros')
+DESCRIPTIONS = {
+    'vendas': ('Venda balcão', 'Venda online', 'Pedido atacado'),
+    'servicos': ('Prestação de serviço', 'Consultoria', 'Manutenção'),
+    'marketing': ('Anúncios', 'Impressão de panfletos', 'Patrocínio'),
+    'fornecedores': ('Compra de mercadoria', 'Matéria-prima', 'Frete'),
+    'impostos': ('DAS MEI', 'ISS', 'Taxa municipal'),
+    'despesas_gerais': ('Aluguel', 'Energia', 'Internet', 'Telefone'),
+    'outros': ('Diversos', 'Ajuste', 'Transferência'),
+}
+# Mean of the log of the amount (R$) and its spread
+AMOUNT_LOGNORMAL = {'income': (6.5, 1.0), 'expense': (5.5, 1.2)}
+INCOME_SHARE = 0.4
+
+
+def email_for(number):
+    return f'seed{number:05d}@example.com'
+
+
+def transaction_counts(rng, users, transactions):
+    """Split transactions over users with a long tail: a few users hold most rows"""
+    weights = [rng.paretovariate(1.2) for _ in range(users)]
+    scale = transactions / sum(weights)
+    counts = [int(weight * scale) for weight in weights]
+    counts[max(range(users), key=weights.__getitem__)] += transactions - sum(counts)
+    return counts
+
+
+def transaction_rows(rng, user_id, count, local_now, days):
+    """Rows dated over the last `days`, in Brasilia time like the import path"""
+    from importer import build_transaction_row
+
+    rows = []
+    for _ in range(count):
+        transaction_type = 'income' if rng.random() < INCOME_SHARE else 'expense'
+        category = rng.choice(INCOME_CATEGORIES if transaction_type == 'income' else EXPENSE_CATEGORIES)
+        mu, sigma = AMOUNT_LOGNORMAL[transaction_type]
+        amount = Decimal(str(round(min(rng.lognormvariate(mu, sigma), 1_000_000), 2))) or Decimal('0.01')
+        local_date = local_now - timedelta(days=rng.random() * days)
+        row = build_transaction_row(local_date, rng.choice(DESCRIPTIONS[category]), amount,
+                                    transaction_type, category)
+        row['user_id'] = user_id
+        row['created_at'] = row['date']
+        rows.append(row)
+    return rows
+
+
+def account_rows(rng, user_id, now):
+    rows = []
+    for number in range(rng.randint(0, 15)):
+        account_type = rng.choices(('payable', 'receivable', 'bank'), (0.5, 0.4, 0.1))[0]
+        due_date = now + timedelta(days=rng.randint(-90, 90))
+        if due_date >= now:
+            status = 'pending'
+        else:
+            status = 'paid' if rng.random() < 0.7 else 'overdue'
+        rows.append({
+            'user_id': user_id,
+            'name': f"{'Conta a pagar' if account_type == 'payable' else 'Conta a receber'} {number + 1}",
+            'account_type': account_type,
+            'amount': Decimal(str(round(rng.lognormvariate(6.5, 1.0), 2))),
+            'due_date': due_date,
+            'status': status,
+        })
+    return rows
+
+
+def goal_rows(rng, user_id, now):
+    rows = []
+    for number in range(rng.randint(0, 4)):
+        target = Decimal(rng.choice((5000, 10000, 25000, 50000, 100000)))
+        current = (target * Decimal(str(round(rng.random() * 1.1, 2)))).quantize(Decimal('0.01'))
+        rows.append({
+            'user_id': user_id,
+            'title': f'Meta {number + 1}',
+            'target_amount': target,
+            'current_amount': min(current, target),
+            'target_date': now + timedelta(days=rng.randint(30, 720)),
+            'is_completed': current >= target,
+        })
+    return rows
+
+
+def ensure_schema(app):
+    """Create the schema on an empty database, like `flask init-db`"""
+    result = app.test_cli_runner().invoke(args=['init-db'])
+    if result.exit_code != 0:
+        raise RuntimeError(result.output or str(result.exception))
+
+
+def seed(app, users, transactions, months=24, seed_value=1, password='benchmark', batch_users=100, log=print):
+    """Insert the synthetic data set; returns (users, transactions) created"""
+    from sqlalchemy import insert
+    from app import db
+    from models import User, Transaction, Account, FinancialGoal
+    from analytics import rebuild_monthly_summaries, reconcile_balances
+    from passwords import hash_password
+    from utils import now_brasilia
+
+    ensure_schema(app)
+    rng = random.Random(seed_value)
+    counts = transaction_counts(rng, users, transactions)
+    now = datetime.utcnow().replace(microsecond=0)
+    local_now = now_brasilia().replace(tzinfo=None, microsecond=0)
+    days = months * 30
+
+    with app.app_context():
+        if User.query.filter_by(email=email_for(1)).first() is not None:
+            raise RuntimeError('The database already holds seeded users; seed a fresh database.')
+        password_hash = hash_password(password)
+
+        started = time.perf_counter()
+        created = 0
+        for first in range(0, users, batch_users):
+            batch = []
+            for number in range(first + 1, min(first + batch_users, users) + 1):
+                plan = rng.choices([plan for plan, _ in PLAN_MIX], [share for _, share in PLAN_MIX])[0]
+                user = User(
+                    username=f'seed{number:05d}',
+                    email=email_for(number),
+                    full_name=f'Usuário Sintético {number}',
+                    password_hash=password_hash,
+                    subscription_plan=plan,
+                    subscription_status='trial' if plan == 'trial' else 'active',
+                    subscription_end_date=None if plan == 'trial' else now + timedelta(days=30),
+                )
+                batch.append((user, counts[number - 1]))
+            db.session.add_all(user for user, _ in batch)
+            db.session.flush()
+
+            connection = db.session.connection()
+            transaction_batch, accounts, goals = [], [], []
+            for user, count in batch:
+                transaction_batch.extend(transaction_rows(rng, user.id, count, local_now, days))
+                accounts.extend(account_rows(rng, user.id, now))
+                goals.extend(goal_rows(rng, user.id, now))
+            if transaction_batch:
+                connection.execute(insert(Transaction), transaction_batch)
+            if accounts:
+                connection.execute(insert(Account), accounts)
+            if goals:
+                connection.execute(insert(FinancialGoal), goals)
+            db.session.commit()
+            created += len(transaction_batch)
+            log(f'{first + len(batch)}/{users} users, {created} transactions '
+                f'({time.perf_counter() - started:.1f} s)')
+
+        # The rows skipped the importer, so derive the rollups in bulk
+        rebuild_monthly_summaries()
+        reconcile_balances(fix=True)
+    return users, created
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--transactions', type=int, default=100000, help='total over all users')
+    parser.add_argument('--months', type=int, default=24, help='history spread over this many months')
+    parser.add_argument('--seed', type=int, default=1, help='random seed; same seed, same data')
+    parser.add_argument('--password', default='benchmark', help='password of every seeded user')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error('--database-url (or DATABASE_URL) is required')
+
+    # Flask-Migrate looks for migrations/ in the working directory
+    os.chdir(ROOT)
+    from app import create_app
+    app = create_app({'SQLALCHEMY_DATABASE_URI': args.database_url, 'SQL_INSTRUMENTATION': False})
+    users, transactions = seed(app, args.users, args.transactions, args.months, args.seed, args.password)
+    print(f'Seeded {users} users and {transactions} transactions.')
+
+
+if __name__ == '__main__':
+    main()
@@ -65,6 +65,7 @@ function initializeCharts() {
     
     // Load chart data and create financial chart
     loadChartData();
+    setupForecastChart();
 }
 
 // Load chart data via AJAX
@@ -168,6 +169,112 @@ function createFinancialChart(data) {
     });
 }
 
+// Cash flow forecast chart (30/60/90 days)
+let forecastChart = null;
+
+function setupForecastChart() {
+    const canvas = document.getElementById('forecastChart');
+    if (!canvas) return;
+
+    document.querySelectorAll('.forecast-horizon').forEach(button => {
+        button.addEventListener('click', () => loadForecast(parseInt(button.dataset.days, 10)));
+    });
+    loadForecast(30);
+}
+
+function loadForecast(days) {
+    const canvas = document.getElementById('forecastChart');
+    document.querySelectorAll('.forecast-horizon').forEach(button => {
+        const active = parseInt(button.dataset.days, 10) === days;
+        button.classList.toggle('bg-primary', active);
+        button.classList.toggle('text-white', active);
+    });
+
+    fetch(canvas.dataset.url + '?days=' + days)
+        .then(response => response.json())
+        .then(data => {
+            createForecastChart(canvas, data);
+            const summary = document.getElementById('forecastSummary');
+            if (summary) {
+                summary.textContent = 'Saldo projetado em ' + days + ' dias: ' +
+                    formatCurrency(data.balance[data.balance.length - 1]) +
+                    ' · Menor saldo: ' + formatCurrency(data.lowest.balance);
+            }
+        })
+        .catch(error => {
+            console.error('Error loading forecast:', error);
+            showNotification('Erro ao carregar projeção', 'error');
+        });
+}
+
+function createForecastChart(canvas, data) {
+    if (forecastChart) {
+        forecastChart.destroy();
+    }
+    forecastChart = new Chart(canvas, {
+        type: 'line',
+        data: {
+            labels: data.labels,
+            datasets: [{
+                label: 'Saldo Projetado',
+                data: data.balance,
+                borderColor: 'rgb(37, 99, 235)',
+                backgroundColor: 'rgba(37, 99, 235, 0.1)',
+                pointRadius: 0,
+                tension: 0.2,
+                fill: true
+            }]
+        },
+        options: {
+            responsive: true,
+            maintainAspectRatio: false,
+            interaction: {
+                intersect: false,
+                mode: 'index'
+            },
+            scales: {
+                y: {
+                    grid: {
+                        color: 'rgba(0, 0, 0, 0.05)'
+                    },
+                    ticks: {
+                        maxTicksLimit: 6,
+                        font: {
+                            size: 11
+                        },
+                        callback: function(value) {
+                            return formatCurrency(value);
+                        }
+                    }
+                },
+                x: {
+                    grid: {
+                        display: false
+                    },
+                    ticks: {
+                        maxTicksLimit: 10,
+                        font: {
+                            size: 11
+                        }
+                    }
+                }
+            },
+            plugins: {
+                legend: {
+                    display: false
+                },
+                tooltip: {
+                    callbacks: {
+                        label: function(context) {
+                            return context.dataset.label + ': ' + formatCurrency(context.parsed.y);
+                        }
+                    }
+                }
+            }
+        }
+    });
+}
+
 // Format currency values
 function formatCurrency(value) {
     return new Intl.NumberFormat('pt-BR', {
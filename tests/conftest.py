@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta
+import pytest
+from app import create_app, db
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Application on a fresh in-memory SQLite database"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'WTF_CSRF_ENABLED': False,
+        'RATELIMIT_ENABLED': False,
+        'SQL_INSTRUMENTATION': False,
+        'CACHE_BACKEND': 'memory',
+        'REPORT_WORKER': 'external',
+        'REPORT_STORAGE_DIR': str(tmp_path / 'reports'),
+    })
+    with app.app_context():
+        import models  # noqa: F401 - registers every table on db.metadata
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def user(app):
+    from models import User
+    user = User(username='ana', email='ana@example.com', full_name='Ana Souza',
+                subscription_plan='professional', subscription_status='active',
+                subscription_end_date=datetime.utcnow() + timedelta(days=30))
+    user.set_password('secret1')
+    db.session.add(user)
+    db.session.commit()
+    return user
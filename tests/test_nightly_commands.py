@@ -0,0 +1,27 @@
+import pytest
+from cache import MemoryCache, get_cache, user_cache_key
+from utils import now_brasilia
+
+COMMANDS = {
+    'forecast-all': lambda today: f'forecast:90:{today:%Y-%m-%d}',
+    'detect-anomalies': lambda today: f'anomalies:{today:%Y-%m}',
+}
+
+
+@pytest.mark.parametrize('command, name', COMMANDS.items())
+def test_memory_cache_is_not_warmed(app, user, command, name):
+    result = app.test_cli_runner().invoke(args=[command])
+    assert result.exit_code == 0, result.output
+    assert 'CACHE_BACKEND is not redis' in result.output
+    assert get_cache().get(user_cache_key(user, name(now_brasilia()))) is None
+
+
+@pytest.mark.parametrize('command, name', COMMANDS.items())
+def test_shared_cache_is_warmed(app, user, command, name, monkeypatch):
+    # Stand-in for redis: any backend that outlives the command
+    monkeypatch.setitem(app.config, 'CACHE_BACKEND', 'redis')
+    monkeypatch.setitem(app.extensions, 'cache', MemoryCache(100, 300))
+    result = app.test_cli_runner().invoke(args=[command])
+    assert result.exit_code == 0, result.output
+    assert 'Warning' not in result.output
+    assert get_cache().get(user_cache_key(user, name(now_brasilia()))) is not None
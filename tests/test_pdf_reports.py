@@ -0,0 +1,31 @@
+import io
+from datetime import date, datetime
+from decimal import Decimal
+from app import db
+from models import Transaction
+from pdf_reports import render_summary_pdf, render_statement_pdf
+
+
+def add_transaction(user, description, category):
+    db.session.add(Transaction(user_id=user.id, description=description, amount=Decimal('10.00'),
+                               transaction_type='expense', category=category,
+                               date=datetime(2026, 3, 10, 15, 0)))
+    db.session.commit()
+
+
+def test_summary_pdf_escapes_user_text(user):
+    user.full_name = 'Test <b>User & Co'
+    add_transaction(user, 'Compra <i>sem fim', 'a<b>c')
+
+    fileobj = io.BytesIO()
+    render_summary_pdf(user, fileobj)
+    assert fileobj.getvalue().startswith(b'%PDF')
+
+
+def test_statement_pdf_escapes_user_text(user):
+    user.full_name = 'Test <b>User & Co'
+    add_transaction(user, 'Compra <i>sem fim', 'a<b>c')
+
+    fileobj = io.BytesIO()
+    render_statement_pdf(user, date(2026, 1, 1), date(2026, 12, 31), fileobj)
+    assert fileobj.getvalue().startswith(b'%PDF')
@@ -0,0 +1,25 @@
+import pytest
+from commands import ledger_queries, explain
+
+# SQLite's EXPLAIN QUERY PLAN names the index each query searches
+EXPECTED_INDEXES = {
+    'recent transactions': 'ix_transaction_user_date',
+    'monthly income': 'ix_transaction_user_type_date',
+    'pending payables': 'ix_account_user_type_status_due',
+}
+
+
+@pytest.mark.parametrize('name, index', EXPECTED_INDEXES.items())
+def test_ledger_query_uses_index(app, user, name, index):
+    plan = '\n'.join(explain(ledger_queries(user.id)[name]))
+    assert f'USING INDEX {index}' in plan or f'USING COVERING INDEX {index}' in plan, plan
+    # The index order serves ORDER BY date, so no sort step is needed
+    assert 'TEMP B-TREE' not in plan, plan
+
+
+def test_explain_queries_command(app, user):
+    result = app.test_cli_runner().invoke(args=['explain-queries', '--user-id', str(user.id)])
+    assert result.exit_code == 0, result.output
+    for name, index in EXPECTED_INDEXES.items():
+        assert f'-- {name}' in result.output
+        assert index in result.output
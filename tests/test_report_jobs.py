@@ -0,0 +1,81 @@
+import os
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from models import ReportJob
+import report_jobs
+from report_jobs import request_report, run_job
+
+
+@pytest.fixture
+def failing_renderer(monkeypatch):
+    def render(user, params, fileobj):
+        raise ValueError('paragraph parse error')
+    monkeypatch.setattr(report_jobs, 'report_renderers', lambda: {'summary': render})
+
+
+def failed_job(user):
+    job = request_report(user, 'summary')
+    with pytest.raises(ValueError):
+        run_job(job.id)
+    db.session.expire_all()
+    return db.session.get(ReportJob, job.id)
+
+
+def test_failed_job_is_not_requeued_before_the_retry_delay(user, failing_renderer):
+    job = failed_job(user)
+    assert job.status == 'failed'
+    assert request_report(user, 'summary').status == 'failed'
+
+
+def test_failed_job_is_requeued_after_the_retry_delay(app, user, failing_renderer):
+    job = failed_job(user)
+    job.finished_at = datetime.utcnow() - timedelta(seconds=app.config['REPORT_RETRY_DELAY'] + 1)
+    db.session.commit()
+    assert request_report(user, 'summary').status == 'queued'
+
+
+def test_failed_job_is_requeued_on_explicit_retry(user, failing_renderer):
+    failed_job(user)
+    job = request_report(user, 'summary', retry=True)
+    assert job.status == 'queued'
+    assert job.error is None
+
+
+def test_export_shows_the_failure(app, user, failing_renderer):
+    failed_job(user)
+    client = app.test_client()
+    client.post('/auth/login', data={'email': 'ana@example.com', 'password': 'secret1'})
+
+    response = client.get('/reports/export-pdf', follow_redirects=True)
+    assert 'Não foi possível gerar seu relatório PDF' in response.get_data(as_text=True)
+    assert ReportJob.query.one().status == 'failed'
+
+
+def test_superseded_attempt_does_not_finish_the_job(app, user, monkeypatch):
+    job_id = request_report(user, 'summary').id
+
+    def render(user, params, fileobj):
+        # The job times out mid-render and a second attempt claims it
+        db.session.execute(ReportJob.__table__.update().where(ReportJob.id == job_id)
+                           .values(status='queued', started_at=datetime.utcnow() - timedelta(hours=1)))
+        db.session.commit()
+        assert report_jobs.claim_job(job_id) is not None
+        fileobj.write(b'%PDF-stale')
+    monkeypatch.setattr(report_jobs, 'report_renderers', lambda: {'summary': render})
+
+    run_job(job_id)
+    db.session.expire_all()
+    job = db.session.get(ReportJob, job_id)
+    assert job.status == 'running'
+    assert job.file_path is None
+    assert os.listdir(app.config['REPORT_STORAGE_DIR']) == []
+
+
+def test_attempts_render_to_their_own_files(app, user):
+    job = request_report(user, 'summary')
+    run_job(job.id)
+    db.session.expire_all()
+    job = db.session.get(ReportJob, job.id)
+    assert job.status == 'done'
+    assert os.listdir(app.config['REPORT_STORAGE_DIR']) == [os.path.basename(job.file_path)]
@@ -0,0 +1,94 @@
+from uuid import uuid4
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from app import db
+from cache import get_cache
+from models import User, mark_users_changed
+
+# Cached columns; the password hash never leaves the database and is loaded
+# on demand (only login and password changes need it)
+USER_CACHE_EXCLUDED = ('password_hash',)
+
+# Version tokens outlive any cached row, so a row is never read after its
+# token was replaced
+USER_VERSION_TTL = 24 * 3600
+
+
+def _version_key(user_id):
+    return f'user-version:{user_id}'
+
+
+def _row_key(user_id, version):
+    return f'user-row:{user_id}:{version}'
+
+
+def _snapshot(user):
+    return {
+        attr.key: getattr(user, attr.key)
+        for attr in inspect(User).column_attrs
+        if attr.key not in USER_CACHE_EXCLUDED
+    }
+
+
+def load_user_cached(user_id):
+    """Load a User for Flask-Login without a query while its cached row is fresh.
+
+    Rows are cached for USER_CACHE_TTL seconds under a per-user version token.
+    Only a cache shared by every worker (CACHE_BACKEND=redis) sees the
+    invalidations, so the cache is off by default with the memory backend.
+    Invalidation replaces the token instead of deleting the row, so a request
+    that read the database before a concurrent commit can only store its copy
+    under the old token, where it is never read again. The returned instance
+    is merged into the session without loading, so views can still modify and
+    commit it. Subscription and trial checks compare the cached dates with the
+    current time, so an expiring plan is noticed without invalidation.
+    """
+    ttl = current_app.config['USER_CACHE_TTL']
+    if not ttl:
+        return db.session.get(User, user_id)
+
+    cache = get_cache()
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = uuid4().hex
+        cache.set(_version_key(user_id), version, USER_VERSION_TTL)
+
+    values = cache.get(_row_key(user_id, version))
+    if values is None:
+        user = db.session.get(User, user_id)
+        if user is not None:
+            cache.set(_row_key(user_id, version), _snapshot(user), ttl)
+        return user
+
+    user = User(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def invalidate_users(user_ids):
+    """Drop the cached rows of these users, in every process sharing the cache"""
+    cache = get_cache()
+    for user_id in user_ids:
+        cache.set(_version_key(user_id), uuid4().hex, USER_VERSION_TTL)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_users(session, flush_context):
+    # Profile, plan and subscription changes go through the ORM
+    changed = {obj.id for obj in session.dirty if isinstance(obj, User)}
+    changed.update(obj.id for obj in session.deleted if isinstance(obj, User))
+    if changed:
+        mark_users_changed(session, changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    user_ids = session.info.pop('changed_user_ids', None)
+    if user_ids and has_app_context():
+        invalidate_users(user_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changed_users(session):
+    session.info.pop('changed_user_ids', None)
@@ -1,9 +1,12 @@
 from datetime import datetime
-from functools import wraps
+from functools import wraps, lru_cache
 from flask import redirect, url_for, flash
 from flask_login import current_user
 import pytz
 
+LOCAL_TIMEZONE = 'America/Sao_Paulo'
+BRASILIA_TZ = pytz.timezone(LOCAL_TIMEZONE)
+
 def subscription_required(f):
     """Decorator to check if user has active subscription"""
     @wraps(f)
@@ -35,27 +38,55 @@ def get_trial_days_remaining(user):
 
 def get_brasilia_timezone():
     """Get Brasilia timezone"""
-    return pytz.timezone('America/Sao_Paulo')
+    return BRASILIA_TZ
 
 def now_brasilia():
     """Get current datetime in Brasilia timezone"""
-    brasilia_tz = get_brasilia_timezone()
-    return datetime.now(brasilia_tz)
+    return datetime.now(BRASILIA_TZ)
+
+@lru_cache(maxsize=8192)
+def _brasilia_offset(utc_hour):
+    """(utcoffset, tzinfo) in effect during a UTC hour; transitions fall on the hour"""
+    local = pytz.utc.localize(utc_hour).astimezone(BRASILIA_TZ)
+    return local.utcoffset(), local.tzinfo
+
+@lru_cache(maxsize=1)
+def brasilia_offset_transitions():
+    """(utc_start, offset_seconds) of each UTC offset period in Brasilia, oldest first.
+
+    Taken from the same pytz zone data as utc_to_brasilia, including the
+    daylight saving periods Brazil observed until 2019.
+    """
+    periods = []
+    for start, (offset, _, _) in zip(BRASILIA_TZ._utc_transition_times, BRASILIA_TZ._transition_info):
+        seconds = int(offset.total_seconds())
+        if not periods or periods[-1][1] != seconds:
+            periods.append((start, seconds))
+    return periods
 
 def utc_to_brasilia(utc_dt):
     """Convert UTC datetime to Brasilia timezone"""
     if utc_dt is None:
         return None
-    if utc_dt.tzinfo is None:
-        utc_dt = pytz.utc.localize(utc_dt)
-    brasilia_tz = get_brasilia_timezone()
-    return utc_dt.astimezone(brasilia_tz)
+    if utc_dt.tzinfo is not None:
+        utc_dt = utc_dt.astimezone(pytz.utc).replace(tzinfo=None)
+    offset, tzinfo = _brasilia_offset(utc_dt.replace(minute=0, second=0, microsecond=0))
+    return (utc_dt + offset).replace(tzinfo=tzinfo)
+
+def utc_to_brasilia_many(values):
+    """Convert a list of UTC datetimes to Brasilia timezone (None stays None)"""
+    return [utc_to_brasilia(value) for value in values]
+
+def brasilia_date(utc_dt, date_format='%d/%m/%Y', default='-'):
+    """Template filter: format a UTC datetime as a Brasilia local date"""
+    if utc_dt is None:
+        return default
+    return utc_to_brasilia(utc_dt).strftime(date_format)
 
 def brasilia_to_utc(brasilia_dt):
     """Convert Brasilia datetime to UTC"""
     if brasilia_dt is None:
         return None
-    brasilia_tz = get_brasilia_timezone()
     if brasilia_dt.tzinfo is None:
-        brasilia_dt = brasilia_tz.localize(brasilia_dt)
+        brasilia_dt = BRASILIA_TZ.localize(brasilia_dt)
     return brasilia_dt.astimezone(pytz.utc).replace(tzinfo=None)